@@ -11,14 +11,14 @@ fi
 
 # this section contains the top-level experiment functions for each parser,
 # they will create tsv files for the parse time of each sentence in
-# <RESULTS>/<parser>-<corpus>-time-(mean|median).tsv and discodop's output for the accuracy in
-# <RESULTS>/<parser>-<corpus>-scores.txt
+# <RESULTS>/<parser>-<corpus>-time-(mean|median).tsv and the scores of $SCORER for the accuracy in
+# <RESULTS>/<parser>-<corpus>-scores.txt (<RESULTS>/<parser>-<corpus>-scores.txt.partial if an experiment fails)
 
 # IN:
 # - PARAMETERS: $1 – corpus file
 # - FILES: $1
 # OUT:
-# - FILES: $TMP/<basename of $1>/results/rparse-(times.tsv|predictions.export),
+# - FILES: $TMP/<basename of $1>/results/rparse-(times.tsv|predictions(-(1|…|9))?.export|gold.export|counts-(1|…|9).tsv),
 #          $RESULTS/rparse-<basename of $1>-(scores|times-(mean|median)).tsv
 function _rparse_ {
     corpus=`basename $1`
@@ -27,18 +27,21 @@ function _rparse_ {
     assert_tfcv_rparse_files "$corpus"
 
     echo -e "len\ttime\tsuccess" >> "$TMP/$corpus/results/rparse-times.tsv"
+    begin_fold_evaluation "$RESULTS/rparse-$corpus-scores.txt" "$TMP/$corpus/results/rparse"
     for (( fold=1; fold<=$MAX_EVAL_FOLD; fold++ )); do
         echo "Processing fold $fold/$MAX_EVAL_FOLD... "
+        # the predictions are written by a pipeline instead of a process substitution, such that they are complete
+        # when they are evaluated
         $RPARSE -doParse -test "$TMP/$corpus/splits/test-$fold.export" -testFormat export -readModel "$TMP/$corpus/grammars/rparse-train-$fold" -timeout "$RPARSE_TIMEOUT" \
-             > >($PYTHON $SCRIPTS/fill_sentence_id.py "$TMP/$corpus/splits/test-$fold.sent" | $PYTHON $SCRIPTS/fill_noparses.py "$TMP/$corpus/splits/test-$fold.sent" >> "$TMP/$corpus/results/rparse-predictions.export")  \
             2> >($PYTHON $SCRIPTS/parse_rparse_output.py >> "$TMP/$corpus/results/rparse-times.tsv") \
-            || fail_and_cleanup "$corpus/results/rparse-predictions.export" "$corpus/results/rparse-times.tsv"
+             | $PYTHON $SCRIPTS/fill_sentence_id.py "$TMP/$corpus/splits/test-$fold.sent" | $PYTHON $SCRIPTS/fill_noparses.py "$TMP/$corpus/splits/test-$fold.sent" > "$TMP/$corpus/results/rparse-predictions-$fold.export" \
+            && (( ${PIPESTATUS[0]} == 0 )) \
+            || fail_and_cleanup "$corpus/results/rparse-predictions-$fold.export" "$corpus/results/rparse-times.tsv"
+        evaluate_fold "$corpus" "$fold" "$TMP/$corpus/results/rparse-predictions-$fold.export"
         echo "done."
     done
 
-    $DISCO eval "$TMP/$corpus/splits/test-1-9.export" "$TMP/$corpus/results/rparse-predictions.export" "$DISCODOP_EVAL" \
-         > "$RESULTS/rparse-$corpus-scores.txt" \
-        || fail_and_cleanup
+    merge_fold_scores || fail_and_cleanup
 
     $PYTHON $SCRIPTS/averages.py --group=len --mean=time < "$TMP/$corpus/results/rparse-times.tsv" > "$RESULTS/rparse-$corpus-times-mean.tsv" \
         || fail_and_cleanup
@@ -50,7 +53,7 @@ function _rparse_ {
 # - PARAMETERS: $1 – corpus file
 # - FILES: $1
 # OUT:
-# - FILES: $TMP/<basename of $1>/results/gf-(times.tsv|predictions.export),
+# - FILES: $TMP/<basename of $1>/results/gf-(times.tsv|predictions(-(1|…|9))?.export|gold.export|counts-(1|…|9).tsv),
 #          $RESULTS/gf-<basename of $1>-(scores|times-(mean|median)).tsv
 function _gf_ {
     corpus=`basename $1`
@@ -59,19 +62,21 @@ function _gf_ {
     assert_tfcv_gf_files "$corpus"
 
     echo -e "len\ttime\tsuccess" >> "$TMP/$corpus/results/gf-times.tsv"
+    begin_fold_evaluation "$RESULTS/gf-$corpus-scores.txt" "$TMP/$corpus/results/gf"
     for (( fold=1; fold<=$MAX_EVAL_FOLD; fold++ )); do
         echo "Processing fold $fold/$MAX_EVAL_FOLD... "
-        gf_with_timeout "$TMP/$corpus/grammars/gf-$fold/grammargfabstract.pgf" "$TMP/$corpus/splits/test-$fold-gf.sent" \
-              | $PYTHON $SCRIPTS/parse_gf_output.py "$TMP/$corpus/splits/test-$fold.sent" \
-              > >($PYTHON $SCRIPTS/gf-escapes-rev.py >> "$TMP/$corpus/results/gf-predictions.export") \
+        $PYTHON $SCRIPTS/gf_parse.py "$TMP/$corpus/grammars/gf-$fold/grammargfabstract.pgf" "$TMP/$corpus/splits/test-$fold-gf.sent" \
+                --gf="$GF" --timeout="$GF_TIMEOUT" --workers="$GF_WORKERS" --sentences="$TMP/$corpus/splits/test-$fold.sent" \
+              > >($PYTHON $SCRIPTS/gf-escapes-rev.py > "$TMP/$corpus/results/gf-predictions-$fold.export") \
             2>> "$TMP/$corpus/results/gf-times.tsv" \
-             || fail_and_cleanup "results/gf-predictions.export" "results/gf-times.tsv"
+             || fail_and_cleanup "results/gf-predictions-$fold.export" "results/gf-times.tsv"
+        # wait until the process substitution has written all predictions
+        wait $!
+        evaluate_fold "$corpus" "$fold" "$TMP/$corpus/results/gf-predictions-$fold.export"
         echo "done."
     done
 
-    $DISCO eval "$TMP/$corpus/splits/test-1-9.export" "$TMP/$corpus/results/gf-predictions.export" "$DISCODOP_EVAL" \
-         > "$RESULTS/gf-$corpus-scores.txt" \
-        || fail_and_cleanup
+    merge_fold_scores || fail_and_cleanup
 
     $PYTHON $SCRIPTS/averages.py --group=len --mean=time < "$TMP/$corpus/results/gf-times.tsv" > "$RESULTS/gf-$corpus-times-mean.tsv" \
         || fail_and_cleanup
@@ -83,7 +88,7 @@ function _gf_ {
 # - PARAMETERS: $1 – corpus file, $2 – pipeline name (ctf|lcfrs|dop)
 # - FILES: $1, templates/discodop-$2.prm
 # OUT:
-# - FILES: $TMP/<basename of $1>/results/discodop-$2-(times.tsv|predictions.export),
+# - FILES: $TMP/<basename of $1>/results/discodop-$2-(times.tsv|predictions(-(1|…|9))?.export|gold.export|counts-(1|…|9).tsv),
 #          $RESULTS/discodop-$2-<basename of $1>-(scores|times-(mean|median)).tsv
 function _discodop_ {
     if ! ( (( $# == 2 )) && [[ "$2" =~ ^(dop|ctf|lcfrs)$ ]] ); then
@@ -102,6 +107,7 @@ function _discodop_ {
     fi
 
     echo -e "sentid\tlen\telapsedtime" > "$TMP/$corpus/results/discodop-$2-times.tsv"
+    begin_fold_evaluation "$RESULTS/discodop-$2-$corpus-scores.txt" "$TMP/$corpus/results/discodop-$2"
     for (( fold=1; fold<=$MAX_EVAL_FOLD; fold++ )); do
         echo "Processing fold $fold/$MAX_EVAL_FOLD... "
         $DISCO runexp "$TMP/$corpus/grammars/discodop-$2-$fold.prm" &> /dev/null \
@@ -109,15 +115,14 @@ function _discodop_ {
 
         $PYTHON $SCRIPTS/averages.py --group=sentid --mean=len --sum=elapsedtime < "$TMP/$corpus/grammars/discodop-$2-$fold/stats.tsv" \
             | tail -n+2 >> "$TMP/$corpus/results/discodop-$2-times.tsv"
-        cat "$TMP/$corpus/grammars/discodop-$2-$fold/$prediction_filename" >> "$TMP/$corpus/results/discodop-$2-predictions.export"
+        cp "$TMP/$corpus/grammars/discodop-$2-$fold/$prediction_filename" "$TMP/$corpus/results/discodop-$2-predictions-$fold.export"
         $TRASH "$TMP/$corpus/grammars/discodop-$2-$fold/"
+        evaluate_fold "$corpus" "$fold" "$TMP/$corpus/results/discodop-$2-predictions-$fold.export"
 
         echo "done."
     done
 
-    $DISCO eval "$TMP/$corpus/splits/test-1-9.export" "$TMP/$corpus/results/discodop-$2-predictions.export" "$DISCODOP_EVAL" \
-         > "$RESULTS/discodop-$2-$corpus-scores.txt" \
-        || fail_and_cleanup
+    merge_fold_scores || fail_and_cleanup
 
     $PYTHON $SCRIPTS/averages.py --group=len --mean=elapsedtime < "$TMP/$corpus/results/discodop-$2-times.tsv" > "$RESULTS/discodop-$2-$corpus-times-mean.tsv" \
         || fail_and_cleanup
@@ -129,7 +134,7 @@ function _discodop_ {
 # - PARAMETERS: $1 – corpus file, $2 – grammar extraction mechanism (vanda|discodop)
 # - FILES: $1
 # OUT:
-# - FILES: $TMP/<basename of $1>/results/rustomata-$2-(times.tsv|predictions.export),
+# - FILES: $TMP/<basename of $1>/results/rustomata-$2-(times.tsv|predictions(-(1|…|9))?.export|gold.export|counts-(1|…|9).tsv),
 #          $RESULTS/rustomata-$2-<basename of $1>-(scores|times-(mean|median)).tsv
 function _rustomata_ {
     if ! ( (( $# == 2 )) && [[ "$2" =~ ^(vanda|discodop)$ ]] ); then
@@ -142,23 +147,23 @@ function _rustomata_ {
     assert_tfcv_rustomata_files "$corpus" "$2"
 
     echo -e "grammarsize\tlen\ttime\tresult\tcandidates" >> "$TMP/$corpus/results/rustomata-$2-times.tsv"
+    begin_fold_evaluation "$RESULTS/rustomata-$2-$corpus-scores.txt" "$TMP/$corpus/results/rustomata-$2"
     for (( fold=1; fold<=$MAX_EVAL_FOLD; fold++ )); do
         echo "Processing fold $fold/$MAX_EVAL_FOLD... "
         $RUSTOMATA csparsing parse "$TMP/$corpus/grammars/train-$2-$fold.cs" --beam="$RUSTOMATA_D_BEAM" --candidates="$RUSTOMATA_D_CANDIDATES" --threshold="$RUSTOMATA_D_THRESHOLD" --with-pos --with-lines --debug < "$TMP/$corpus/splits/test-$fold.sent" \
             2> >(sed 's: :\t:g' | sed 's:µs:us:' >> "$TMP/$corpus/results/rustomata-$2-times.tsv") \
-             | sed 's:_[[:digit:]]::' >> "$TMP/$corpus/results/rustomata-$2-predictions.export" \
-            || fail_and_cleanup "results/rustomata-$2-times.tsv" "results/rustomata-$2-predictions.export"
+             | sed 's:_[[:digit:]]::' > "$TMP/$corpus/results/rustomata-$2-predictions-$fold.export" \
+            || fail_and_cleanup "results/rustomata-$2-times.tsv" "results/rustomata-$2-predictions-$fold.export"
+
+        if [[ "$2" =~ ^discodop$ ]]; then
+            mv "$TMP/$corpus/results/rustomata-$2-predictions-$fold.export" "$TMP/$corpus/results/rustomata-$2-predictions-$fold.export.bin"
+            $DISCO treetransforms --unbinarize "$TMP/$corpus/results/rustomata-$2-predictions-$fold.export.bin" > "$TMP/$corpus/results/rustomata-$2-predictions-$fold.export"
+        fi
+        evaluate_fold "$corpus" "$fold" "$TMP/$corpus/results/rustomata-$2-predictions-$fold.export"
         echo "done."
     done
 
-    if [[ "$2" =~ ^discodop$ ]]; then
-        mv "$TMP/$corpus/results/rustomata-$2-predictions.export" "$TMP/$corpus/results/rustomata-$2-predictions.export.bin"
-        $DISCO treetransforms --unbinarize "$TMP/$corpus/results/rustomata-$2-predictions.export.bin" > "$TMP/$corpus/results/rustomata-$2-predictions.export"
-    fi
-
-    $DISCO eval "$TMP/$corpus/splits/test-1-9.export" "$TMP/$corpus/results/rustomata-$2-predictions.export" "$DISCODOP_EVAL" \
-        >> "$RESULTS/rustomata-$2-$corpus-scores.txt" \
-        || fail_and_cleanup
+    merge_fold_scores || fail_and_cleanup
 
     $PYTHON $SCRIPTS/averages.py --group=len --mean=time < "$TMP/$corpus/results/rustomata-$2-times.tsv" >> "$RESULTS/rustomata-$2-$corpus-times-mean.tsv" \
         || fail_and_cleanup
@@ -197,7 +202,7 @@ function _rustomata_dev_ {
                 $DISCO treetransforms --unbinarize "$TMP/$corpus/results/rustomata-ofcv-$beam-$thresh-$cans-predictions.export.bin" > "$TMP/$corpus/results/rustomata-ofcv-$beam-$thresh-$cans-predictions.export"
 
                 echo -ne "$beam\t$thresh\t$cans\t" >> $RESULTS/rustomata-ofcv-$corpus-scores.tsv
-                $DISCO eval $TMP/$corpus/splits/test-0.export $TMP/$corpus/results/rustomata-ofcv-$beam-$thresh-$cans-predictions.export "$DISCODOP_EVAL" \
+                score_predictions $TMP/$corpus/splits/test-0.export $TMP/$corpus/results/rustomata-ofcv-$beam-$thresh-$cans-predictions.export \
                     | grep -oP "labeled (precision|recall|f-measure):\s+\K\d+.\d+" \
                     | awk -vRS="\n" -vORS="\t" '1' >> $RESULTS/rustomata-ofcv-$corpus-scores.tsv \
                     || fail_and_cleanup
@@ -216,32 +221,92 @@ function _rustomata_dev_ {
     done
 }
 
-# wraps `/bin/timeout` around gf to support some basic timeout implementation
+# the predictions of each fold are scored by $SCORER: with "discodop", the
+# gold trees and predictions of the parsed folds are concatenated and scored by
+# `$DISCO eval` at the end; with "evaluate", each fold is scored by
+# evaluate.py in the background while the next fold is parsed and stores its
+# counts in a separate file, which are merged at the end; in both cases, the
+# scores of the parsed folds are also stored if the experiment fails
+EVAL_SCORES=""
+EVAL_PREFIX=""
+EVAL_FOLDS=()
+EVAL_GOLD=()
+EVAL_PREDICTIONS=()
+EVAL_PIDS=()
+EVAL_COUNTS=()
+
 # IN:
-# - PARAMETERS: $1 – gf grammar file, $2 – gf script file
-# - FILES: $1, $2
+# - PARAMETERS: $1 – scores file, $2 – prefix of the result files of the parser, e.g. $TMP/<corpus>/results/rparse
 # OUT:
-# - STDOUT: gf output and output in the same form as gf if a timeout occurred
-function gf_with_timeout {
-    while read sentence || [ -n "$sentence" ]; do
-        # the following line echos a gf command pipeline which
-        # * parses the sentence,
-        # * visualizes the parse trees (prints it in dot format), and
-        # * calls a python script that takes only the first tree
-        # into grammatical framework wrapped in `timeout`.
-        sentenceoutput="$(echo "p \"$sentence\" | vp | sp -command=\"$PYTHON $SCRIPTS/take_first_gf_tree.py\"" | timeout $GF_TIMEOUT $GF $1)"
-        ec=$?                           # handle errorcode of `timeout`
-        if (( $ec == 124 )); then       # timeout
-            echo "TIMEOUT>"
-            echo "${GF_TIMEOUT}000 msec"
-        elif (( $ec != 0 )); then       # some other error
-            return $ec
-        else                            # no error, propagate output
-            echo "$sentenceoutput" | grep -P -A1 '^[^>]+>' | head -n2 | sed 's:[^>]\+>[[:space:]]*::'
-        fi
-    done <"$2"
+# - FILES: removes the counts $2-counts-*.tsv of earlier runs
+function begin_fold_evaluation {
+    EVAL_SCORES="$1"
+    EVAL_PREFIX="$2"
+    EVAL_FOLDS=()
+    EVAL_GOLD=()
+    EVAL_PREDICTIONS=()
+    EVAL_PIDS=()
+    EVAL_COUNTS=()
+    rm -f "$EVAL_PREFIX"-counts-*.tsv
 }
 
+# IN:
+# - PARAMETERS: $1 – corpus name, $2 – fold, $3 – predictions for $TMP/$1/splits/test-$2.export
+# - FILES: $TMP/$1/splits/test-$2.export, $3
+# OUT:
+# - FILES: $EVAL_PREFIX-counts-$2.tsv (if $SCORER is evaluate)
+function evaluate_fold {
+    EVAL_FOLDS+=("$2")
+    EVAL_GOLD+=("$TMP/$1/splits/test-$2.export")
+    EVAL_PREDICTIONS+=("$3")
+    if [[ "$SCORER" =~ ^evaluate$ ]]; then
+        $PYTHON $SCRIPTS/evaluate.py "$TMP/$1/splits/test-$2.export" "$3" "$DISCODOP_EVAL" --counts="$EVAL_PREFIX-counts-$2.tsv" &
+        EVAL_PIDS[$2]=$!
+    fi
+}
+
+# waits for the evaluation of all folds and stores the scores of those whose
+# evaluation succeeded (in this run)
+# IN:
+# - PARAMETERS: $1 – scores file (default: $EVAL_SCORES)
+# - FILES: the files of evaluate_fold
+# OUT:
+# - FILES: $1, $EVAL_PREFIX-(gold|predictions).export (if $SCORER is discodop)
+function merge_fold_scores {
+    local status=0
+    for fold in "${!EVAL_PIDS[@]}"; do
+        if wait ${EVAL_PIDS[$fold]}; then EVAL_COUNTS+=("$EVAL_PREFIX-counts-$fold.tsv"); else status=1; fi
+    done
+    EVAL_PIDS=()
+    # the scores of all folds are only stored if all of them were evaluated, cf. fail_and_cleanup
+    if (( status != 0 && $# == 0 )) || (( ${#EVAL_FOLDS[@]} == 0 )); then return 1; fi
+
+    if [[ "$SCORER" =~ ^evaluate$ ]]; then
+        if (( ${#EVAL_COUNTS[@]} == 0 )); then return 1; fi
+        $PYTHON $SCRIPTS/evaluate.py --merge --parameters="$DISCODOP_EVAL" "${EVAL_COUNTS[@]}" > "${1:-$EVAL_SCORES}" \
+            || status=1
+    else
+        { echo "#FORMAT 4"; for gold in "${EVAL_GOLD[@]}"; do tail -n+2 "$gold"; echo ""; done; } >| "$EVAL_PREFIX-gold.export"
+        cat "${EVAL_PREDICTIONS[@]}" >| "$EVAL_PREFIX-predictions.export"
+        $DISCO eval "$EVAL_PREFIX-gold.export" "$EVAL_PREFIX-predictions.export" "$DISCODOP_EVAL" > "${1:-$EVAL_SCORES}" \
+            || status=1
+    fi
+    return $status
+}
+
+# prints the scores of predictions for gold trees in the form of `discodop eval`, computed by $SCORER
+# IN:
+# - PARAMETERS: $1 – gold trees, $2 – predictions
+# - FILES: $1, $2
+# OUT:
+# - STDOUT: scores
+function score_predictions {
+    if [[ "$SCORER" =~ ^evaluate$ ]]; then
+        $PYTHON $SCRIPTS/evaluate.py "$1" "$2" "$DISCODOP_EVAL"
+    else
+        $DISCO eval "$1" "$2" "$DISCODOP_EVAL"
+    fi
+}
 
 # IN:
 # - PARAMETERS: $1 – corpus name
@@ -271,13 +336,6 @@ function assert_corpus_files {
     if ! [ -f "$TMP/$2/splits/test-0.export" ]; then
         $PYTHON $SCRIPTS/tfcv.py "$TMP/$2/low-punctuation.export" --out-prefix="$TMP/$2/splits" --max-length=$MAXLENGTH --fix-bos=true
     fi
-    if ! [ -f "$TMP/$2/splits/test-1-9.export" ]; then
-        echo "#FORMAT 4" > "$TMP/$2/splits/test-1-9.export"
-        for (( fold=1; fold<=$MAX_EVAL_FOLD; fold++ )); do
-            tail -n+2 "$TMP/$2/splits/test-$fold.export" >> "$TMP/$2/splits/test-1-9.export"
-            echo "" >> "$TMP/$2/splits/test-1-9.export"
-        done
-    fi
 }
 
 # IN:
@@ -380,6 +438,13 @@ function assert_tfcv_rparse_files {
 # IN:
 # - PARAMETERS: $* files or folders to remove with $TRASH before exiting
 function fail_and_cleanup {
+    # scores of the folds that were parsed until now
+    if [ -n "$EVAL_SCORES" ]; then
+        local scores="$EVAL_SCORES"
+        EVAL_SCORES=""
+        merge_fold_scores "$scores.partial" || true
+    fi
+
     for f in $@; do
         if [ -d "$TMP/$f" ] || [ -f "$TMP/$f" ]; then
             $TRASH "$TMP/$f"
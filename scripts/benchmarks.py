@@ -0,0 +1,728 @@
+# Benchmarks for the scripts in this folder. Each benchmark runs an
+# implementation and the straightforward one it replaced on the same corpus
+# and prints the running times to stdout. That both yield the same results is
+# checked by the tests in tests/, which import the former implementations
+# from here.
+
+import os
+import re
+import tempfile
+from time import perf_counter
+
+
+def timed(f, *args, **kwargs):
+    # returns the result of f and the time it took in seconds
+    start = perf_counter()
+    result = f(*args, **kwargs)
+    return (result, perf_counter() - start)
+
+
+def report(name, reference_time, time, unit=None, amount=None):
+    print("%s\treference: %.3fs\tnew: %.3fs\tspeedup: %.2f" %(name, reference_time, time, reference_time / time if time else float("inf")))
+    if unit:
+        print("%s\treference: %.0f %s/s\tnew: %.0f %s/s" %(name, amount / reference_time, unit, amount / time, unit))
+
+
+def reference_tfcv(path, prefix, max_length, post_proc):
+    # the former implementation of tfcv.py that holds the corpus in memory
+    # and post-processes each tree once per fold
+    from tfcv import ten_folds, tokens, word_pos
+    corpus_sep_pattern = re.compile(r"#BOS(?:(?!#EOS).+\n)+\#EOS\s\d+")
+    id_pattern = re.compile(r"^#BOS (\d+)")
+    format_pattern = re.compile(r"#FORMAT (\d)")
+
+    with open(path) as corpus_file:
+        file_contents = corpus_file.read()
+        form = format_pattern.search(file_contents).group(1)
+        trees = corpus_sep_pattern.findall(file_contents)
+
+        sub_corpora = [[trees[index] for index in range(first, last +1)] for (first, last) in ten_folds(len(trees))]
+
+        for (fold, test) in enumerate(sub_corpora):
+            train = [post_proc(tree) for (tfold, sub_corpus) in enumerate(sub_corpora) if tfold != fold for tree in sub_corpus]
+            test = [post_proc(tree) for tree in test]
+
+            with open("%strain-%d.export" %(prefix, fold), "w") as trainfile:
+                trainfile.write("#FORMAT {}\n".format(form) + "\n".join([tree for tree in train]))
+            with open("%stest-%d.export" %(prefix, fold), "w") as testfile:
+                testfile.write("#FORMAT {}\n".format(form) + "\n".join([testtree for testtree in test if len(list(tokens(testtree))) <= max_length]))
+            with open("%strain-%d.sent" %(prefix, fold), "w") as trainsents:
+                trainsents.write(
+                    "\n".join([id_pattern.search(tree).group(1) + "\t" + " ".join(["/".join(wp) for wp in word_pos(tree, form)]) for tree in train])
+                )
+            with open("%stest-%d.sent" %(prefix, fold), "w") as testsents:
+                testsents.write(
+                    "\n".join([id_pattern.search(tree).group(1)+ "\t" + " ".join(["/".join(wp) for wp in word_pos(tree, form)]) for tree in test if len(list(tokens(tree))) <= max_length])
+                )
+
+
+def bench_tfcv(corpus, max_length="20"):
+    # compares the ten-fold split of an export corpus
+    from tfcv import count_trees, export_blocks, fix_bos, split_corpus
+    max_length = int(max_length)
+
+    def tfcv(prefix):
+        with open(corpus) as corpus_file:
+            n_trees = count_trees(corpus_file)
+            corpus_file.seek(0)
+            split_corpus(export_blocks(corpus_file), n_trees, "4", prefix, max_length, fix_bos)
+
+    with tempfile.TemporaryDirectory() as reference_dir, tempfile.TemporaryDirectory() as new_dir:
+        (_, reference_time) = timed(reference_tfcv, corpus, reference_dir + "/", max_length, fix_bos)
+        (_, time) = timed(tfcv, new_dir + "/")
+    report("tfcv", reference_time, time)
+
+
+def bench_negra(corpus, mode="STANDARD", secedge="false"):
+    # compares the regular expression based parser of export files with the
+    # hand-written one
+    from panda.corpus_index import SentenceIndex
+    from panda.negra_parse import sentence_names_to_hybridtrees, sentence_names_to_hybridtrees_fast
+    secedge = secedge in ["yes", "true", "True", "on"]
+    with SentenceIndex(corpus) as index:
+        names = set(index.names())
+    with open(corpus, "rb") as corpus_file:
+        lines = sum(1 for _ in corpus_file)
+    options = { "mode": mode, "secedge": secedge, "disconnect_punctuation": not secedge }
+
+    (reference, reference_time) = timed(sentence_names_to_hybridtrees, names, corpus, **options)
+    (_, time) = timed(sentence_names_to_hybridtrees_fast, names, corpus, **options)
+    report("negra", reference_time, time, "lines", lines)
+
+
+def bench_negra_subset(corpus, n="100", mode="STANDARD"):
+    # compares the extraction of n sentences (given as a list) from a corpus,
+    # with and without an offset index
+    from panda.corpus_index import SentenceIndex
+    from panda.negra_parse import sentence_names_to_hybridtrees, sentence_names_to_hybridtrees_fast
+    with SentenceIndex(corpus) as index:
+        all_names = index.names()
+    names = all_names[::max(1, len(all_names) // int(n))][:int(n)]
+
+    (_, reference_time) = timed(sentence_names_to_hybridtrees, names, corpus, mode=mode)
+    for use_index in [False, True]:
+        (_, time) = timed(sentence_names_to_hybridtrees_fast, names, corpus, mode=mode, use_index=use_index)
+        report("negra-subset (%s index)" %("with" if use_index else "without"), reference_time, time)
+
+
+def bench_negra_parallel(corpus, workers="0", mode="STANDARD"):
+    # compares loading a whole corpus with the regular expression based
+    # parser and with a pool of processes
+    from panda.corpus_index import SentenceIndex
+    from panda.negra_parse import sentence_names_to_hybridtrees, sentence_names_to_hybridtrees_parallel
+    with SentenceIndex(corpus) as index:
+        names = set(index.names())
+    with open(corpus, "rb") as corpus_file:
+        lines = sum(1 for _ in corpus_file)
+
+    (_, reference_time) = timed(sentence_names_to_hybridtrees, names, corpus, mode=mode)
+    (trees, time) = timed(sentence_names_to_hybridtrees_parallel, None, corpus, mode=mode, workers=int(workers) or None)
+    # the trees are rebuilt on first access
+    (_, access_time) = timed(list, trees)
+    report("negra-parallel", reference_time, time, "lines", lines)
+    report("negra-parallel (all trees)", reference_time, time + access_time, "lines", lines)
+
+
+def bench_negra_cache(corpus, mode="STANDARD"):
+    # compares loading a whole corpus with the regular expression based
+    # parser and from the binary cache
+    from panda.corpus_index import SentenceIndex
+    from panda.negra_parse import cached_packed_corpus, sentence_names_to_hybridtrees, \
+        sentence_names_to_hybridtrees_cached
+    with SentenceIndex(corpus) as index:
+        names = set(index.names())
+
+    (_, reference_time) = timed(sentence_names_to_hybridtrees, names, corpus, mode=mode)
+    with tempfile.TemporaryDirectory() as cache_dir:
+        (_, miss_time) = timed(sentence_names_to_hybridtrees_cached, None, corpus, mode=mode, cache_dir=cache_dir)
+        (_, time) = timed(sentence_names_to_hybridtrees_cached, None, corpus, mode=mode, cache_dir=cache_dir)
+        (_, view_time) = timed(cached_packed_corpus, corpus, mode=mode, cache_dir=cache_dir)
+    report("negra-cache (miss)", reference_time, miss_time)
+    report("negra-cache (hit)", reference_time, time)
+    report("negra-cache (arrays)", reference_time, view_time)
+
+
+def reference_export(trees):
+    # the former serialization of trees in export format with quadratic id
+    # assignment and list membership tests
+    from panda.general_hybrid_tree import HybridDag
+    from panda.negra_parse import generate_ids_for_inner_nodes_dag
+
+    def generate_ids(tree, node_id, idNum):
+        count = 500 + len([n for n in tree.nodes() if n not in tree.full_yield()])
+        if len(idNum) != 0:
+            count = min(idNum.values())
+        if node_id not in tree.id_yield():
+            idNum[node_id] = count - 1
+        for child in tree.children(node_id):
+            generate_ids(tree, child, idNum)
+
+    def lines(tree, idNum):
+        lines = []
+        for leaf in tree.full_yield():
+            token = tree.node_token(leaf)
+            line = [token.form(), token.pos(), "--", token.edge()]
+            if leaf in tree.id_yield() and leaf not in tree.root:
+                line.append(str(idNum[tree.parent(leaf)]))
+            else:
+                line.append("0")
+            if isinstance(tree, HybridDag):
+                for p in tree.sec_parents(leaf):
+                    line.append(token.edge())
+                    line.append(str(idNum[p]))
+            lines.append("\t".join(line))
+        category_lines = []
+        for node in [n for n in tree.nodes() if n not in tree.full_yield()]:
+            token = tree.node_token(node)
+            line = ["#" + str(idNum[node]), str(token.category()), "--", token.edge()]
+            line.append("0" if node in tree.root else str(idNum[tree.parent(node)]))
+            if isinstance(tree, HybridDag):
+                for p in tree.sec_parents(node):
+                    line.append(token.edge())
+                    line.append(str(idNum[p]))
+            category_lines.append(line)
+        for line in sorted(category_lines, key=lambda l: l[0]):
+            lines.append("\t".join(line))
+        return lines
+
+    blocks = []
+    for tree in trees:
+        idNum = {}
+        if isinstance(tree, HybridDag):
+            generate_ids_for_inner_nodes_dag(tree, tree.topological_order(), idNum)
+        else:
+            for root in tree.root:
+                generate_ids(tree, root, idNum)
+        blocks.append("\n".join(lines(tree, idNum)) + "\n")
+    return "".join(blocks)
+
+
+def bench_export(corpus, mode="STANDARD", secedge="false"):
+    # compares the serialization of all trees of a corpus in export format
+    # (without #BOS and #EOS lines)
+    import io
+    from panda.negra_parse import sentence_names_to_hybridtrees_fast, write_hybridtree_to_negra
+    secedge = secedge in ["yes", "true", "True", "on"]
+    trees = sentence_names_to_hybridtrees_fast(None, corpus, mode=mode, secedge=secedge, disconnect_punctuation=not secedge)
+
+    def export(trees):
+        out = io.StringIO()
+        for tree in trees:
+            write_hybridtree_to_negra(tree, out)
+        return out.getvalue()
+
+    (_, reference_time) = timed(reference_export, trees)
+    (_, time) = timed(export, trees)
+    report("export", reference_time, time, "trees", len(trees))
+
+
+def bench_export_stream(corpus, mode="STANDARD"):
+    # compares loading a corpus and writing it in export format as one list of
+    # lines and as a stream of trees; prints running times and peak memory
+    import tracemalloc
+    from panda.negra_parse import sentence_names_to_hybridtrees_fast, sentence_names_to_hybridtrees_iter, \
+        serialize_hybridtrees_to_negra, write_hybridtrees_to_negra
+
+    def reference(path):
+        trees = sentence_names_to_hybridtrees_fast(None, corpus, mode=mode)
+        lines = serialize_hybridtrees_to_negra(trees, 1, float("inf"))
+        with open(path, "w") as out:
+            out.write("".join(line if line.endswith("\n") else line + "\n" for line in lines))
+
+    def stream(path):
+        with open(path, "wb") as out:
+            write_hybridtrees_to_negra(sentence_names_to_hybridtrees_iter(None, corpus, mode=mode), out)
+
+    with tempfile.TemporaryDirectory() as reference_dir, tempfile.TemporaryDirectory() as new_dir:
+        (_, reference_time) = timed(reference, reference_dir + "/corpus.export")
+        (_, time) = timed(stream, new_dir + "/corpus.export")
+        peaks = []
+        for f in [reference, stream]:
+            tracemalloc.start()
+            f(new_dir + "/corpus.export")
+            peaks.append(tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+    report("export-stream", reference_time, time)
+    print("export-stream\treference: %.1f MiB peak\tnew: %.1f MiB peak" %(peaks[0] / 2**20, peaks[1] / 2**20))
+
+
+def bench_compact_tree(corpus, mode="STANDARD"):
+    # compares the memory per tree and the time to extract spans, fan-out and
+    # gap degree of all trees with dict-based and array-based trees
+    import gc
+    import tracemalloc
+    from panda.compact_tree import compact_trees
+    from panda.negra_parse import sentence_names_to_hybridtrees_fast
+
+    def traverse(trees):
+        return [(tree.labelled_spans(), tree.max_n_spans(), tree.n_gaps(), tree.fringe(tree.virtual_root)) for tree in trees]
+
+    gc.collect()
+    tracemalloc.start()
+    trees = sentence_names_to_hybridtrees_fast(None, corpus, mode=mode)
+    gc.collect()
+    reference_memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    tracemalloc.start()
+    compact = compact_trees(trees)
+    gc.collect()
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    (_, reference_time) = timed(traverse, trees)
+    (_, time) = timed(traverse, compact)
+    report("compact-tree", reference_time, time, "trees", len(trees))
+    print("compact-tree\treference: %.0f bytes/tree\tnew: %.0f bytes/tree" %(reference_memory / len(trees), memory / len(trees)))
+
+
+def reference_spans(tree):
+    # the former computation of labelled spans, fan-out and gap degree that
+    # collects the fringe of each node separately
+    from panda.general_hybrid_tree import join_spans
+
+    def fringe(id):
+        y = [tree.id_yield().index(id)] if id in tree.id_yield() else []
+        for child in tree.children(id):
+            y += fringe(child)
+        return y
+
+    def n_gaps_below(id):
+        return len(join_spans(fringe(id))) - 1 + sum(n_gaps_below(child) for child in tree.children(id))
+
+    spans = []
+    for id in [n for n in tree.nodes() if n not in tree.full_yield()]:
+        span = [tree.node_token(id).category()]
+        for (low, high) in join_spans(fringe(id)):
+            span += [low, high]
+        if len(span) >= 3:
+            spans += [span]
+    spans = sorted(spans, key=lambda x: [tuple(x[1:]), x[0]])
+    max_n_spans = max([len(join_spans(fringe(id))) for id in tree.nodes()] or [1])
+    return (spans, max_n_spans, n_gaps_below(tree.virtual_root))
+
+
+def bench_spans(corpus, mode="STANDARD"):
+    # compares the extraction of labelled spans, fan-out and gap degree of
+    # all trees in a corpus
+    from panda.negra_parse import sentence_names_to_hybridtrees_fast
+    trees = sentence_names_to_hybridtrees_fast(None, corpus, mode=mode)
+
+    (_, reference_time) = timed(lambda: [reference_spans(tree) for tree in trees])
+    (_, time) = timed(lambda: [(tree.labelled_spans(), tree.max_n_spans(), tree.n_gaps()) for tree in trees])
+    report("spans", reference_time, time, "trees", len(trees))
+
+
+def bench_corpus_stats(corpus, mode="STANDARD"):
+    # compares the discontinuity statistics of corpus_stats.py with a loop
+    # over the nodes of each parsed tree
+    from corpus_stats import statistics
+    from panda.negra_parse import cached_packed_corpus, sentence_names_to_hybridtrees_fast
+
+    def reference():
+        columns = { "len": [], "nodes": [], "fanout": [], "gaps": [], "nonprojective": [] }
+        for tree in sentence_names_to_hybridtrees_fast(None, corpus, mode=mode):
+            (_, max_n_spans, n_gaps) = reference_spans(tree)
+            columns["len"].append(len(tree.full_yield()))
+            columns["nodes"].append(len(tree.nodes()))
+            columns["fanout"].append(max_n_spans)
+            columns["gaps"].append(n_gaps)
+            columns["nonprojective"].append(sum(1 for id in tree.nodes() if tree.n_spans(id) > 1))
+        return columns
+
+    (reference_columns, reference_time) = timed(reference)
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cached_packed_corpus(corpus, mode=mode, cache_dir=cache_dir)
+        (_, time) = timed(lambda: statistics(cached_packed_corpus(corpus, mode=mode, cache_dir=cache_dir)))
+    report("corpus-stats", reference_time, time, "trees", len(reference_columns["len"]))
+
+
+def bench_evaluate(gold, predictions=None, parameters="templates/discodop-eval.prm", n="100"):
+    # scores a prediction file n times with a new Evaluator for each file, like
+    # a call of evaluate.py, and with a single Evaluator that keeps the gold
+    # trees resident (cf. eval_parity.py for the comparison with disco-dop)
+    from evaluate import Evaluator, read_parameters
+
+    predictions = predictions or gold
+    params = read_parameters(parameters)
+    n = int(n)
+
+    def reference():
+        return [Evaluator(gold, params).score(predictions).totals() for _ in range(n)]
+
+    def resident():
+        evaluator = Evaluator(gold, params)
+        return [evaluator.score(predictions).totals() for _ in range(n)]
+
+    (_, reference_time) = timed(reference)
+    (_, time) = timed(resident)
+    report("evaluate", reference_time, time, "files", n)
+
+
+def bench_evaluate_folds(gold, predictions=None, parameters="templates/discodop-eval.prm", folds="9", workers="0"):
+    # splits the gold and prediction files into folds and compares scoring the
+    # concatenated files with scoring the folds in a pool of processes and
+    # merging their counts
+    from evaluate import Evaluator, read_parameters, score_folds
+
+    predictions = predictions or gold
+    params = read_parameters(parameters)
+    folds = int(folds)
+
+    def split(path, folder, name):
+        with open(path, encoding="utf-8") as export:
+            content = export.read()
+        header = content[:content.index("#BOS")]
+        sentences = re.findall(r"^#BOS.*?^#EOS[^\n]*\n", content, re.M | re.S)
+        paths = []
+        for fold in range(folds):
+            paths.append(os.path.join(folder, "%s-%d.export" %(name, fold)))
+            with open(paths[-1], "w", encoding="utf-8") as out:
+                out.write(header + "".join(sentences[fold::folds]))
+        return paths
+
+    with tempfile.TemporaryDirectory() as folder:
+        pairs = list(zip(split(gold, folder, "gold"), split(predictions, folder, "predictions")))
+        (_, reference_time) = timed(lambda: Evaluator(gold, params).score(predictions).totals())
+        (totals, time) = timed(lambda: score_folds(pairs, params, int(workers) or None).totals())
+    report("evaluate-folds", reference_time, time, "sentences", totals["sentences"])
+
+
+def bench_evaluate_cache(gold, predictions=None, parameters="templates/discodop-eval.prm"):
+    # compares scoring the files with looking up their counts in the cache
+    from evaluate import cached_score_file, read_parameters, score_file
+
+    predictions = predictions or gold
+    (_, reference_time) = timed(score_file, gold, predictions, read_parameters(parameters))
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cached_score_file(gold, predictions, parameters, cache_dir)
+        (_, time) = timed(cached_score_file, gold, predictions, parameters, cache_dir)
+    report("evaluate-cache", reference_time, time)
+
+
+class ReferenceConstituentTerminal(object):
+    # the former terminal tokens with an attribute dictionary per token
+    def __init__(self, form, pos, edge='--', morph=None, lemma='--'):
+        self._edge = edge
+        self.__form = form
+        self.__pos = pos
+        self._morph = [] if morph is None else morph
+        self.__lemma = lemma
+
+    def form(self):
+        return self.__form
+
+    def pos(self):
+        return self.__pos
+
+    def edge(self):
+        return self._edge
+
+    def lemma(self):
+        return self.__lemma
+
+    def morph_feats(self):
+        return self._morph
+
+    def type(self):
+        return "CONSTITUENT-TERMINAL"
+
+
+class ReferenceConstituentCategory(object):
+    # the former category tokens with an attribute dictionary per token
+    def __init__(self, category, edge='--'):
+        self.__category = category
+        self._edge = edge
+
+    def category(self):
+        return self.__category
+
+    def edge(self):
+        return self._edge
+
+    def type(self):
+        return "CONSTITUENT-CATEGORY"
+
+
+def bench_tokens(corpus, mode="STANDARD"):
+    # compares the memory of a loaded corpus with interned, slot-based tokens
+    # and with the former token classes, with new strings for each node like
+    # the former loader took from its regular expressions
+    import gc
+    import tracemalloc
+    from panda.negra_parse import sentence_names_to_hybridtrees_fast
+
+    def copy(string):
+        return string if string is None else (string + " ")[:-1]
+
+    def reference():
+        trees = sentence_names_to_hybridtrees_fast(None, corpus, mode=mode)
+        for tree in trees:
+            for node in tree.nodes():
+                t = tree.node_token(node)
+                if t.type() == "CONSTITUENT-TERMINAL":
+                    t = ReferenceConstituentTerminal(copy(t.form()), copy(t.pos()), copy(t.edge()), None,
+                                                     copy(t.lemma()))
+                else:
+                    t = ReferenceConstituentCategory(copy(t.category()), copy(t.edge()))
+                tree._id_to_token[node] = t
+        return trees
+
+    def new():
+        return sentence_names_to_hybridtrees_fast(None, corpus, mode=mode)
+
+    # the new tokens are measured first, such that the interned strings are
+    # allocated while they are traced
+    sizes = []
+    for f in [new, reference]:
+        gc.collect()
+        tracemalloc.start()
+        trees = f()
+        gc.collect()
+        sizes.insert(0, tracemalloc.get_traced_memory()[0])
+        tracemalloc.stop()
+        del trees
+    print("tokens\treference: %.1f MiB\tnew: %.1f MiB\tsaving: %.0f%%"
+          %(sizes[0] / 2**20, sizes[1] / 2**20, 100.0 * (sizes[0] - sizes[1]) / sizes[0]))
+
+
+def bench_digest(corpus, mode="STANDARD"):
+    # groups the trees of a corpus and of a second copy of it into classes of
+    # identical trees, by nested tuples of the tokens, positions and children
+    # of all nodes and by the digests of the trees
+    from panda.general_hybrid_tree import group_identical_trees
+    from panda.negra_parse import sentence_names_to_hybridtrees_fast
+
+    trees = sentence_names_to_hybridtrees_fast(None, corpus, mode=mode) \
+        + sentence_names_to_hybridtrees_fast(None, corpus, mode=mode)
+
+    def structure(tree, node):
+        token = tree.node_token(node)
+        index = tree.node_index(node) if tree.in_ordering(node) else None
+        return (token.type(), repr(token.fields()), index, tuple(structure(tree, child) for child in tree.children(node)))
+
+    def reference():
+        groups = {}
+        for (index, tree) in enumerate(trees):
+            groups.setdefault(tuple(structure(tree, root) for root in tree.root), []).append(index)
+        return sorted(groups.values())
+
+    (_, reference_time) = timed(reference)
+    for tree in trees:
+        tree._invalidate()
+    (_, time) = timed(group_identical_trees, trees)
+    report("digest", reference_time, time, "trees", len(trees))
+    # the digests are kept in the trees, e.g. for grouping them again with other trees
+    (_, cached_time) = timed(group_identical_trees, trees)
+    report("digest (cached)", reference_time, cached_time)
+
+
+def bench_topological(corpus, mode="STANDARD"):
+    # compares the topological order of the DAGs of a corpus (with secondary
+    # edges) by a loop over all nodes until nothing changes, and by Kahn's
+    # algorithm
+    from panda.negra_parse import sentence_names_to_hybridtrees_fast
+
+    dags = sentence_names_to_hybridtrees_fast(None, corpus, mode=mode, secedge=True, disconnect_punctuation=False)
+
+    def reference(dag):
+        order = []
+        added = set()
+        changed = True
+        while changed:
+            changed = False
+            for node in dag.nodes():
+                if node in added:
+                    continue
+                if all([c in added for c in dag.children(node) + dag.sec_children(node)]):
+                    added.add(node)
+                    order.append(node)
+                    changed = True
+        return order if len(added) == len(dag.nodes()) else None
+
+    (_, reference_time) = timed(lambda: [reference(dag) for dag in dags])
+    (_, time) = timed(lambda: [dag.topological_order() for dag in dags])
+    report("topological", reference_time, time, "trees", len(dags))
+
+
+def bench_json_export(corpus, mode="STANDARD"):
+    # exports the DAGs of a corpus (with secondary edges) as bihypergraphs:
+    # as one dict that is dumped at once, as JSON lines and in the binary
+    # layout of bihypergraph_file, and compares the peak memory of each
+    import json
+    import tracemalloc
+    from panda.negra_parse import sentence_names_to_hybridtrees_fast, export_corpus_to_json, \
+        write_corpus_to_json_lines, write_corpus_to_binary
+
+    class Labels:
+        def __init__(self):
+            self.index = {}
+
+        def object_index(self, label):
+            return self.index.setdefault(label, len(self.index))
+
+    class Labeling:
+        def token_tree_label(self, token):
+            return token.pos() if token.type() == "CONSTITUENT-TERMINAL" else token.category()
+
+        def token_label(self, token):
+            return token.form()
+
+    dags = sentence_names_to_hybridtrees_fast(None, corpus, mode=mode, secedge=True, disconnect_punctuation=False)
+
+    def measured(f, *args):
+        tracemalloc.start()
+        (result, time) = timed(f, *args)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return (result, time, peak)
+
+    def reference(path):
+        with open(path, "w") as out:
+            json.dump(export_corpus_to_json(dags, Labels(), Labeling()), out)
+
+    def lines(path):
+        with open(path, "w") as out:
+            write_corpus_to_json_lines(dags, Labels(), out, Labeling())
+
+    def binary(path):
+        write_corpus_to_binary(dags, Labels(), path, Labeling())
+
+    with tempfile.TemporaryDirectory() as folder:
+        paths = [os.path.join(folder, name) for name in ["corpus.json", "corpus.jsonl", "corpus.bin"]]
+        results = [measured(f, path) for (f, path) in zip([reference, lines, binary], paths)]
+        sizes = [os.path.getsize(path) for path in paths]
+
+    (_, reference_time, reference_peak) = results[0]
+    for (name, (_, time, peak), size) in zip(["json-export (lines)", "json-export (binary)"], results[1:], sizes[1:]):
+        report(name, reference_time, time, "trees", len(dags))
+        print("%s\treference: %.1f MiB peak, %.1f MiB file\tnew: %.1f MiB peak, %.1f MiB file"
+              %(name, reference_peak / 2**20, sizes[0] / 2**20, peak / 2**20, size / 2**20))
+
+
+def reference_gfdot_to_negra(s_, out):
+    # the former converter of parse_gf_output.py that builds a HybridTree,
+    # rebuilds it without the dummy part-of-speech nodes and writes it with
+    # panda's export writer
+    from panda.general_hybrid_tree import HybridTree
+    from panda.monadic_tokens import construct_constituent_token
+    from panda.negra_parse import write_hybridtree_to_negra
+
+    def remove_dummy_pos(tree):
+        ntree = HybridTree()
+        pos_idxs = dict()
+        for idx in tree.full_yield():
+            token = tree.node_token(idx)
+            ptoken = tree.node_token(tree.parent(idx))
+            pos_idxs[tree.parent(idx)] = idx
+            ntoken = construct_constituent_token(token.form(), ptoken.category(), True)
+            ntree.add_node(idx, ntoken, True)
+        for idx in tree.nodes():
+            if idx in pos_idxs:
+                ntree.add_child(tree.parent(idx), pos_idxs[idx])
+                if idx in tree.root:
+                    ntree.add_to_root(pos_idxs[idx])
+            elif idx in tree.full_yield():
+                continue
+            else:
+                ntree.add_node(idx, tree.node_token(idx), False)
+                ntree.add_child(tree.parent(idx), idx)
+                if idx in tree.root:
+                    ntree.add_to_root(idx)
+        return ntree
+
+    tree = HybridTree()
+    for line in s_:
+        match = re.search(r'(n\d+)\[label="([^\s]+)"\]', line)
+        if match:
+            (node_id, label) = match.group(1, 2)
+            if int(node_id[1:]) >= 100000:
+                tree.add_node(node_id, construct_constituent_token(form=label, pos='_', terminal=True), True)
+            else:
+                tree.add_node(node_id, construct_constituent_token(form=label, pos='_', terminal=False), False)
+            if label == 'VROOT1':
+                tree.add_to_root(node_id)
+            continue
+        match = re.search(r'^(n\d+) -- (n\d+) \[style = "(?:dashed|solid)"\]$', line)
+        if match:
+            (parent, child) = match.group(1, 2)
+            tree.add_child(parent, child)
+    tree = remove_dummy_pos(tree)
+    write_hybridtree_to_negra(tree, out)
+
+
+def bench_gf_dot(gf_output):
+    # converts the parse trees in the output of gf_parse.py for a fold
+    # (as read by parse_gf_output.py) to export format
+    from io import StringIO
+    from parse_gf_output import gfdot_to_negra
+
+    with open(gf_output) as gf_file:
+        graphs = [line.split("%;;%") for line in gf_file if line.startswith("graph {")]
+
+    def convert(f):
+        out = StringIO()
+        for graph in graphs:
+            f(graph, out)
+        return out.getvalue()
+
+    (_, reference_time) = timed(convert, reference_gfdot_to_negra)
+    (_, time) = timed(convert, gfdot_to_negra)
+    report("gf-dot", reference_time, time, "trees", len(graphs))
+
+
+def reference_gf_with_timeout(sentences, command, grammar, timeout):
+    # the former shell function gf_with_timeout of experiments.sh that starts
+    # gf once for each sentence and takes the first parse tree by
+    # take_first_gf_tree.py
+    import subprocess
+    import sys
+
+    take_first_gf_tree = os.path.join(os.path.dirname(os.path.abspath(__file__)), "take_first_gf_tree.py")
+    prompt_line = re.compile(r"^[^>]+>")
+    prompt = re.compile(r"[^>]+>\s*")
+    for sentence in sentences:
+        try:
+            gf = subprocess.run(command + [grammar], universal_newlines=True, stdout=subprocess.PIPE, timeout=float(timeout),
+                                input="p \"%s\" | vp | sp -command=\"%s %s\"\n" % (sentence, sys.executable, take_first_gf_tree))
+        except subprocess.TimeoutExpired:
+            yield ["TIMEOUT>", "%s000 msec" % timeout]
+            continue
+        lines = gf.stdout.rstrip("\n").split("\n")
+        first = next(index for (index, line) in enumerate(lines) if prompt_line.match(line))
+        yield [prompt.sub("", line, count=1) for line in lines[first:first + 2]]
+
+
+def bench_gf_parse(grammar, sentences, gf="gf -cshell", timeout="30", workers="0"):
+    # parses the sentences of a file (escaped by gf-escapes.sed) with gf, by
+    # one gf process for each sentence and by a pool of gf shells
+    import shlex
+    from gf_parse import parse_sentences
+
+    command = shlex.split(gf)
+    with open(sentences) as sentence_file:
+        sentences = [line.strip() for line in sentence_file]
+
+    (_, reference_time) = timed(lambda: list(reference_gf_with_timeout(sentences, command, grammar, timeout)))
+    (_, time) = timed(lambda: list(parse_sentences(sentences, command, grammar, float(timeout),
+                                                   int(workers) or os.cpu_count())))
+    report("gf-parse", reference_time, time, "sentences", len(sentences))
+
+
+benchmarks = { "tfcv": bench_tfcv, "negra": bench_negra, "negra-subset": bench_negra_subset,
+               "negra-parallel": bench_negra_parallel, "negra-cache": bench_negra_cache,
+               "export": bench_export, "export-stream": bench_export_stream,
+               "compact-tree": bench_compact_tree, "spans": bench_spans,
+               "corpus-stats": bench_corpus_stats, "evaluate": bench_evaluate,
+               "evaluate-folds": bench_evaluate_folds, "evaluate-cache": bench_evaluate_cache,
+               "tokens": bench_tokens, "digest": bench_digest,
+               "topological": bench_topological, "json-export": bench_json_export,
+               "gf-dot": bench_gf_dot, "gf-parse": bench_gf_parse }
+
+if __name__ == "__main__":
+    from sys import argv
+    help = """use %s <BENCHMARK> <CORPUS> [ARGUMENTS]
+              where BENCHMARK is one of
+                %s""" %(argv[0], "\n                ".join(sorted(benchmarks)))
+
+    assert len(argv) > 2 and argv[1] in benchmarks, help
+    benchmarks[argv[1]](*argv[2:])
@@ -0,0 +1,118 @@
+# Computes discontinuity statistics for each sentence of one or more corpora
+# in export format (e.g. the splits of tfcv.py) and prints them as a table
+# with the columns
+#   sentid          sentence id,
+#   len             number of tokens,
+#   nodes           number of nodes (tokens and inner nodes),
+#   fanout          maximal number of spans of a node (cf. HybridTree.max_n_spans),
+#   gaps            total number of gaps (cf. HybridTree.n_gaps), and
+#   nonprojective   number of nodes with more than one span
+# to stdout. The table can be joined with the parse time tables on sentid.
+# The trees are processed on the flat arrays of panda's PackedCorpus. With
+# --cache=true, the corpora are loaded from (and stored in) the binary cache
+# of panda's loader in ~/.cache instead of being parsed on each call.
+
+from array import array
+
+COLUMNS = ["sentid", "len", "nodes", "fanout", "gaps", "nonprojective"]
+NONE = -1
+
+
+def n_spans(mask):
+    # number of maximal runs of ones in a bit mask
+    return bin(mask & ~(mask << 1)).count("1")
+
+
+def tree_statistics(corpus, t):
+    # returns the columns (except sentid) for the t-th tree of a PackedCorpus
+    # in one pass over its rows: the rows are visited top-down from the roots
+    # and their bit masks of positions are merged bottom-up
+    first, last = corpus.node_ptr[t], corpus.node_ptr[t + 1]
+    parent = corpus.node_parent[first:last]
+    masks = [0] * len(parent)
+    for (index, row) in enumerate(corpus.ordered[corpus.ordered_ptr[t]:corpus.ordered_ptr[t + 1]]):
+        masks[row] = 1 << index
+    children = [[] for _ in parent]
+    roots = []
+    for (row, top) in enumerate(parent):
+        if top == NONE:
+            roots.append(row)
+        else:
+            children[top].append(row)
+
+    # a node is connected to the virtual root unless it is (below) a
+    # disconnected token, i.e. a root without position
+    terminal = corpus.node_terminal[first:last]
+    connected = bytearray(len(parent))
+    for row in roots:
+        connected[row] = not (terminal[row] and not masks[row])
+    order = list(roots)
+    for row in order:
+        for child in children[row]:
+            connected[child] = connected[row]
+            order.append(child)
+    for row in reversed(order):
+        if parent[row] != NONE:
+            masks[parent[row]] |= masks[row]
+
+    spans = [n_spans(mask) for mask in masks]
+    root_mask = 0
+    for row in roots:
+        if connected[row]:
+            root_mask |= masks[row]
+    gaps = sum(s - 1 for (s, c) in zip(spans, connected) if c) + n_spans(root_mask) - 1
+    return (corpus.full_ptr[t + 1] - corpus.full_ptr[t], len(parent), max(spans, default=1), gaps,
+            sum(1 for s in spans if s > 1))
+
+
+def statistics(corpus):
+    # returns the columns (except sentid) for all trees of a PackedCorpus
+    columns = { name: array("i") for name in COLUMNS[1:] }
+    appends = [columns[name].append for name in COLUMNS[1:]]
+    for t in range(len(corpus)):
+        for (append, value) in zip(appends, tree_statistics(corpus, t)):
+            append(value)
+    return columns
+
+
+def write_table(names, columns, out, header=True):
+    if header:
+        out.write("\t".join(COLUMNS) + "\n")
+    rows = zip(names, *(columns[name] for name in COLUMNS[1:]))
+    out.writelines("\t".join(map(str, row)) + "\n" for row in rows)
+
+
+if __name__ == "__main__":
+    import re
+    from sys import argv, stdout
+    from panda.negra_parse import cached_packed_corpus, sentence_names_to_hybridtrees_fast
+    from panda.packed_corpus import pack_trees
+
+    help = """use %s <NEGRA FILE>... [OPTIONS]
+              where OPTIONS is some combination of
+                --mode=(STANDARD*|DISCO-DOP)
+                --disconnect-punctuation=(true*|false)
+                --cache=(true|false*)
+                --help""" %argv[0]
+
+    corpora = [arg for arg in argv[1:] if not arg.startswith("--")]
+    assert corpora, help
+    if "--help" in argv:
+        print(help)
+        exit(0)
+
+    options = { "mode": "STANDARD", "disconnect-punctuation": "true", "cache": "false" }
+    for arg in argv[1:]:
+        match = re.match(r"^--([^=]+)=(.*)$", arg)
+        if match and match.group(1) in options:
+            options[match.group(1)] = match.group(2)
+    disconnect = options["disconnect-punctuation"] in ["yes", "true", "True", "on"]
+    cache = options["cache"] in ["yes", "true", "True", "on"]
+
+    for (index, path) in enumerate(corpora):
+        if cache:
+            corpus = cached_packed_corpus(path, mode=options["mode"], disconnect_punctuation=disconnect)
+        else:
+            corpus = pack_trees(sentence_names_to_hybridtrees_fast(None, path, mode=options["mode"],
+                                                                   disconnect_punctuation=disconnect))
+        write_table(corpus.names(), statistics(corpus), stdout, header=(index == 0))
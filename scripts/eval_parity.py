@@ -0,0 +1,153 @@
+# Compares the scores of evaluate.py with those of `discodop eval` on the
+# folds of tfcv.py, i.e. on the gold trees <corpus dir>/splits/test-<fold>.export
+# and the predictions <corpus dir>/results/<parser>-predictions-<fold>.export
+# of each fold that was parsed (with <corpus dir> = $TMP/<corpus>), or on
+# explicitly given pairs of gold and prediction files.
+# Each pair is scored by `$DISCO eval --verbose` and by evaluate.py with the
+# given parameter file and with variants of it that switch on DISC_ONLY, lower
+# CUTOFF_LEN, add an EQ_LABEL class and turn off LABELED (cf. VARIANTS), such
+# that all parameters read by evaluate.py are exercised; DELETE_LABEL and
+# DELETE_WORD are exercised by the punctuation of the parameter file.
+# The labeled recall, precision, f-measure and exact match of both summaries
+# (up to CUTOFF_LEN and of all sentences) must be the same, and so must the
+# number of sentences and the gold, candidate and matched brackets of each
+# sentence length, which are added up from the rows of the single sentences
+# printed by `discodop eval --verbose`.
+# Every difference is printed; the exit status is 1 if there is any, so
+# SCORER="evaluate" should only be configured after this check passed for the
+# parameter file used in the experiments.
+
+import os
+import re
+import shlex
+import subprocess
+import tempfile
+from collections import defaultdict
+
+from evaluate import DEFAULT_PARAMETERS, read_parameters, score_file, summary
+
+# name and changed parameters of each variant of the parameter file; keys with
+# a list of values (e.g. EQ_LABEL) are added, all others are replaced
+VARIANTS = [("parameters", {}),
+            ("disc-only", {"DISC_ONLY": "1"}),
+            ("cutoff", {"CUTOFF_LEN": "10"}),
+            ("eq-label", {"EQ_LABEL": "NP CNP PN"}),
+            ("unlabeled", {"LABELED": "0"})]
+
+summary_pattern = re.compile(r"^(?:(?:un)?labeled )?(recall|precision|f-measure|exact match):\s+(.*)$")
+number_pattern = re.compile(r"\d+\.\d+")
+fold_pattern = re.compile(r"^test-(\d+)\.export$")
+
+
+def tfcv_folds(corpus_dir, parser):
+    # pairs of gold and prediction files of the parsed folds of a corpus
+    folds = []
+    for name in sorted(os.listdir(os.path.join(corpus_dir, "splits"))):
+        match = fold_pattern.match(name)
+        predictions = os.path.join(corpus_dir, "results", "%s-predictions-%s.export" %(parser, match.group(1))) \
+            if match else None
+        if predictions and os.path.exists(predictions):
+            folds.append((os.path.join(corpus_dir, "splits", name), predictions))
+    return folds
+
+
+def write_variant(path, changes, target):
+    # copies the parameter file to target with the changed parameters
+    with open(path, encoding="utf-8") as parameter_file:
+        lines = parameter_file.read().splitlines()
+    replaced = [key for key in changes if not isinstance(DEFAULT_PARAMETERS[key], (set, dict))]
+    lines = [line for line in lines if not line.split() or line.split()[0] not in replaced]
+    with open(target, "w", encoding="utf-8") as variant_file:
+        variant_file.write("\n".join(lines + ["%s %s" %change for change in changes.items()]) + "\n")
+
+
+def read_scores(output):
+    # the recall, precision, f-measure and exact match in a summary of
+    # `discodop eval`: one value per column (up to the cutoff length and all)
+    scores = {}
+    for line in output.splitlines():
+        match = summary_pattern.match(line.strip())
+        if match:
+            scores[match.group(1)] = number_pattern.findall(match.group(2))
+    return scores
+
+
+def read_sentence_rows(output):
+    # adds up the number of sentences and the matched, gold and candidate
+    # brackets of each sentence length from the rows of single sentences
+    # (ID, length, recall, precision, matched, gold, test, …) printed by
+    # `discodop eval --verbose`
+    rows = defaultdict(lambda: [0, 0, 0, 0])
+    for line in output.splitlines():
+        fields = line.split()
+        if len(fields) < 7 or not all(re.match(r"^\d+$", field) for field in [fields[1]] + fields[4:7]):
+            continue
+        (length, matched, gold, cand) = map(int, [fields[1]] + fields[4:7])
+        row = rows[length]
+        for (column, count) in enumerate([1, gold, cand, matched]):
+            row[column] += count
+    return dict(rows)
+
+
+def compare(gold, predictions, parameter_file, disco):
+    # the differences between `discodop eval` and evaluate.py for one pair of
+    # files and one parameter file
+    output = subprocess.run(shlex.split(disco) + ["eval", gold, predictions, parameter_file, "--verbose"],
+                            stdout=subprocess.PIPE, check=True, universal_newlines=True).stdout
+    parameters = read_parameters(parameter_file)
+    counts = score_file(gold, predictions, parameters)
+    differences = []
+
+    (expected, actual) = (read_scores(output), read_scores(summary(counts, parameters["CUTOFF_LEN"])))
+    for score in ["recall", "precision", "f-measure", "exact match"]:
+        if expected.get(score) != actual.get(score):
+            differences.append("%s: %s (discodop) != %s (evaluate.py)"
+                               %(score, expected.get(score), actual.get(score)))
+
+    expected = read_sentence_rows(output)
+    actual = { length: row[:4] for (length, row) in counts.rows.items() }
+    for length in sorted(set(expected) | set(actual)):
+        if expected.get(length) != actual.get(length):
+            differences.append("sentences, gold, cand, matched of length %d: %s (discodop) != %s (evaluate.py)"
+                               %(length, expected.get(length), actual.get(length)))
+    return differences
+
+
+if __name__ == "__main__":
+    from sys import argv
+    help = """use %s <PARAMETER FILE> --corpus-dir=<TMP>/<CORPUS> --parser=<PARSER> [OPTIONS]
+              or  %s <PARAMETER FILE> <GOLD FILE> <PREDICTIONS FILE> [<GOLD FILE> <PREDICTIONS FILE>]... [OPTIONS]
+              where OPTIONS is some combination of
+                --disco=<COMMAND>          (default: discodop)
+                --variants=(true*|false)   (also check the variants of the parameter file)""" %(argv[0], argv[0])
+
+    options = { "corpus-dir": None, "parser": None, "disco": "discodop", "variants": "true" }
+    for arg in argv[1:]:
+        match = re.match(r"^--([^=]+)=(.*)$", arg)
+        if match and match.group(1) in options:
+            options[match.group(1)] = match.group(2)
+    files = [arg for arg in argv[1:] if not arg.startswith("--")]
+
+    assert files, help
+    if options["corpus-dir"]:
+        assert options["parser"] and len(files) == 1, help
+        folds = tfcv_folds(options["corpus-dir"], options["parser"])
+    else:
+        assert len(files) >= 3 and len(files) % 2 == 1, help
+        folds = list(zip(files[1::2], files[2::2]))
+    assert folds, "there are no parsed folds to compare"
+    variants = VARIANTS if options["variants"] in ["yes", "true", "True", "on"] else VARIANTS[:1]
+
+    failed = False
+    with tempfile.TemporaryDirectory() as tmp:
+        for (name, changes) in variants:
+            parameter_file = os.path.join(tmp, name + ".prm")
+            write_variant(files[0], changes, parameter_file)
+            for (gold, predictions) in folds:
+                differences = compare(gold, predictions, parameter_file, options["disco"])
+                for difference in differences:
+                    print("%s, %s (%s): %s" %(gold, predictions, name, difference))
+                failed = failed or bool(differences)
+    if not failed:
+        print("evaluate.py and discodop eval agree on %d folds and %d parameter files" %(len(folds), len(variants)))
+    exit(1 if failed else 0)
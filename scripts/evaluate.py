@@ -0,0 +1,408 @@
+# Computes the labelled precision, recall, f-measure and exact match of parse
+# trees in export format against gold trees, like `discodop eval`, and prints
+# them in the same form followed by a breakdown for each sentence length.
+# The parameter file (e.g. templates/discodop-eval.prm) is read like disco-dop
+# does; the keys DELETE_LABEL, DELETE_LABEL_FOR_LENGTH, DELETE_WORD, EQ_LABEL,
+# EQ_WORD, LABELED, CUTOFF_LEN and DISC_ONLY are used, all others are ignored.
+# The gold trees are read only once per Evaluator, so one evaluator can score
+# many prediction files against the same gold file.
+# The export format (3 or 4) of the gold and prediction files is given by
+# --gold-format and --format; if it is omitted, it is read from the #FORMAT
+# line of the file, or else decided by the number of columns of the first
+# word.
+# The counts of a run can be stored with --counts=<FILE> instead of printing
+# the scores; the count files of disjoint sets of sentences (e.g. the folds of
+# tfcv.py) are added up with --merge, which prints the scores of all of them.
+# The counts are cached on disk, keyed by the contents of the gold, prediction
+# and parameter files, such that scoring the same files again does not run
+# the evaluator; the least recently used entries are removed if the cache
+# grows beyond --cache-size bytes.
+
+import hashlib
+import os
+import re
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+DEFAULT_PARAMETERS = { "DEBUG": 0, "MAX_ERROR": 10, "CUTOFF_LEN": 40, "LABELED": 1, "DISC_ONLY": 0,
+                       "DELETE_LABEL": set(), "DELETE_LABEL_FOR_LENGTH": set(), "DELETE_WORD": set(),
+                       "EQ_LABEL": {}, "EQ_WORD": {} }
+
+# columns of the count records of each sentence length
+COUNTS = ["sentences", "gold", "cand", "matched", "exact", "gold_disc", "cand_disc", "tags", "correct_tags"]
+
+# location and default size in bytes of the cache of counts
+SCORE_CACHE = os.path.join(os.environ.get("XDG_CACHE_HOME", "~/.cache"), "rustomata-eval", "scores")
+SCORE_CACHE_SIZE = 64 << 20
+SCORE_CACHE_VERSION = 2
+
+format_pattern = re.compile(r"^#FORMAT\s+(\d)")
+
+
+def read_parameters(path=None):
+    # reads an evaluation parameter file in EVALB format; the lists of
+    # equivalent labels (EQ_LABEL) and words (EQ_WORD) are returned as maps
+    # from each label or word to a representative of its class
+    parameters = { key: (value.copy() if isinstance(value, (set, dict)) else value)
+                   for (key, value) in DEFAULT_PARAMETERS.items() }
+    if path is None:
+        return parameters
+    with open(path, encoding="utf-8") as parameter_file:
+        for (n, line) in enumerate(parameter_file, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            fields = line.split(None, 1)
+            if len(fields) != 2:
+                raise ValueError("malformed line %d in %s: %r" %(n, path, line))
+            (key, value) = fields
+            if key not in parameters:
+                continue
+            if isinstance(parameters[key], set):
+                parameters[key].add(value)
+            elif isinstance(parameters[key], dict):
+                equivalents = value.split()
+                representative = parameters[key].get(equivalents[0], equivalents[0])
+                for equivalent in equivalents:
+                    parameters[key][equivalent] = representative
+            else:
+                parameters[key] = float(value) if "." in value else int(value)
+    return parameters
+
+
+def export_mode(path, export_format=None):
+    # returns the mode of panda's loader for an export file: DISCO-DOP for
+    # format 4 (with lemma column) and STANDARD for format 3, as given by
+    # export_format, or else decided by the #FORMAT line or by the number of
+    # columns of the first word (without a comment), which is odd for format
+    # 3 and even for format 4 (secondary edges add two columns each)
+    if export_format is not None:
+        if str(export_format) not in ["3", "4"]:
+            raise ValueError("unknown export format %s, use 3 or 4" %export_format)
+        return "DISCO-DOP" if str(export_format) == "4" else "STANDARD"
+    with open(path, encoding="utf-8") as corpus_file:
+        in_sentence = False
+        for line in corpus_file:
+            match = format_pattern.match(line)
+            if match:
+                return "DISCO-DOP" if match.group(1) == "4" else "STANDARD"
+            if line.startswith("%%"):
+                return "DISCO-DOP" if "lemma" in line.split() else "STANDARD"
+            if line.startswith("#BOS"):
+                in_sentence = True
+            elif in_sentence and line.strip() and not re.match(r"^#\d", line):
+                return "DISCO-DOP" if len(line.split("%%")[0].split()) % 2 == 0 else "STANDARD"
+    return "STANDARD"
+
+
+def load_trees(path, export_format=None):
+    # all trees of an export file with all words connected to the tree
+    from panda.negra_parse import sentence_names_to_hybridtrees_iter
+    return sentence_names_to_hybridtrees_iter(None, path, disconnect_punctuation=False,
+                                              mode=export_mode(path, export_format))
+
+
+def is_discontinuous(mask):
+    low = mask & -mask
+    return ((mask + low) & mask) != 0
+
+
+class EvalCounts:
+    # counts of brackets, exact matches and tags for each sentence length;
+    # counts of disjoint sets of sentences can be added up
+
+    def __init__(self, rows=None):
+        self.rows = { int(length): list(row) for (length, row) in (rows or {}).items() }
+
+    def add(self, length, **counts):
+        row = self.rows.setdefault(length, [0] * len(COUNTS))
+        for (column, name) in enumerate(COUNTS):
+            row[column] += counts.get(name, 0)
+
+    def totals(self, max_length=None):
+        # sums over all sentence lengths up to max_length
+        total = dict.fromkeys(COUNTS, 0)
+        for (length, row) in self.rows.items():
+            if max_length is None or length <= max_length:
+                for (name, count) in zip(COUNTS, row):
+                    total[name] += count
+        return total
+
+    def max_length(self):
+        return max(self.rows) if self.rows else 0
+
+    def merge(self, other):
+        # adds the counts of other to these counts
+        for (length, row) in other.rows.items():
+            self.add(length, **dict(zip(COUNTS, row)))
+        return self
+
+    def write(self, path):
+        # stores the counts as a table with one row per sentence length, the
+        # file is replaced atomically
+        tmp = "%s.%d.tmp" %(path, os.getpid())
+        with open(tmp, "w", encoding="utf-8") as counts_file:
+            counts_file.write("\t".join(["len"] + COUNTS) + "\n")
+            for length in sorted(self.rows):
+                counts_file.write("\t".join(map(str, [length] + self.rows[length])) + "\n")
+        os.replace(tmp, path)
+
+    @staticmethod
+    def read(path):
+        # raises ValueError if the file is not a complete table of counts
+        counts = EvalCounts()
+        with open(path, encoding="utf-8") as counts_file:
+            header = counts_file.readline().split()
+            if "len" not in header or not set(header) <= set(["len"] + COUNTS):
+                raise ValueError("%s is not a table of counts" %path)
+            for line in counts_file:
+                fields = line.split()
+                if len(fields) != len(header):
+                    raise ValueError("incomplete row in %s: %r" %(path, line))
+                row = dict(zip(header, map(int, fields)))
+                counts.add(row.pop("len"), **row)
+        return counts
+
+
+class Evaluator:
+    # keeps the bracketings of the gold trees in memory
+
+    def __init__(self, gold, parameters, export_format=None):
+        self.parameters = parameters
+        self.gold = {}
+        delete_words = { parameters["EQ_WORD"].get(word, word) for word in parameters["DELETE_WORD"] }
+        for tree in load_trees(gold, export_format):
+            tokens = tree.token_yield()
+            words = [parameters["EQ_WORD"].get(token.form(), token.form()) for token in tokens]
+            tags = [token.pos() for token in tokens]
+            # position of each word, or -1 for deleted words; the words are
+            # not renumbered, like the leaves in disco-dop, such that a
+            # bracket with a deleted word in a gap is still discontinuous
+            positions = [-1 if tag in parameters["DELETE_LABEL"] or word in delete_words else position
+                         for (position, (word, tag)) in enumerate(zip(words, tags))]
+            length = sum(1 for tag in tags if tag not in parameters["DELETE_LABEL_FOR_LENGTH"])
+            self.gold[tree.sent_label()] = (length, tags, positions, self.brackets(tree, positions))
+
+    def brackets(self, tree, positions):
+        # multiset of (label, bit mask of positions) of the inner nodes of a
+        # tree without deleted words, labels and empty nodes
+        labelled = self.parameters["LABELED"]
+        brackets = Counter()
+        for span in tree.labelled_spans():
+            label = self.parameters["EQ_LABEL"].get(span[0], span[0])
+            if label in self.parameters["DELETE_LABEL"]:
+                continue
+            mask = 0
+            for (low, high) in zip(span[1::2], span[2::2]):
+                for position in positions[low:high + 1]:
+                    if position >= 0:
+                        mask |= 1 << position
+            if not mask or (self.parameters["DISC_ONLY"] and not is_discontinuous(mask)):
+                continue
+            brackets[(label if labelled else "", mask)] += 1
+        return brackets
+
+    def score_tree(self, tree, counts):
+        # adds the counts of a predicted tree to counts
+        if tree.sent_label() not in self.gold:
+            raise ValueError("sentence %s is not in the gold file" %tree.sent_label())
+        (length, gold_tags, positions, gold) = self.gold[tree.sent_label()]
+        if not gold_tags:
+            return
+        tags = [token.pos() for token in tree.token_yield()]
+        if len(tags) != len(gold_tags):
+            raise ValueError("sentence length mismatch in sentence %s: %d words in gold, %d predicted"
+                             %(tree.sent_label(), len(gold_tags), len(tags)))
+        cand = self.brackets(tree, positions)
+        counts.add(length,
+                   sentences=1,
+                   gold=sum(gold.values()),
+                   cand=sum(cand.values()),
+                   matched=sum((gold & cand).values()),
+                   exact=int(gold == cand),
+                   gold_disc=sum(count for ((_, mask), count) in gold.items() if is_discontinuous(mask)),
+                   cand_disc=sum(count for ((_, mask), count) in cand.items() if is_discontinuous(mask)),
+                   tags=sum(1 for position in positions if position >= 0),
+                   correct_tags=sum(1 for (position, tag, gold_tag) in zip(positions, tags, gold_tags)
+                                    if position >= 0 and tag == gold_tag))
+
+    def score(self, predictions, export_format=None):
+        # returns the EvalCounts of all trees in an export file
+        counts = EvalCounts()
+        for tree in load_trees(predictions, export_format):
+            self.score_tree(tree, counts)
+        return counts
+
+
+def score_file(gold, predictions, parameters, formats=(None, None)):
+    # formats are the export formats of the gold and prediction file, cf. export_mode
+    return Evaluator(gold, parameters, formats[0]).score(predictions, formats[1])
+
+
+def score_folds(folds, parameters, workers=None):
+    # scores pairs of gold and prediction files in a pool of processes and
+    # returns the sum of their counts
+    counts = EvalCounts()
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1) as pool:
+        futures = [pool.submit(score_file, gold, predictions, parameters) for (gold, predictions) in folds]
+        for future in as_completed(futures):
+            counts.merge(future.result())
+    return counts
+
+
+def score_cache_key(gold, predictions, parameter_file=None, formats=(None, None)):
+    # hash of the contents of the gold, prediction and parameter files and of
+    # their export formats
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(str(SCORE_CACHE_VERSION).encode("ascii"))
+    digest.update(repr(tuple(None if f is None else str(f) for f in formats)).encode("ascii"))
+    for path in [gold, predictions, parameter_file]:
+        if path is None:
+            digest.update(b"\0")
+            continue
+        digest.update(b"\1")
+        with open(path, "rb") as content:
+            for block in iter(lambda: content.read(1 << 20), b""):
+                digest.update(block)
+        # separates the contents of consecutive files
+        digest.update(str(os.path.getsize(path)).encode("ascii"))
+    return digest.hexdigest()
+
+
+def evict(cache_dir, max_size):
+    # removes the least recently used entries until the cache fits in max_size bytes
+    entries = []
+    for entry in os.scandir(cache_dir):
+        if entry.name.endswith(".counts"):
+            try:
+                info = entry.stat()
+            except FileNotFoundError:
+                # removed by another process in the meantime
+                continue
+            entries.append((info.st_mtime, info.st_size, entry.path))
+    size = sum(entry_size for (_, entry_size, _) in entries)
+    for (_, entry_size, path) in sorted(entries):
+        if size <= max_size:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        size -= entry_size
+
+
+def cached_score_file(gold, predictions, parameter_file=None, cache_dir=None, max_size=SCORE_CACHE_SIZE,
+                      formats=(None, None)):
+    # same as score_file, but looks up the counts in the cache first; the
+    # modification time of an entry is its last use, and an entry that
+    # cannot be read (e.g. it was removed or is corrupt) is scored again
+    cache_dir = os.path.expanduser(cache_dir or SCORE_CACHE)
+    cache_file = os.path.join(cache_dir, score_cache_key(gold, predictions, parameter_file, formats) + ".counts")
+    try:
+        counts = EvalCounts.read(cache_file)
+        os.utime(cache_file)
+        return counts
+    except (OSError, ValueError):
+        pass
+    counts = score_file(gold, predictions, read_parameters(parameter_file), formats)
+    os.makedirs(cache_dir, exist_ok=True)
+    counts.write(cache_file)
+    evict(cache_dir, max_size)
+    return counts
+
+
+def percentage(numerator, denominator):
+    return "%.2f" %(100.0 * numerator / denominator) if denominator else "0.00"
+
+
+def scores(total):
+    # recall, precision, f-measure, exact match and tagging accuracy in %
+    return { "recall": percentage(total["matched"], total["gold"]),
+             "precision": percentage(total["matched"], total["cand"]),
+             "f-measure": percentage(2 * total["matched"], total["gold"] + total["cand"]),
+             "exact": percentage(total["exact"], total["sentences"]),
+             "tagging": percentage(total["correct_tags"], total["tags"]) }
+
+
+def summary_lines(total, longest):
+    s = scores(total)
+    lines = ["number of sentences:       %6d" %total["sentences"],
+             "longest sentence:          %6d" %longest]
+    if total["gold_disc"] or total["cand_disc"]:
+        lines += ["gold brackets (disc.):     %6d (%d)" %(total["gold"], total["gold_disc"]),
+                  "cand. brackets (disc.):    %6d (%d)" %(total["cand"], total["cand_disc"])]
+    else:
+        lines += ["gold brackets:             %6d" %total["gold"],
+                  "cand. brackets:            %6d" %total["cand"]]
+    lines += ["labeled recall:            %6s" %s["recall"],
+              "labeled precision:         %6s" %s["precision"],
+              "labeled f-measure:         %6s" %s["f-measure"],
+              "exact match:               %6s" %s["exact"],
+              "tagging accuracy:          %6s" %s["tagging"]]
+    return lines
+
+
+def summary(counts, cutoff):
+    # the summary in the form of disco-dop, with an additional column for
+    # sentences up to the cutoff length if there are longer sentences
+    longest = counts.max_length()
+    if longest <= cutoff:
+        return "\n".join([" Summary (ALL) ".center(35, "_")] + summary_lines(counts.totals(), longest))
+    lengths = [length for length in counts.rows if length <= cutoff]
+    below = summary_lines(counts.totals(cutoff), max(lengths) if lengths else 0)
+    return "\n".join(["%s     %s" %(" Summary (<= %d) ".center(35, "_") %cutoff, " Summary (ALL) ".center(35, "_"))]
+                     + ["%-40s%s" %(a, b) for (a, b) in zip(below, summary_lines(counts.totals(), longest))])
+
+
+def length_table(counts):
+    # one row of counts and scores for each sentence length
+    lines = ["len\tsentences\tgold\tcand\tmatched\trecall\tprecision\tf-measure\texact"]
+    for length in sorted(counts.rows):
+        total = dict(zip(COUNTS, counts.rows[length]))
+        s = scores(total)
+        lines.append("\t".join(map(str, [length, total["sentences"], total["gold"], total["cand"], total["matched"],
+                                         s["recall"], s["precision"], s["f-measure"], s["exact"]])))
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    from sys import argv
+    help = """use %s <GOLD FILE> <PREDICTIONS FILE> [<PARAMETER FILE>] [OPTIONS]
+              or  %s --merge [--parameters=<PARAMETER FILE>] <COUNTS FILE>...
+              where OPTIONS is some combination of
+                --counts=<FILE>
+                --gold-format=(3|4)   (default: #FORMAT line or number of columns)
+                --format=(3|4)        (export format of the predictions, as above)
+                --cache=(true*|false)
+                --cache-dir=<FOLDER>
+                --cache-size=<BYTES>""" %(argv[0], argv[0])
+
+    options = { "counts": None, "parameters": None, "cache": "true", "cache-dir": None,
+                "cache-size": str(SCORE_CACHE_SIZE), "gold-format": None, "format": None }
+    for arg in argv[1:]:
+        match = re.match(r"^--([^=]+)=(.*)$", arg)
+        if match and match.group(1) in options:
+            options[match.group(1)] = match.group(2)
+    files = [arg for arg in argv[1:] if not arg.startswith("--")]
+
+    if "--merge" in argv:
+        parameters = read_parameters(options["parameters"])
+        counts = EvalCounts()
+        for path in files:
+            counts.merge(EvalCounts.read(path))
+    else:
+        assert 2 <= len(files) <= 3, help
+        parameter_file = files[2] if len(files) == 3 else None
+        parameters = read_parameters(parameter_file)
+        formats = (options["gold-format"], options["format"])
+        if options["cache"] in ["yes", "true", "True", "on"]:
+            counts = cached_score_file(files[0], files[1], parameter_file, options["cache-dir"],
+                                       int(options["cache-size"]), formats)
+        else:
+            counts = score_file(files[0], files[1], parameters, formats)
+        if options["counts"]:
+            counts.write(options["counts"])
+            exit(0)
+    print(summary(counts, parameters["CUTOFF_LEN"]))
+    print()
+    print(length_table(counts))
@@ -0,0 +1,787 @@
+# Runs the experiments of experiments.sh for rustomata, gf, rparse and
+# disco-dop as a graph of tasks
+#   preprocess -> split -> extract grammar (per fold) -> parse (per fold)
+#     -> normalize (per fold) -> evaluate (per fold) -> aggregate
+# Tasks whose dependencies are done run concurrently, e.g. the grammar
+# extraction and parsing of different folds, using at most --cores (or CORES
+# in the configuration) of the cores available to this process at a time.
+# Each task is pinned to its own set of cores (one, or as many as the parser
+# runs threads or processes, cf. RPARSE_CORES and GF_WORKERS) that no other
+# running task uses, such that the parse times are not skewed by contention.
+# The configuration is read from the same files as by experiments.sh and the
+# same result files are written, except for the grid search of
+# rustomata_dev, which parses each configuration in its own task and stores
+# the results of all of them in one table
+# ($RESULTS/rustomata-ofcv-<corpus>-grid.tsv). With --search=adaptive, the
+# configurations are evaluated by successive halving on growing samples of
+# test-0 instead (cf. ADAPTIVE_ETA), and the table is stored in
+# $RESULTS/rustomata-ofcv-<corpus>-adaptive.tsv.
+# Like experiments.sh, the preprocessed corpus, the splits and the grammars
+# are only created if they do not exist yet. If a task fails, no new tasks
+# are started, the outputs of the failed task are removed and the scores of
+# all evaluated folds (or the table of the finished configurations) are
+# stored with the suffix .partial. The predictions are scored by SCORER of
+# the configuration, like by experiments.sh.
+#
+# use from the root of the repository:
+#   python scripts/experiments.py (rustomata|gf|rparse|discodop|rustomata_dev) <corpus> [<additional parser argument>]
+#       [--cores=N] [--search=(grid|adaptive)]
+
+import os
+import re
+import subprocess
+import sys
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from itertools import product
+from random import Random
+from shlex import quote
+from statistics import mean, median
+from time import perf_counter
+
+from evaluate import COUNTS, EvalCounts, read_parameters, scores
+from panda.traversal import topological_order
+
+CONFIGURATION_FILES = ["templates/experiments.conf.example", "experiments.conf"]
+ARRAYS = ["RUSTOMATA_BEAMS", "RUSTOMATA_THRESHOLDS", "RUSTOMATA_CANDIDATES"]
+VARIABLES = ["MAXLENGTH", "MAX_EVAL_FOLD", "TMP", "RESULTS", "SCRIPTS", "RUSTOMATA", "VANDA", "RPARSE", "GF", "DISCO",
+             "PYTHON", "RUSTOMATA_D_CANDIDATES", "RUSTOMATA_D_BEAM", "RUSTOMATA_D_THRESHOLD", "RPARSE_TIMEOUT",
+             "GF_TIMEOUT", "GF_WORKERS", "RPARSE_CORES", "DISCODOP_EVAL", "SCORER", "TRASH", "CORES"] + ARRAYS
+
+
+def read_configuration(files=CONFIGURATION_FILES):
+    # sources the configuration files in bash, like experiments.sh, and
+    # returns the values of VARIABLES (a list for each of ARRAYS)
+    script = """
+        for file in "$@"; do
+            if [ -f "$file" ]; then source "$file"; fi
+        done
+        for name in %s; do
+            eval 'values=("${'"$name"'[@]}")'
+            printf '%%s\\037' "${values[@]}"
+            printf '\\036'
+        done""" % " ".join(VARIABLES)
+    output = subprocess.run(["bash", "-c", script, "bash"] + files, stdout=subprocess.PIPE, check=True,
+                            universal_newlines=True).stdout
+    configuration = {}
+    for (name, record) in zip(VARIABLES, output.split("\036")):
+        values = record.split("\037")[:-1]
+        configuration[name] = values if name in ARRAYS else "".join(values)
+    return configuration
+
+
+class Task:
+    # a shell command that is run by bash with the configuration in its
+    # environment once all tasks it depends on are done, or a function
+    # without arguments that is called instead and may return further tasks
+    # to run; it is skipped if it has outputs and all of them exist, and the
+    # files and folders in cleanup (outputs by default) are removed if it
+    # fails; cores is the number of cores the command is pinned to
+
+    def __init__(self, name, command, dependencies=(), outputs=(), cleanup=None, cores=1):
+        self.name = name
+        self.command = command
+        self.dependencies = list(dependencies)
+        self.outputs = list(outputs)
+        self.cleanup = self.outputs if cleanup is None else list(cleanup)
+        self.cores = cores
+        self.added = []
+        # CPU time (user and system, in seconds) of the command and all
+        # processes it waited for, once it is done
+        self.cpu_time = 0.0
+
+    def run(self, environment, cpus):
+        # returns the exit code of the command, which only runs on the given
+        # cpus such that it does not compete with other tasks for them
+        if callable(self.command):
+            self.added = list(self.command() or [])
+            return 0
+        process = subprocess.Popen(["taskset", "-c", ",".join(map(str, cpus)),
+                                    "bash", "-c", "set -e -o pipefail\n" + self.command], env=environment)
+        # the resource usage of this process only, unlike RUSAGE_CHILDREN,
+        # which adds up the tasks that run concurrently
+        (_, status, usage) = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
+        self.cpu_time = usage.ru_utime + usage.ru_stime
+        return process.returncode
+
+
+def run_tasks(tasks, cores, environment, log=sys.stdout):
+    # runs the tasks in the given order as soon as their dependencies are
+    # done and enough of the cores are free; a task that needs more cores
+    # than the others are using waits for them instead of being overtaken
+    # by later tasks
+    # The cores are taken from the cpus available to this process, and the
+    # running tasks are pinned to disjoint ones, such that only tasks that
+    # would share cores wait for each other.
+    # returns the names of the tasks that are done, of the failed tasks and of
+    # the tasks not run
+    by_name = {task.name: task for task in tasks}
+    pending = topological_order(tasks, lambda task: [by_name.get(name) for name in task.dependencies])
+    if pending is None:
+        raise ValueError("the dependencies of the tasks are cyclic or missing")
+    done = set()
+    failed = []
+    running = {}
+    free = sorted(os.sched_getaffinity(0))[:cores]
+    cores = len(free)
+    started = {}
+
+    with ThreadPoolExecutor(cores) as executor:
+        while True:
+            index = 0
+            while index < len(pending) and not failed:
+                task = pending[index]
+                if any(dependency not in done for dependency in task.dependencies):
+                    index += 1
+                    continue
+                if task.outputs and all(os.path.exists(output) for output in task.outputs):
+                    print("skip\t%s" % task.name, file=log, flush=True)
+                    done.add(task.name)
+                    del pending[index]
+                    # tasks before this one may depend on it
+                    index = 0
+                elif min(task.cores, cores) <= len(free):
+                    task_cpus = free[:min(task.cores, cores)]
+                    del free[:len(task_cpus)]
+                    print("start\t%s" % task.name, file=log, flush=True)
+                    started[task.name] = perf_counter()
+                    running[executor.submit(task.run, environment, task_cpus)] = (task, task_cpus)
+                    del pending[index]
+                else:
+                    break
+            if not running:
+                break
+
+            (finished, _) = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                (task, task_cpus) = running.pop(future)
+                free.extend(task_cpus)
+                if future.exception() is None and future.result() == 0:
+                    done.add(task.name)
+                    pending.extend(task.added)
+                    print("done\t%s\t%.1fs\t%.1fs cpu" % (task.name, perf_counter() - started[task.name], task.cpu_time),
+                          file=log, flush=True)
+                else:
+                    failed.append(task.name)
+                    print("failed\t%s" % task.name, file=log, flush=True)
+                    if future.exception() is not None:
+                        print(repr(future.exception()), file=sys.stderr)
+                    for path in task.cleanup:
+                        if os.path.exists(path):
+                            subprocess.run(["bash", "-c", "$TRASH %s" % quote(path)], env=environment)
+    return (done, failed, [task.name for task in pending])
+
+
+class Experiment:
+    # the tasks of an experiment for a corpus, and the parser and file of
+    # the scores that are evaluated
+
+    def __init__(self, configuration, corpus_file):
+        self.configuration = configuration
+        self.corpus_file = corpus_file
+        self.corpus = os.path.basename(corpus_file)
+        self.folder = os.path.join(configuration["TMP"], self.corpus)
+        self.folds = range(1, int(configuration["MAX_EVAL_FOLD"]) + 1)
+        self.tasks = []
+        self.scores = None
+        self.parser = None
+        # stores the results of the tasks that are done (given by their names)
+        # if a task failed
+        self.partial_results = None
+
+    def path(self, *names):
+        return os.path.join(self.folder, *names)
+
+    def add(self, name, command, dependencies=(), outputs=(), cleanup=None, cores=1):
+        self.tasks.append(Task(name, command, dependencies, outputs, cleanup, cores))
+        return name
+
+    def prepare(self):
+        # preprocessed corpus (with the punctuation moved by disco-dop) and its
+        # splits
+        low_punctuation = self.path("low-punctuation.export")
+        self.add("preprocess",
+                 'echo "#FORMAT 4" > %s\n$DISCO treetransforms --punct=move %s >> %s'
+                 % (quote(low_punctuation), quote(self.corpus_file), quote(low_punctuation)),
+                 outputs=[low_punctuation])
+        self.add("split",
+                 '$PYTHON $SCRIPTS/tfcv.py %s --out-prefix=%s --max-length=$MAXLENGTH --fix-bos=true'
+                 % (quote(low_punctuation), quote(self.path("splits"))),
+                 dependencies=["preprocess"], outputs=[self.path("splits", "test-0.export")], cleanup=[])
+
+    def discodop_parameters(self, pipeline, folds):
+        # parameter files of disco-dop, cf. assert_tfcv_discodop_files
+        outputs = [self.path("grammars", "discodop-%s-%d.prm" % (pipeline, fold)) for fold in folds]
+        commands = ['sed "s:{TRAIN}:%s:" "templates/discodop-%s.prm" | sed "s:{TEST}:%s:" | sed "s:{MAXLENGTH}:$MAXLENGTH:"'
+                    ' | sed "s:{EVALFILE}:$DISCODOP_EVAL:" > %s'
+                    % (self.path("splits", "train-%d.export" % fold), pipeline,
+                       self.path("splits", "test-%d.export" % fold), quote(output))
+                    for (fold, output) in zip(folds, outputs)]
+        return self.add("parameters-%s" % pipeline, "\n".join(commands), ["split"], outputs)
+
+    def scored_by_evaluate(self):
+        # Is SCORER evaluate.py (instead of `$DISCO eval`)?
+        return self.configuration["SCORER"] == "evaluate"
+
+    def evaluated(self, fold):
+        # the task after which a fold can be scored
+        return ("evaluate-%d" if self.scored_by_evaluate() else "normalize-%d") % fold
+
+    def score_command(self, parser, folds, scores):
+        # the shell command that stores the scores of the parser on the given
+        # folds, cf. merge_fold_scores
+        if self.scored_by_evaluate():
+            counts = [self.path("results", "%s-counts-%d.tsv" % (parser, fold)) for fold in folds]
+            return '$PYTHON $SCRIPTS/evaluate.py --merge --parameters="$DISCODOP_EVAL" %s > %s' \
+                % (" ".join(map(quote, counts)), quote(scores))
+        (gold, predictions) = (self.path("results", "%s-%s.export" % (parser, name)) for name in ["gold", "predictions"])
+        return '{ echo "#FORMAT 4"; for gold in %s; do tail -n+2 "$gold"; echo ""; done; } > %s\n' \
+               'cat %s > %s\n' \
+               '$DISCO eval %s %s "$DISCODOP_EVAL" > %s' \
+            % (" ".join(quote(self.path("splits", "test-%d.export" % fold)) for fold in folds), quote(gold),
+               " ".join(quote(self.path("results", "%s-predictions-%d.export" % (parser, fold))) for fold in folds),
+               quote(predictions), quote(gold), quote(predictions), quote(scores))
+
+    def evaluate(self, parser, times_header, time_column, times_group="len"):
+        # evaluation of the predictions of each fold by SCORER and the mean
+        # and median parse times, cf. evaluate_fold and merge_fold_scores
+        results = self.configuration["RESULTS"]
+        self.scores = os.path.join(results, "%s-%s-scores.txt" % (parser, self.corpus))
+        self.parser = parser
+        self.partial_results = self.merge_partial_scores
+        if self.scored_by_evaluate():
+            for fold in self.folds:
+                self.add("evaluate-%d" % fold,
+                         '$PYTHON $SCRIPTS/evaluate.py %s %s "$DISCODOP_EVAL" --counts=%s'
+                         % (quote(self.path("splits", "test-%d.export" % fold)),
+                            quote(self.path("results", "%s-predictions-%d.export" % (parser, fold))),
+                            quote(self.path("results", "%s-counts-%d.tsv" % (parser, fold)))),
+                         ["normalize-%d" % fold])
+        times = self.path("results", "%s-times.tsv" % parser)
+        averages = [os.path.join(results, "%s-%s-times-%s.tsv" % (parser, self.corpus, average))
+                    for average in ["mean", "median"]]
+        fold_times = " ".join(quote(self.path("results", "%s-times-%d.tsv" % (parser, fold))) for fold in self.folds)
+        self.add("aggregate",
+                 '%s\n'
+                 '{ echo -e %s; cat %s; } > %s\n'
+                 '$PYTHON $SCRIPTS/averages.py --group=%s --mean=%s < %s > %s\n'
+                 '$PYTHON $SCRIPTS/averages.py --group=%s --median=%s < %s > %s'
+                 % (self.score_command(parser, self.folds, self.scores),
+                    quote(times_header), fold_times, quote(times),
+                    times_group, time_column, quote(times), quote(averages[0]),
+                    times_group, time_column, quote(times), quote(averages[1])),
+                 [self.evaluated(fold) for fold in self.folds], cleanup=averages)
+
+    def merge_partial_scores(self, environment, done):
+        folds = [fold for fold in self.folds if self.evaluated(fold) in done]
+        if self.scores and folds:
+            subprocess.run(["bash", "-c", "set -e\n" + self.score_command(self.parser, folds, self.scores + ".partial")],
+                           env=environment)
+
+
+def rparse_experiment(experiment):
+    # cf. _rparse_ and assert_tfcv_rparse_files; rparse runs on RPARSE_CORES
+    # cores (its JVM runs the garbage collector and compiler in threads of
+    # their own)
+    experiment.prepare()
+    cores = int(experiment.configuration["RPARSE_CORES"] or 1)
+    for fold in experiment.folds:
+        model = experiment.path("grammars", "rparse-train-%d" % fold)
+        (raw, log) = (experiment.path("results", "rparse-%s-%d" % (name, fold)) for name in ["output", "log"])
+        experiment.add("grammar-%d" % fold,
+                       '$RPARSE -doTrain -train %s -headFinder negra -saveModel %s &> /dev/null'
+                       % (quote(experiment.path("splits", "train-%d.export" % fold)), quote(model)),
+                       ["split"], [model], cores=cores)
+        experiment.add("parse-%d" % fold,
+                       '$RPARSE -doParse -test %s -testFormat export -readModel %s -timeout "$RPARSE_TIMEOUT" > %s 2> %s'
+                       % (quote(experiment.path("splits", "test-%d.export" % fold)), quote(model), quote(raw), quote(log)),
+                       ["grammar-%d" % fold], cleanup=[raw, log], cores=cores)
+        sentences = quote(experiment.path("splits", "test-%d.sent" % fold))
+        experiment.add("normalize-%d" % fold,
+                       '$PYTHON $SCRIPTS/parse_rparse_output.py < %s > %s\n'
+                       '$PYTHON $SCRIPTS/fill_sentence_id.py %s < %s | $PYTHON $SCRIPTS/fill_noparses.py %s > %s\n'
+                       'rm %s %s'
+                       % (quote(log), quote(experiment.path("results", "rparse-times-%d.tsv" % fold)),
+                          sentences, quote(raw), sentences,
+                          quote(experiment.path("results", "rparse-predictions-%d.export" % fold)), quote(raw), quote(log)),
+                       ["parse-%d" % fold])
+    experiment.evaluate("rparse", "len\\ttime\\tsuccess", "time")
+
+
+def gf_experiment(experiment):
+    # cf. _gf_ and assert_tfcv_gf_files; each fold is parsed by GF_WORKERS gf
+    # shells (one if it is 0, such that the folds are parsed in parallel) on
+    # as many cores, the grammars are extracted by rparse on RPARSE_CORES
+    # cores
+    experiment.prepare()
+    rparse_cores = int(experiment.configuration["RPARSE_CORES"] or 1)
+    gf_all = experiment.path("grammars", "gf-all")
+    experiment.add("grammar-all",
+                   '$RPARSE -doTrain -train %s -headFinder negra -trainSave %s &> /dev/null'
+                   % (quote(experiment.path("low-punctuation.export")), quote(gf_all)),
+                   ["preprocess"], [gf_all], cores=rparse_cores)
+    workers = int(experiment.configuration["GF_WORKERS"] or 0) or 1
+    for fold in experiment.folds:
+        grammar = experiment.path("grammars", "gf-%d" % fold)
+        (g, a) = (quote(grammar), quote(gf_all))
+        experiment.add("grammar-%d" % fold,
+                       '$RPARSE -doTrain -train %s -headFinder negra -trainSave %s &> /dev/null\n'
+                       '# copy lexer from complete corpus, such that all terminals are available\n'
+                       'cp %s/grammargf.lex %s/grammargf.lex\n'
+                       'cp %s/grammargflexconcrete.gf %s/grammargflexconcrete.gf\n'
+                       'cp %s/grammargflexabstract.gf %s/grammargflexabstract.gf\n'
+                       '# copy lexer probabilities from complete corpus\n'
+                       '{ grep -vP "^fun\\d+" %s/grammargf.probs || true; } > %s/grammargf.probs1\n'
+                       '{ grep -P "^fun\\d+" %s/grammargf.probs || true; } >> %s/grammargf.probs1\n'
+                       'mv %s/grammargf.probs1 %s/grammargf.probs\n'
+                       '$GF --probs=%s/grammargf.probs --make -D %s/ %s/grammargfconcrete.gf &> /dev/null'
+                       % (quote(experiment.path("splits", "train-%d.export" % fold)), g, a, g, a, g, a, g, a, g, g, g,
+                          g, g, g, g, g),
+                       ["split", "grammar-all"], [grammar], cores=rparse_cores)
+        gf_sentences = experiment.path("splits", "test-%d-gf.sent" % fold)
+        experiment.add("sentences-%d" % fold,
+                       "sed 's/^[[:digit:]]\\+[[:space:]]\\+//' %s | sed 's#/[^[:space:]/]\\+[[:space:]]# #g'"
+                       " | sed 's#/[^[:space:]/]\\+$# #g' | sed --file \"$SCRIPTS/gf-escapes.sed\" > %s"
+                       % (quote(experiment.path("splits", "test-%d.sent" % fold)), quote(gf_sentences)),
+                       ["split"], [gf_sentences])
+        raw = experiment.path("results", "gf-output-%d.export" % fold)
+        experiment.add("parse-%d" % fold,
+                       '$PYTHON $SCRIPTS/gf_parse.py %s %s --gf="$GF" --timeout="$GF_TIMEOUT" --workers=%d'
+                       ' --sentences=%s > %s 2> %s'
+                       % (quote(os.path.join(grammar, "grammargfabstract.pgf")), quote(gf_sentences), workers,
+                          quote(experiment.path("splits", "test-%d.sent" % fold)), quote(raw),
+                          quote(experiment.path("results", "gf-times-%d.tsv" % fold))),
+                       ["grammar-%d" % fold, "sentences-%d" % fold], cleanup=[raw], cores=workers)
+        experiment.add("normalize-%d" % fold,
+                       '$PYTHON $SCRIPTS/gf-escapes-rev.py < %s > %s\nrm %s'
+                       % (quote(raw), quote(experiment.path("results", "gf-predictions-%d.export" % fold)), quote(raw)),
+                       ["parse-%d" % fold])
+    experiment.evaluate("gf", "len\\ttime\\tsuccess", "time")
+
+
+def discodop_experiment(experiment, pipeline):
+    # cf. _discodop_; disco-dop extracts the grammar and parses in one run
+    experiment.prepare()
+    parameters = experiment.discodop_parameters(pipeline, experiment.folds)
+    prediction_filename = "dop.export" if pipeline == "dop" else "plcfrs.export"
+    parser = "discodop-%s" % pipeline
+    for fold in experiment.folds:
+        folder = experiment.path("grammars", "%s-%d" % (parser, fold))
+        experiment.add("parse-%d" % fold, '$DISCO runexp %s &> /dev/null' % quote(folder + ".prm"),
+                       [parameters], cleanup=[folder])
+        experiment.add("normalize-%d" % fold,
+                       '$PYTHON $SCRIPTS/averages.py --group=sentid --mean=len --sum=elapsedtime < %s | tail -n+2 > %s\n'
+                       'cp %s %s\n'
+                       '$TRASH %s'
+                       % (quote(os.path.join(folder, "stats.tsv")),
+                          quote(experiment.path("results", "%s-times-%d.tsv" % (parser, fold))),
+                          quote(os.path.join(folder, prediction_filename)),
+                          quote(experiment.path("results", "%s-predictions-%d.export" % (parser, fold))), quote(folder)),
+                       ["parse-%d" % fold])
+    experiment.evaluate(parser, "sentid\\tlen\\telapsedtime", "elapsedtime")
+
+
+def rustomata_grammar(experiment, extraction, fold, parameters):
+    # adds the task grammar-<fold> that extracts the grammar of rustomata
+    # from the training set of a fold, cf. assert_tfcv_rustomata_files, and
+    # returns its file; parameters is the task of the parameter files of
+    # disco-dop for the discodop extraction
+    grammar = experiment.path("grammars", "train-%s-%d.cs" % (extraction, fold))
+    if extraction == "discodop":
+        rules = experiment.path("grammars", "train-%d.discodop" % fold)
+        experiment.add("grammar-%d" % fold,
+                       '$DISCO grammar param %s %s &> /dev/null\n'
+                       '# replace the PoS-Tag $[ by $(, as used in the NeGra-Corpus\n'
+                       "gunzip -c %s/plcfrs.rules.gz | sed 's/\\$\\[/\\$\\(/g' | gzip > %s/plcfrs.rules-fixed.gz\n"
+                       '$RUSTOMATA csparsing extract -s "$MAXLENGTH" -d %s/plcfrs.rules-fixed.gz > %s'
+                       % (quote(experiment.path("grammars", "discodop-lcfrs-%d.prm" % fold)), quote(rules),
+                          quote(rules), quote(rules), quote(rules), quote(grammar)),
+                       [parameters], [grammar], cleanup=[rules, grammar])
+    else:
+        vanda = experiment.path("grammars", "train-%d.vanda" % fold)
+        experiment.add("grammar-%d" % fold,
+                       '$VANDA pmcfg extract -p %s < %s\n$RUSTOMATA csparsing extract < %s > %s'
+                       % (quote(vanda), quote(experiment.path("splits", "train-%d.export" % fold)),
+                          quote(vanda + ".readable"), quote(grammar)),
+                       ["split"], [grammar])
+    return grammar
+
+
+def rustomata_experiment(experiment, extraction):
+    # cf. _rustomata_ and assert_tfcv_rustomata_files
+    experiment.prepare()
+    parameters = experiment.discodop_parameters("lcfrs", experiment.folds) if extraction == "discodop" else None
+    parser = "rustomata-%s" % extraction
+    for fold in experiment.folds:
+        grammar = rustomata_grammar(experiment, extraction, fold, parameters)
+        predictions = experiment.path("results", "%s-predictions-%d.export" % (parser, fold))
+        output = predictions + ".bin" if extraction == "discodop" else predictions
+        log = experiment.path("results", "%s-log-%d" % (parser, fold))
+        experiment.add("parse-%d" % fold,
+                       '$RUSTOMATA csparsing parse %s --beam="$RUSTOMATA_D_BEAM" --candidates="$RUSTOMATA_D_CANDIDATES"'
+                       ' --threshold="$RUSTOMATA_D_THRESHOLD" --with-pos --with-lines --debug < %s 2> %s'
+                       " | sed 's:_[[:digit:]]::' > %s"
+                       % (quote(grammar), quote(experiment.path("splits", "test-%d.sent" % fold)), quote(log),
+                          quote(output)),
+                       ["grammar-%d" % fold], cleanup=[log, output])
+        unbinarize = '\n$DISCO treetransforms --unbinarize %s > %s' % (quote(output), quote(predictions)) \
+            if extraction == "discodop" else ""
+        experiment.add("normalize-%d" % fold,
+                       "sed 's: :\\t:g' %s | sed 's:µs:us:' > %s\nrm %s%s"
+                       % (quote(log), quote(experiment.path("results", "%s-times-%d.tsv" % (parser, fold))), quote(log),
+                          unbinarize),
+                       ["parse-%d" % fold])
+    experiment.evaluate(parser, "grammarsize\\tlen\\ttime\\tresult\\tcandidates", "time")
+
+
+# columns of the results table of the grid search; there is one row with the
+# scores up to the cutoff length of the evaluation parameters and the times
+# of all sentences (len "all") and one row for each sentence length per
+# configuration, the times are in ms
+GRID_COLUMNS = ["beam", "threshold", "candidates", "len", "sentences", "recall", "precision", "f-measure",
+                "time-mean", "time-median"]
+# durations as printed by rustomata, e.g. 12.5ms, 800µs or 1.2s
+duration_pattern = re.compile(r"^(\d+(?:\.\d+)?)(ns|us|µs|ms|s)?$")
+DURATION_MS = { "ns": 1e-6, "us": 1e-3, "µs": 1e-3, "ms": 1.0, "s": 1000.0, None: 1e-6 }
+
+
+def read_times(path):
+    # the parse times in ms of each sentence length in a log of rustomata
+    times = defaultdict(list)
+    with open(path, encoding="utf-8") as lines:
+        for line in lines:
+            fields = line.split()
+            match = duration_pattern.match(fields[2]) if len(fields) > 2 and fields[1].isdigit() else None
+            if match:
+                times[int(fields[1])].append(float(match.group(1)) * DURATION_MS[match.group(2)])
+    return times
+
+
+# scores in the summary of `discodop eval`, the first one of each line is up
+# to the cutoff length
+summary_pattern = re.compile(r"^labeled (recall|precision|f-measure):\s+(\d+\.\d+)")
+
+
+def read_summary(path):
+    # the recall, precision and f-measure in a summary of `discodop eval`
+    with open(path, encoding="utf-8") as summary:
+        return { match.group(1): match.group(2) for match in map(summary_pattern.match, summary) if match }
+
+
+def grid_rows(configuration, counts, times, cutoff, summary=None):
+    # the rows of the results table for a configuration (beam, threshold,
+    # candidates), its EvalCounts and parse times; the scores of the row of
+    # all lengths are taken from summary (cf. read_summary) if it is given
+    lengths = sorted(set(counts.rows) | set(times))
+    groups = [("all", counts.totals(cutoff), [time for length in lengths for time in times.get(length, [])])]
+    groups += [(length, dict(zip(COUNTS, counts.rows.get(length, [0] * len(COUNTS)))), times.get(length, []))
+               for length in lengths]
+    rows = []
+    for (length, total, length_times) in groups:
+        score = summary if summary and length == "all" else scores(total)
+        rows.append(list(configuration)
+                    + [length, total["sentences"], score["recall"], score["precision"], score["f-measure"]]
+                    + (["%.3f" % mean(length_times), "%.3f" % median(length_times)] if length_times else ["", ""]))
+    return rows
+
+
+def write_grid_table(path, rows):
+    # stores the rows of the results table, the file is replaced atomically
+    tmp = "%s.%d.tmp" % (path, os.getpid())
+    with open(tmp, "w", encoding="utf-8") as table:
+        table.write("\t".join(GRID_COLUMNS) + "\n")
+        for row in rows:
+            table.write("\t".join(map(str, row)) + "\n")
+    os.replace(tmp, path)
+
+
+def rustomata_configuration(experiment, grammar, configuration, sentences, gold, dependencies, name, summary=False):
+    # adds the task parse-<name> that parses the sentences with rustomata in
+    # a configuration (beam, threshold, candidates), unbinarizes and
+    # evaluates them, and returns the files of its counts, parse times and
+    # summary; evaluate.py counts the brackets for each sentence length, and
+    # if summary is set and SCORER is disco-dop, the predictions are also
+    # scored by `$DISCO eval` (otherwise the file of the summary is None)
+    prefix = experiment.path("results", "rustomata-ofcv-%s" % name)
+    (log, times, binarized, predictions, counts, scores) = [prefix + suffix for suffix in ["-log", "-times.tsv",
+        "-predictions.export.bin", "-predictions.export", "-counts.tsv", "-scores.txt"]]
+    if not summary or experiment.scored_by_evaluate():
+        scores = None
+    (beam, threshold, candidates) = configuration
+    experiment.add("parse-%s" % name,
+                   '$RUSTOMATA csparsing parse %s --beam=%s --candidates=%s --threshold=%s --with-pos --with-lines'
+                   " --debug < %s 2> %s | sed 's:_[[:digit:]]::' > %s\n"
+                   '{ echo -e "grammarsize\\tlen\\ttime\\tresult\\tcandidates"; sed \'s: :\\t:g\' %s | sed \'s:µs:us:\'; } > %s\n'
+                   '$DISCO treetransforms --unbinarize %s > %s\n'
+                   '$PYTHON $SCRIPTS/evaluate.py %s %s "$DISCODOP_EVAL" --counts=%s\n'
+                   '%s'
+                   'rm %s %s'
+                   % (quote(grammar), quote(beam), quote(candidates), quote(threshold), quote(sentences), quote(log),
+                      quote(binarized), quote(log), quote(times), quote(binarized), quote(predictions), quote(gold),
+                      quote(predictions), quote(counts),
+                      '$DISCO eval %s %s "$DISCODOP_EVAL" > %s\n' % (quote(gold), quote(predictions), quote(scores))
+                      if scores else "",
+                      quote(log), quote(binarized)),
+                   dependencies, cleanup=[log, times, binarized, predictions, counts] + ([scores] if scores else []))
+    return (counts, times, scores)
+
+
+def grid_configurations(configuration):
+    # all configurations (beam, threshold, candidates) of the grid search
+    return list(product(configuration["RUSTOMATA_BEAMS"], configuration["RUSTOMATA_THRESHOLDS"],
+                        configuration["RUSTOMATA_CANDIDATES"]))
+
+
+def rustomata_dev_experiment(experiment):
+    # cf. _rustomata_dev_; each configuration of the grid search is parsed by
+    # its own task, i.e. on its own core, and the scores and parse times of
+    # all of them are stored in one table
+    experiment.prepare()
+    parameters = experiment.discodop_parameters("lcfrs", [0])
+    grammar = rustomata_grammar(experiment, "discodop", 0, parameters)
+    configurations = grid_configurations(experiment.configuration)
+    files = [rustomata_configuration(experiment, grammar, configuration, experiment.path("splits", "test-0.sent"),
+                                     experiment.path("splits", "test-0.export"), ["grammar-0"], "-".join(configuration),
+                                     summary=True)
+             for configuration in configurations]
+    table = os.path.join(experiment.configuration["RESULTS"], "rustomata-ofcv-%s-grid.tsv" % experiment.corpus)
+
+    tasks = ["parse-%s" % "-".join(configuration) for configuration in configurations]
+
+    def write_table(path, done):
+        cutoff = read_parameters(experiment.configuration["DISCODOP_EVAL"])["CUTOFF_LEN"]
+        rows = []
+        for (configuration, task, (counts, times, summary)) in zip(configurations, tasks, files):
+            if task in done:
+                rows += grid_rows(configuration, EvalCounts.read(counts), read_times(times), cutoff,
+                                  read_summary(summary) if summary else None)
+        write_grid_table(path, rows)
+
+    experiment.add("table", lambda: write_table(table, tasks), tasks)
+    experiment.partial_results = lambda environment, done: write_table(table + ".partial", done)
+
+
+# The adaptive search of rustomata_dev evaluates the configurations on nested
+# samples of test-0 that grow by the factor ADAPTIVE_ETA up to all sentences;
+# only 1/ADAPTIVE_ETA of the configurations of a sample are promoted to the
+# next one, those that are best w.r.t. f-measure and median parse time. There
+# are as many samples as the configurations can be reduced by this factor,
+# but the first one has at least ADAPTIVE_MIN_SAMPLE sentences.
+ADAPTIVE_ETA = 3
+ADAPTIVE_MIN_SAMPLE = 50
+
+
+def stratified_samples(lengths, eta, rungs, seed=0):
+    # nested samples of sentences, given by their lengths, such that each
+    # sample has eta times as many sentences as the one before and the last
+    # one has all of them; returns the indices of the sentences that are
+    # added to the sample of the previous rung, for each rung
+    # The sentences are ordered by length (randomly within a length) and every
+    # eta^(rungs - 1 - r)-th one is in the sample of rung r, such that each
+    # length is represented by its share of the sentences.
+    random = Random(seed)
+    keys = [random.random() for _ in lengths]
+    order = sorted(range(len(lengths)), key=lambda index: (lengths[index], keys[index]))
+    increments = [[] for _ in range(rungs)]
+    for (position, index) in enumerate(order):
+        rung = 0
+        while position % eta ** (rungs - 1 - rung):
+            rung += 1
+        increments[rung].append(index)
+    return [sorted(increment) for increment in increments]
+
+
+def pareto_ranks(points):
+    # the rank of each point (f-measure, time) in the non-dominated sorting,
+    # i.e. 0 if no other point has a higher or equal f-measure and a lower or
+    # equal time (and is not equal), 1 if only points of rank 0 do etc.
+    def dominates(a, b):
+        return a[0] >= b[0] and a[1] <= b[1] and a != b
+
+    ranks = [None] * len(points)
+    rank = 0
+    remaining = list(range(len(points)))
+    while remaining:
+        front = [i for i in remaining if not any(dominates(points[j], points[i]) for j in remaining)]
+        for i in front:
+            ranks[i] = rank
+        remaining = [i for i in remaining if ranks[i] is None]
+        rank += 1
+    return ranks
+
+
+def promote(points, quota):
+    # the indices of quota points (f-measure, time) with the lowest Pareto
+    # ranks; of the rank that does not fit completely, points evenly spread
+    # along its front (ordered by time) are taken
+    ranks = pareto_ranks(points)
+    promoted = []
+    for rank in sorted(set(ranks)):
+        front = sorted((i for i in range(len(points)) if ranks[i] == rank), key=lambda i: points[i][1])
+        left = quota - len(promoted)
+        if len(front) <= left:
+            promoted += front
+        else:
+            if left > 0:
+                promoted += [front[round(k * (len(front) - 1) / max(left - 1, 1))] for k in range(left)]
+            break
+    return sorted(promoted)
+
+
+def rustomata_dev_adaptive_experiment(experiment):
+    # successive halving instead of the grid search of rustomata_dev, cf.
+    # ADAPTIVE_ETA; the configurations of a rung only parse the sentences
+    # that were not in the previous sample, and their scores and times are
+    # added to those of the previous rungs
+    # The results are stored in a table of the same form as the one of the
+    # grid search, in which the sentences column shows the size of the
+    # largest sample a configuration was evaluated on. Since the counts of
+    # the samples are added up, they are scored by evaluate.py regardless of
+    # SCORER.
+    experiment.prepare()
+    parameters = experiment.discodop_parameters("lcfrs", [0])
+    grammar = rustomata_grammar(experiment, "discodop", 0, parameters)
+    configurations = grid_configurations(experiment.configuration)
+    gold = experiment.path("splits", "test-0.export")
+    table = os.path.join(experiment.configuration["RESULTS"], "rustomata-ofcv-%s-adaptive.tsv" % experiment.corpus)
+    # EvalCounts and parse times (for each length) of the evaluated configurations
+    results = {}
+    # parse tasks of each configuration
+    parse_tasks = defaultdict(list)
+    cutoff = read_parameters(experiment.configuration["DISCODOP_EVAL"])["CUTOFF_LEN"]
+
+    def write_table(path):
+        rows = []
+        for configuration in configurations:
+            if configuration in results:
+                rows += grid_rows(configuration, results[configuration][0], results[configuration][1], cutoff)
+        write_grid_table(path, rows)
+
+    def sample(rung):
+        return experiment.path("splits", "test-0-sample-%d.sent" % rung)
+
+    def start(rung, candidates, rungs, dependencies):
+        # the tasks that parse the sample of a rung in each candidate
+        # configuration, and the task that promotes some of them
+        first = len(experiment.tasks)
+        files = [rustomata_configuration(experiment, grammar, configuration, sample(rung), gold, dependencies,
+                                         "%s-%d" % ("-".join(configuration), rung))
+                 for configuration in candidates]
+        experiment.add("promote-%d" % rung, lambda: finish(rung, candidates, rungs, files),
+                       ["parse-%s-%d" % ("-".join(configuration), rung) for configuration in candidates])
+        for (configuration, task) in zip(candidates, experiment.tasks[first:]):
+            parse_tasks[configuration].append(task)
+        return experiment.tasks[first:]
+
+    def finish(rung, candidates, rungs, files):
+        for (configuration, (counts, times, _)) in zip(candidates, files):
+            (total_counts, total_times) = results.setdefault(configuration, (EvalCounts(), defaultdict(list)))
+            total_counts.merge(EvalCounts.read(counts))
+            for (length, length_times) in read_times(times).items():
+                total_times[length].extend(length_times)
+        if rung + 1 == rungs:
+            write_table(table)
+            report()
+            return []
+        points = []
+        for configuration in candidates:
+            (counts, times) = results[configuration]
+            all_times = [time for length_times in times.values() for time in length_times]
+            points.append((float(scores(counts.totals(cutoff))["f-measure"]), median(all_times) if all_times else 0.0))
+        promoted = [candidates[i] for i in promote(points, -(-len(candidates) // ADAPTIVE_ETA))]
+        return start(rung + 1, promoted, rungs, ["promote-%d" % rung])
+
+    def prepare_samples():
+        with open(experiment.path("splits", "test-0.sent"), encoding="utf-8") as sentences:
+            sentences = [line.rstrip("\n") + "\n" for line in sentences if line.strip()]
+        rungs = 1
+        while ADAPTIVE_ETA ** rungs < len(configurations) \
+                and len(sentences) / ADAPTIVE_ETA ** rungs >= ADAPTIVE_MIN_SAMPLE:
+            rungs += 1
+        for (rung, increment) in enumerate(stratified_samples([len(s.split()) - 1 for s in sentences],
+                                                               ADAPTIVE_ETA, rungs)):
+            with open(sample(rung), "w", encoding="utf-8") as sample_file:
+                sample_file.writelines(sentences[index] for index in increment)
+        return start(0, configurations, rungs, ["samples"])
+
+    def report():
+        # parsed sentences, CPU time of the parse tasks (which also unbinarize
+        # and evaluate the parses) and parse time as printed by rustomata,
+        # compared to the grid search; the CPU time and parse time of the grid
+        # search are estimated by those per sentence of each configuration
+        total = sum(counts.totals()["sentences"] for (counts, _) in results.values())
+        sentences = max(counts.totals()["sentences"] for (counts, _) in results.values())
+        (cpu_time, grid_cpu_time, parse_time, grid_time) = (0.0, 0.0, 0.0, 0.0)
+        for (configuration, (counts, times)) in results.items():
+            share = sentences / max(counts.totals()["sentences"], 1)
+            configuration_cpu_time = sum(task.cpu_time for task in parse_tasks[configuration])
+            configuration_time = sum(map(sum, times.values()))
+            cpu_time += configuration_cpu_time
+            grid_cpu_time += configuration_cpu_time * share
+            parse_time += configuration_time
+            grid_time += configuration_time * share
+        print("adaptive search: %d of the %d sentences of the grid search parsed (%.1f%%)"
+              % (total, sentences * len(configurations), 100.0 * total / max(sentences * len(configurations), 1)))
+        print("adaptive search: %.1fs CPU time of the parse tasks, the grid search takes an estimated %.1fs (%.1f%%)"
+              % (cpu_time, grid_cpu_time, 100.0 * cpu_time / max(grid_cpu_time, 1e-9)))
+        print("adaptive search: %.1fs parse time, the grid search takes an estimated %.1fs (%.1f%%)"
+              % (parse_time / 1000, grid_time / 1000, 100.0 * parse_time / max(grid_time, 1e-9)), flush=True)
+
+    experiment.add("samples", prepare_samples, ["split", "grammar-0"])
+    experiment.partial_results = lambda environment, done: write_table(table + ".partial")
+
+
+EXPERIMENTS = { "rparse": (rparse_experiment, None), "gf": (gf_experiment, None),
+                "discodop": (discodop_experiment, ["dop", "ctf", "lcfrs"]),
+                "rustomata": (rustomata_experiment, ["vanda", "discodop"]),
+                "rustomata_dev": (rustomata_dev_experiment, None) }
+
+
+if __name__ == "__main__":
+    help = """use %s (rustomata|gf|rparse|discodop|rustomata_dev) <corpus> [<additional parser argument>] [OPTIONS]
+              where OPTIONS is some combination of
+                --cores=N   (default: CORES in the configuration, 0 uses all available cores)
+                --search=(grid*|adaptive) (search of rustomata_dev)
+                --help""" %sys.argv[0]
+
+    arguments = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    if "--help" in sys.argv:
+        print(help)
+        exit(0)
+    assert len(arguments) in [2, 3] and arguments[0] in EXPERIMENTS and os.path.isfile(arguments[1]), help
+    (define, choices) = EXPERIMENTS[arguments[0]]
+    if choices and (len(arguments) != 3 or arguments[2] not in choices):
+        print("Missing or wrong argument. Choose either of the following: %s." % ", ".join('"%s"' % c for c in choices))
+        exit(1)
+
+    if not os.path.isfile(CONFIGURATION_FILES[1]):
+        print("experiments.conf not present, using defaults in templates/experiments.conf.example", file=sys.stderr)
+    configuration = read_configuration()
+    options = { "cores": configuration["CORES"] or "0", "search": "grid" }
+    for arg in sys.argv[1:]:
+        match = re.match(r"^--([^=]+)=(.*)$", arg)
+        if match and match.group(1) in options:
+            options[match.group(1)] = match.group(2)
+    available = len(os.sched_getaffinity(0))
+    cores = int(options["cores"]) or available
+    if cores > available:
+        print("using the %d available cores instead of %d" % (available, cores), file=sys.stderr)
+        cores = available
+    if arguments[0] == "rustomata_dev" and options["search"] == "adaptive":
+        define = rustomata_dev_adaptive_experiment
+
+    experiment = Experiment(configuration, arguments[1])
+    for folder in ["splits", "grammars", "results"]:
+        os.makedirs(experiment.path(folder), exist_ok=True)
+    os.makedirs(configuration["RESULTS"], exist_ok=True)
+    define(experiment, *arguments[2:])
+
+    environment = dict(os.environ)
+    environment.update((name, " ".join(value) if name in ARRAYS else value) for (name, value) in configuration.items())
+    (done, failed, skipped) = run_tasks(experiment.tasks, cores, environment)
+    if failed:
+        if experiment.partial_results:
+            experiment.partial_results(environment, done)
+        print("failed: %s, not run: %d tasks" % (" ".join(failed), len(skipped)), file=sys.stderr)
+        exit(1)
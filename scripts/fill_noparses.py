@@ -6,18 +6,21 @@
 if __name__ == "__main__":
     import re
     from sys import argv, stdin
+    from panda.corpus_index import SentenceIndex
 
     assert len(argv) == 2, "use %s <test sentences> < <predicted parse trees> > <predicted parse trees with noparse>" %argv[0]
 
     bos = re.compile(r"""^#BOS (\d+)""")
     sentence = re.compile(r"""^(\d+)\s+(.*)$""")
     word_pos = re.compile(r"""([^\s]+)/([^\s/]+)""")
+    index = SentenceIndex(argv[1])
+    # the ids are compared as numbers (e.g. "007" is sentence 7), and of
+    # sentences with the same id, the last one in the file is taken
     sentences = {}
-    with open(argv[1]) as sentence_file:
-        for line in sentence_file:
-            if line.strip():
-                sentence_id, words = sentence.match(line).group(1, 2)
-                sentences[int(sentence_id)] = word_pos.findall(words)
+    for name in index.names():
+        for entry in index.entries(name):
+            if int(name) not in sentences or entry[0] > sentences[int(name)][0]:
+                sentences[int(name)] = entry
     
     last_prediction = -1
     for line in stdin:
@@ -27,7 +30,8 @@ if __name__ == "__main__":
             while target > last_prediction + 1:
                 if (last_prediction + 1) in sentences:
                     print("#BOS %d" %(last_prediction + 1))
-                    for (word, pos) in sentences[last_prediction + 1]:
+                    words = sentence.match(index.read(*sentences[last_prediction + 1][:2]).decode("utf-8")).group(2)
+                    for (word, pos) in word_pos.findall(words):
                         print("%s\t%s\t--\t--\t500" %(word, pos))
                     print("#500\tNOPARSE\t--\t--\t0")
                     print("#EOS %d" %(last_prediction + 1))
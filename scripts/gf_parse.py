@@ -0,0 +1,343 @@
+# Parses the sentences of a file (one per line, escaped by gf-escapes.sed)
+# with grammatical framework and prints the first parse tree of each
+# sentence and its parse time to stdout in the same form as the former
+# shell function gf_with_timeout, i.e. as read by parse_gf_output.py. With
+# --sentences=<sentence file>, the parse trees are converted in the same
+# process and printed in export format to stdout and the parse times to
+# stderr, like by parse_gf_output.py.
+#
+# The sentences are distributed to a number of gf shells that run in
+# parallel and load the grammar only once. gf prints the visualizations of
+# all parse trees of a sentence; as soon as the first one is complete, the
+# parse time is taken and the shell is interrupted unless it has already
+# completed the command. The parse time of every sentence is the wall clock
+# time until its first parse tree or, if it has none, until gf completed the
+# command (cf. GFShell.parse). If a sentence is not parsed within the
+# timeout, its shell is killed and replaced by a new one, and "TIMEOUT>" and
+# the timeout in msec are printed for the sentence. A shell that exited,
+# e.g. by an interrupt that arrived after the command was completed, is
+# replaced before the next sentence.
+
+import codecs
+import os
+import pty
+import queue
+import re
+import shlex
+import signal
+import subprocess
+import sys
+import termios
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from time import monotonic
+
+# gf's prompt, which is printed without a line break while gf waits for the
+# next command
+prompt = re.compile(r"^[^\s>]+>\s*$")
+# gf prints the time of each command after its output
+time_line = re.compile(r"^\d+ msec$", re.MULTILINE)
+# seconds to wait for the prompt after a shell was interrupted, it is
+# replaced by a new one if the prompt does not appear
+interrupt_grace = 1.0
+
+
+def read_chunks(fd, chunks):
+    # puts the decoded output read from fd into the queue chunks, and None
+    # at its end
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    try:
+        data = os.read(fd, 1 << 16)
+        while data:
+            chunks.put(decoder.decode(data))
+            data = os.read(fd, 1 << 16)
+    except OSError:
+        # reading the master side of a pseudo terminal fails after the
+        # process has exited
+        pass
+    os.close(fd)
+    chunks.put(None)
+
+
+class GFShell:
+    # a gf shell with a grammar loaded; its output is read by a separate
+    # thread such that waiting for it can time out
+
+    def __init__(self, command, grammar):
+        # the output is written to a pseudo terminal, otherwise gf buffers it
+        # until it exits
+        (master, slave) = pty.openpty()
+        attributes = termios.tcgetattr(slave)
+        attributes[1] &= ~termios.OPOST
+        termios.tcsetattr(slave, termios.TCSANOW, attributes)
+        self.process = subprocess.Popen(command + [grammar], stdin=subprocess.PIPE, stdout=slave,
+                                        universal_newlines=True, start_new_session=True)
+        os.close(slave)
+        self.chunks = queue.Queue()
+        threading.Thread(target=read_chunks, args=(master, self.chunks), daemon=True).start()
+        self.output = ""
+        self.alive = True
+        # the prompt is taken from the end of gf's banner
+        self.prompt = None
+        try:
+            self.__skip_to_prompt(None)
+        except EOFError as error:
+            raise RuntimeError(str(error))
+
+    def __read(self, deadline):
+        # appends the next output of gf to self.output, raises queue.Empty if
+        # there is none before the deadline or the deadline has passed (gf
+        # may print faster than its output is processed) and EOFError if gf
+        # has exited
+        remaining = None if deadline is None else deadline - monotonic()
+        if remaining is not None and remaining <= 0:
+            raise queue.Empty
+        self.__append(self.chunks.get(timeout=remaining))
+
+    def __append(self, chunk):
+        if chunk is None:
+            self.alive = False
+            raise EOFError("gf exited with code %d" % self.process.wait())
+        self.output += chunk
+
+    def __next_line(self, deadline):
+        while "\n" not in self.output:
+            self.__read(deadline)
+        (line, self.output) = self.output.split("\n", 1)
+        return line
+
+    def __read_available(self):
+        # appends the output of gf that arrived so far to self.output without
+        # waiting for more (gf may still be printing parse trees)
+        for _ in range(self.chunks.qsize()):
+            self.__append(self.chunks.get_nowait())
+
+    def __strip_prompt(self, line):
+        # removes prompts from the start of a line, e.g. a stray prompt that
+        # gf printed when an interrupt arrived after the command had completed
+        prompt_text = self.prompt.strip() if self.prompt else ""
+        while prompt_text and line.startswith(prompt_text):
+            line = line[len(prompt_text):].strip()
+        return line
+
+    def __skip_to_prompt(self, deadline):
+        # discards the output up to the next prompt
+        while True:
+            self.output = self.output.split("\n")[-1]
+            if self.output == self.prompt or (self.prompt is None and prompt.match(self.output)):
+                (self.prompt, self.output) = (self.output, "")
+                return
+            self.__read(deadline)
+
+    def parse(self, sentence, timeout):
+        # parses a sentence and returns the lines of its first parse tree in
+        # dot format (or None and the first line of gf's output if it was not
+        # parsed) and the parse time in msec, or None if the sentence was not
+        # parsed within timeout seconds; raises BrokenPipeError if the shell
+        # exited before it started to parse the sentence
+        #
+        # The parse time is always the wall clock time from writing the
+        # command until the first parse tree was read or, if the sentence was
+        # not parsed, until the time line of gf was read. It includes passing
+        # the command and the output through the pipe and the pseudo terminal.
+        # The time that gf prints is not used, since gf does not print it if
+        # the command is interrupted after the first parse tree, and both
+        # clocks must not be mixed.
+        self.__discard_output()
+        try:
+            self.process.stdin.write("p \"%s\" | vp\n" % sentence)
+            self.process.stdin.flush()
+        except BrokenPipeError:
+            self.alive = False
+            raise
+
+        start = monotonic()
+        deadline = start + timeout
+        graph = []
+        depth = 0
+        message = None
+        try:
+            while True:
+                line = self.__strip_prompt(self.__next_line(deadline).strip())
+                if graph or line == "graph {":
+                    graph.append(line)
+                    if line.startswith("graph {") or line.startswith("subgraph {"):
+                        depth += 1
+                    elif line == "}":
+                        depth -= 1
+                        if depth == 0:
+                            break
+                elif time_line.match(line):
+                    graph = None
+                    break
+                elif message is None and line:
+                    message = line
+            time = int((monotonic() - start) * 1000)
+            if graph is None:
+                self.__skip_to_prompt(deadline)
+            else:
+                self.__read_available()
+                if time_line.search(self.output) or self.output.split("\n")[-1] == self.prompt:
+                    # gf completed the command before it was interrupted,
+                    # e.g. since the sentence has only one parse tree
+                    self.__skip_to_prompt(deadline)
+                else:
+                    # stops the visualization of the remaining parse trees
+                    os.kill(self.process.pid, signal.SIGINT)
+                    deadline = min(deadline, monotonic() + interrupt_grace)
+                    self.__skip_to_prompt(deadline)
+        except queue.Empty:
+            # the shell is replaced, the first parse tree is kept if it was
+            # complete
+            self.kill()
+            return (graph, None, time) if graph and depth == 0 else None
+        except EOFError as error:
+            if graph is None or (graph and depth == 0):
+                return (graph, message, time)
+            if graph == [] and message is None:
+                # gf exited before it printed anything for the command, e.g.
+                # by an interrupt that arrived after the former command
+                raise BrokenPipeError(str(error))
+            raise RuntimeError(str(error))
+        return (graph, message, time)
+
+    def __discard_output(self):
+        # discards the output that was left from the former command, e.g. a
+        # stray prompt, and marks the shell as dead if it exited
+        try:
+            self.__read_available()
+        except EOFError:
+            pass
+        self.output = ""
+        if self.process.poll() is not None:
+            self.alive = False
+        if not self.alive:
+            raise BrokenPipeError("gf exited with code %d" % self.process.wait())
+
+    def kill(self):
+        # gf runs in its own process group, which also contains the commands
+        # it started
+        self.alive = False
+        try:
+            os.killpg(self.process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        self.process.wait()
+
+    def stop(self):
+        if self.process.poll() is None:
+            try:
+                self.process.stdin.close()
+                self.process.wait(1)
+            except (OSError, subprocess.TimeoutExpired):
+                self.kill()
+
+
+def parse_sentences(sentences, command, grammar, timeout, workers):
+    # yields the result of GFShell.parse for each sentence (in the given
+    # order), the sentences are parsed by `workers` gf shells in parallel
+    idle = queue.Queue()
+    for _ in range(workers):
+        idle.put(None)
+    shells = []
+    lock = threading.Lock()
+    failed = threading.Event()
+
+    def start():
+        shell = GFShell(command, grammar)
+        with lock:
+            shells.append(shell)
+        return shell
+
+    def parse(sentence):
+        if failed.is_set():
+            raise RuntimeError("another gf shell failed")
+        shell = idle.get()
+        try:
+            if shell is None:
+                shell = start()
+            try:
+                result = shell.parse(sentence, timeout)
+            except BrokenPipeError:
+                # the shell exited after its former command, the sentence is
+                # parsed by a new one (once, a second failure is an error)
+                shell.kill()
+                shell = None
+                shell = start()
+                try:
+                    result = shell.parse(sentence, timeout)
+                except BrokenPipeError as error:
+                    raise RuntimeError(str(error))
+            if not shell.alive:
+                shell.kill()
+                shell = None
+            return result
+        except Exception:
+            failed.set()
+            raise
+        finally:
+            idle.put(shell)
+
+    try:
+        with ThreadPoolExecutor(workers) as executor:
+            for result in executor.map(parse, sentences):
+                yield result
+    finally:
+        failed.set()
+        for shell in shells:
+            shell.stop()
+
+
+def gf_output(result, timeout):
+    # the lines that gf_with_timeout printed for the result of GFShell.parse
+    if result is None:
+        return ["TIMEOUT>", "%s000 msec" % timeout]
+    (graph, message, time) = result
+    if graph is not None:
+        return ["%;;%".join(graph), "%d msec" % time]
+    return ([] if message is None else [message]) + ["%d msec" % time]
+
+
+if __name__ == "__main__":
+    help = """use %s <GF GRAMMAR> <SENTENCE FILE> [OPTIONS]
+              where OPTIONS is some combination of
+                --gf=COMMAND        (default: gf -cshell)
+                --timeout=SECONDS   (default: 30)
+                --workers=N         (default: 0, i.e. one for each available core)
+                --sentences=FILE    (sentence file with ids and tags)
+                --help""" %sys.argv[0]
+
+    arguments = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    if "--help" in sys.argv:
+        print(help)
+        exit(0)
+    assert len(arguments) == 2, help
+
+    options = { "gf": "gf -cshell", "timeout": "30", "workers": "0", "sentences": "" }
+    for arg in sys.argv[1:]:
+        match = re.match(r"^--([^=]+)=(.*)$", arg)
+        if match and match.group(1) in options:
+            options[match.group(1)] = match.group(2)
+    workers = int(options["workers"]) or len(os.sched_getaffinity(0))
+
+    (grammar, sentence_file) = arguments
+    with open(sentence_file) as sentences:
+        # like `read`, without leading and trailing whitespace
+        sentences = [line.strip() for line in sentences]
+    results = parse_sentences(sentences, shlex.split(options["gf"]), grammar, float(options["timeout"]), workers)
+
+    if options["sentences"]:
+        from parse_gf_output import read_sentences, write_parse
+        (ids, tagged) = read_sentences(options["sentences"])
+        assert len(ids) == len(sentences), "the sentence files differ in length"
+        for (index, result) in enumerate(results):
+            if result is None:
+                write_parse(None, "%s000 ms" % options["timeout"], tagged[index], ids[index])
+            else:
+                write_parse(result[0], "%d ms" % result[2], tagged[index], ids[index])
+            sys.stdout.flush()
+    else:
+        for result in results:
+            for line in gf_output(result, options["timeout"]):
+                print(line)
+            sys.stdout.flush()
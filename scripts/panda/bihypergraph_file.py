@@ -0,0 +1,180 @@
+"""Binary layout of a corpus of bihypergraphs as produced by negra_parse.negra_to_json: per-sentence node and edge
+counts, the attachments of all edges as int32 CSR and their label ids as an int32 vector. The file can be mapped into
+memory by training tools without parsing JSON."""
+from __future__ import print_function, unicode_literals
+
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+from array import array
+
+# For each sentence s, its edges are numbered consecutively: the edges of G1, of G2 and the alignment edges, with
+# ids 0 … g1_edges[s] + g2_edges[s] + alignments[s] - 1 as in the JSON form. They are the rows sentence_edge_ptr[s] …
+# sentence_edge_ptr[s + 1] - 1 of edge_label and attachment_ptr, and edge e attaches to the nodes attachment[
+# attachment_ptr[e]] … attachment[attachment_ptr[e + 1] - 1]. The nodes of G1 are 0 … g1_nodes[s] - 1, those of G2
+# follow. The edges of G1 and G2 are terminal edges, the alignment edges have label -1.
+ARRAYS = [
+    # number of nodes and edges of G1 and G2 and number of alignment edges of each sentence
+    'g1_nodes', 'g1_edges', 'g2_nodes', 'g2_edges', 'alignments',
+    # the two ports of G1 and G2 of each sentence
+    'g1_ports', 'g2_ports',
+    # label id and attachment of each edge
+    'sentence_edge_ptr', 'edge_label', 'attachment_ptr', 'attachment'
+]
+
+FILE_MAGIC = b'BHGC'
+FILE_VERSION = 1
+# magic, version, number of sentences, alignment label, nonterminal edge label
+FILE_HEADER = struct.Struct('<4sIQii')
+# number of entries of an array
+FILE_ARRAY_HEADER = struct.Struct('<Q')
+# number of entries buffered per array before they are spilled to disk
+_BUFFER_SIZE = 1 << 16
+
+
+def _padding(length):
+    return b'\0' * (-length % 8)
+
+
+class _SpilledArray:
+    """An int32 array that is appended to in memory and spilled to a temporary file in chunks."""
+    __slots__ = ['buffer', 'file', 'length']
+
+    def __init__(self, initial=()):
+        self.buffer = array('i', initial)
+        self.file = tempfile.TemporaryFile()
+        self.length = 0
+
+    def extend(self, values):
+        self.buffer.extend(values)
+        if len(self.buffer) >= _BUFFER_SIZE:
+            self.flush()
+
+    def flush(self):
+        self.length += len(self.buffer)
+        self.buffer.tofile(self.file)
+        del self.buffer[:]
+
+    def copy_to(self, out):
+        self.flush()
+        out.write(FILE_ARRAY_HEADER.pack(self.length))
+        self.file.seek(0)
+        shutil.copyfileobj(self.file, out)
+        out.write(_padding(4 * self.length))
+        self.file.close()
+
+
+def write_bihypergraphs(bihypergraphs, path, alignment_label, nonterminal_edge_label):
+    """
+    Each array is spilled to its own temporary file while the bihypergraphs are consumed, so only one of them is held
+    in memory at a time.
+    :param bihypergraphs: bihypergraphs in the form of negra_parse.negra_to_json
+    :type bihypergraphs: Iterable[dict]
+    :param path: file to store the corpus in, it is replaced atomically
+    :type path: str
+    :type alignment_label: int
+    :type nonterminal_edge_label: int
+    :return: the number of sentences
+    :rtype: int
+    """
+    arrays = {name: _SpilledArray([0] if name.endswith('_ptr') else []) for name in ARRAYS}
+    n_sentences = 0
+    n_edges = 0
+    n_attachments = 0
+    for data in bihypergraphs:
+        g1, g2, alignment = data['G1'], data['G2'], data['alignment']
+        for (name, value) in [('g1_nodes', len(g1['nodes'])), ('g1_edges', len(g1['edges'])),
+                              ('g2_nodes', len(g2['nodes'])), ('g2_edges', len(g2['edges'])),
+                              ('alignments', len(alignment))]:
+            arrays[name].extend((value,))
+        arrays['g1_ports'].extend(g1['ports'])
+        arrays['g2_ports'].extend(g2['ports'])
+        first = n_edges
+        for edges in [g1['edges'], g2['edges'], alignment]:
+            for edge in edges:
+                if edge['id'] != n_edges - first:
+                    raise ValueError("the edges of sentence %d are not numbered consecutively" % n_sentences)
+                n_edges += 1
+                n_attachments += len(edge['attachment'])
+                arrays['edge_label'].extend((edge['label'],))
+                arrays['attachment'].extend(edge['attachment'])
+                arrays['attachment_ptr'].extend((n_attachments,))
+        arrays['sentence_edge_ptr'].extend((n_edges,))
+        n_sentences += 1
+
+    tmp = path + '.%d.tmp' % os.getpid()
+    with open(tmp, 'wb') as out:
+        out.write(FILE_HEADER.pack(FILE_MAGIC, FILE_VERSION, n_sentences, alignment_label, nonterminal_edge_label))
+        out.write(_padding(FILE_HEADER.size))
+        for name in ARRAYS:
+            arrays[name].copy_to(out)
+    os.replace(tmp, path)
+    return n_sentences
+
+
+class BihypergraphCorpus:
+    """
+    A corpus that was written by write_bihypergraphs, mapped into memory. The arrays (cf. ARRAYS) are read-only views
+    into the file.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as binary:
+            data = mmap.mmap(binary.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, n_sentences, self.alignment_label, self.nonterminal_edge_label \
+            = FILE_HEADER.unpack_from(data, 0)
+        if magic != FILE_MAGIC or version != FILE_VERSION:
+            raise ValueError("%s is not a bihypergraph corpus of version %d" % (path, FILE_VERSION))
+        self.__length = n_sentences
+        offset = FILE_HEADER.size + len(_padding(FILE_HEADER.size))
+        view = memoryview(data)
+        for name in ARRAYS:
+            length, = FILE_ARRAY_HEADER.unpack_from(data, offset)
+            offset += FILE_ARRAY_HEADER.size
+            setattr(self, name, view[offset:offset + 4 * length].cast('i'))
+            offset += 4 * length + len(_padding(4 * length))
+
+    def __len__(self):
+        return self.__length
+
+    def bihypergraph(self, s):
+        """
+        :param s: index of a sentence
+        :type s: int
+        :return: the sentence in the form of negra_parse.negra_to_json
+        :rtype: dict
+        """
+        first = self.sentence_edge_ptr[s]
+
+        def edges(start, count, terminal=True):
+            result = []
+            for e in range(first + start, first + start + count):
+                edge = {'id': e - first,
+                        'label': self.edge_label[e],
+                        'attachment': self.attachment[self.attachment_ptr[e]:self.attachment_ptr[e + 1]].tolist()}
+                if terminal:
+                    edge['terminal'] = True
+                result.append(edge)
+            return result
+
+        g1_nodes, g1_edges = self.g1_nodes[s], self.g1_edges[s]
+        g2_nodes, g2_edges = self.g2_nodes[s], self.g2_edges[s]
+        return {'type': 'bihypergraph',
+                'G1': {'type': 'hypergraph',
+                       'nodes': list(range(g1_nodes)),
+                       'edges': edges(0, g1_edges),
+                       'ports': self.g1_ports[2 * s:2 * s + 2].tolist()},
+                'G2': {'type': 'hypergraph',
+                       'nodes': list(range(g1_nodes, g1_nodes + g2_nodes)),
+                       'edges': edges(g1_edges, g2_edges),
+                       'ports': self.g2_ports[2 * s:2 * s + 2].tolist()},
+                'alignment': edges(g1_edges + g2_edges, self.alignments[s], terminal=False)}
+
+    def bihypergraphs(self):
+        for s in range(len(self)):
+            yield self.bihypergraph(s)
+
+
+__all__ = ["write_bihypergraphs", "BihypergraphCorpus"]
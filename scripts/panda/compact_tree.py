@@ -0,0 +1,520 @@
+"""Read-only, array-backed variant of HybridTree with the same query interface. The nodes of a tree are numbered by
+rows and all strings (node ids, sentence names and token fields) are stored in a label table that is shared by the trees
+of a corpus."""
+from __future__ import print_function, unicode_literals
+
+from array import array
+
+from .general_hybrid_tree import spans_of_mask
+from .monadic_tokens import ConstituentCategory, ConstituentTerminal, shared_constituent_category
+
+NONE = -1
+
+# columns of CompactHybridTree._nodes, one row per node
+ID, TERMINAL, LABEL, POS, EDGE, LEMMA, PARENT, POSITION, FULL_POSITION = range(9)
+N_COLUMNS = 9
+
+
+class LabelTable:
+    """
+    Interned strings that are referred to by their index.
+    """
+    __slots__ = ('labels', '_index')
+
+    def __init__(self):
+        self.labels = []
+        self._index = {}
+
+    def __len__(self):
+        return len(self.labels)
+
+    def index(self, string):
+        """
+        :param string: some string or None
+        :type string: str
+        :return: index of the string, it is added if necessary
+        :rtype: int
+        """
+        if string is None:
+            return NONE
+        index = self._index.get(string)
+        if index is None:
+            index = len(self.labels)
+            self.labels.append(string)
+            self._index[string] = index
+        return index
+
+    def __getitem__(self, index):
+        return None if index == NONE else self.labels[index]
+
+
+class CompactHybridTree:
+    """
+    A HybridTree whose nodes, tokens and parent-child relation are stored in three integer arrays:
+     * _nodes: N_COLUMNS entries per node (in the order of HybridTree.nodes()), cf. ID … FULL_POSITION,
+     * _children: offsets of the children of each node and the virtual root (which has row n), followed by the child
+       rows (CSR), and
+     * _yield: the rows of id_yield() followed by the rows of full_yield().
+    Trees cannot be modified except by reorder(). Tokens are created on request, terminals with morphological features
+    are not supported.
+    """
+    __slots__ = ('_labels', '_name', '_nodes', '_children', '_yield', '_n_ordered', '_rows', '_span_table')
+
+    @property
+    def virtual_root(self):
+        return 'VROOT'
+
+    def __init__(self, tree, labels=None):
+        """
+        :param tree: tree to copy
+        :type tree: HybridTree
+        :param labels: label table shared by the trees of a corpus
+        :type labels: LabelTable
+        """
+        self._labels = labels = LabelTable() if labels is None else labels
+        self._name = tree.sent_label()
+        self._rows = None
+        self._span_table = None
+        label = labels.index
+
+        node_ids = list(tree.nodes())
+        rows = {node: row for row, node in enumerate(node_ids)}
+        n = len(node_ids)
+        rows[tree.virtual_root] = n
+        positions = {node: position for position, node in enumerate(tree.id_yield())}
+        full_positions = {node: position for position, node in enumerate(tree.full_yield())}
+
+        nodes = array('i')
+        for node in node_ids:
+            token = tree.node_token(node)
+            if isinstance(token, ConstituentTerminal):
+                if token.morph_feats():
+                    raise ValueError("terminals with morphological features are not supported")
+                columns = [1, label(token.form()), label(token.pos()), label(token.edge()), label(token.lemma())]
+            elif isinstance(token, ConstituentCategory):
+                columns = [0, label(token.category()), NONE, label(token.edge()), NONE]
+            else:
+                raise ValueError("only constituent tokens are supported")
+            nodes.append(label(node))
+            nodes.extend(columns)
+            nodes.append(rows.get(tree._parent.get(node), NONE))
+            nodes.append(positions.get(node, NONE))
+            nodes.append(full_positions.get(node, NONE))
+        self._nodes = nodes
+
+        child_ptr = [0]
+        child_rows = []
+        for node in node_ids + [tree.virtual_root]:
+            child_rows.extend(rows[child] for child in tree.children(node))
+            child_ptr.append(len(child_rows))
+        self._children = array('i', child_ptr + child_rows)
+
+        self._n_ordered = len(positions)
+        self._yield = array('i', [rows[node] for node in tree.id_yield()] + [rows[node] for node in tree.full_yield()])
+
+    # rows and ids
+
+    def __len__(self):
+        return len(self._nodes) // N_COLUMNS
+
+    def _row(self, id):
+        """
+        :return: row of node id (n for the virtual root), or None
+        :rtype: int
+        """
+        if self._rows is None:
+            labels = self._labels.labels
+            nodes = self._nodes
+            self._rows = {labels[nodes[row * N_COLUMNS + ID]]: row for row in range(len(self))}
+            self._rows[self.virtual_root] = len(self)
+        return self._rows.get(id)
+
+    def _id(self, row):
+        if row == len(self):
+            return self.virtual_root
+        return self._labels.labels[self._nodes[row * N_COLUMNS + ID]]
+
+    def _column(self, row, column):
+        return self._nodes[row * N_COLUMNS + column]
+
+    def _child_rows(self, row):
+        n = len(self)
+        children = self._children
+        return children[n + 2 + children[row]:n + 2 + children[row + 1]]
+
+    def _preorder(self, row):
+        """
+        :return: rows of the subtree below row in pre-order, including row
+        :rtype: list[int]
+        """
+        base = len(self) + 2
+        children = self._children
+        order = []
+        stack = [row]
+        while stack:
+            row = stack.pop()
+            order.append(row)
+            first, last = children[row], children[row + 1]
+            if last > first:
+                stack.extend(reversed(children[base + first:base + last]))
+        return order
+
+    def _positions(self, rows):
+        """
+        :return: positions in the ordering of those rows that are in the ordering
+        :rtype: list[int]
+        """
+        n = len(self)
+        nodes = self._nodes
+        positions = [nodes[row * N_COLUMNS + POSITION] for row in rows if row < n]
+        return [position for position in positions if position != NONE]
+
+    def _in_ordering(self, row):
+        return row < len(self) and self._column(row, POSITION) != NONE
+
+    # interface of HybridTree
+
+    def sent_label(self):
+        """
+        :rtype: str
+        :return: name of the sentence
+        """
+        return self._name
+
+    @property
+    def root(self):
+        """
+        :rtype: list of str
+        :return: Id of root.
+        """
+        return self.children(self.virtual_root)
+
+    def nodes(self):
+        """
+        :return: ids of all nodes.
+        :rtype: list[str]
+        """
+        return [self._id(row) for row in range(len(self))]
+
+    def node_token(self, id):
+        """
+        :param id: node id
+        :type id: str
+        :return: token at node id (a new object for each call for terminals, categories are shared and read-only)
+        :rtype: MonadicToken
+        """
+        row = self._row(id)
+        if row is None or row == len(self):
+            raise KeyError(id)
+        offset = row * N_COLUMNS
+        terminal, label, pos, edge, lemma = self._nodes[offset + TERMINAL:offset + PARENT]
+        labels = self._labels
+        if terminal:
+            return ConstituentTerminal(labels[label], labels[pos], labels[edge], None, labels[lemma])
+        return shared_constituent_category(labels[label], labels[edge])
+
+    def parent(self, id):
+        """
+        :rtype: str
+        :param id: node id
+        :type id: str
+        :return: id of parent node, or None.
+        """
+        row = self._row(id)
+        if row is None or row == len(self):
+            return None
+        parent = self._column(row, PARENT)
+        if parent == NONE or parent == len(self):
+            return None
+        return self._id(parent)
+
+    def children(self, id):
+        """
+        :rtype: list[str]
+        :param id: str
+        :return: Get the list of node ids of child nodes, or the empty list.
+        """
+        row = self._row(id)
+        if row is None:
+            return []
+        return [self._id(child) for child in self._child_rows(row)]
+
+    def descendants(self, id):
+        """
+        :param id: node id
+        :type id: str
+        :return: the list of node ids of all "transitive" children
+        :rtype: list[str]
+        """
+        row = self._row(id)
+        if row is None:
+            return []
+        return [self._id(descendant) for descendant in self._preorder(row)[1:]]
+
+    def reentrant(self):
+        """
+        :rtype: bool
+        :return: Is there node that is child of two nodes?
+        """
+        child_rows = self._children[len(self) + 2:]
+        return len(set(child_rows)) < len(child_rows)
+
+    def in_ordering(self, id):
+        """
+        :param id: node id
+        :type id: str
+        :return: Is the node in the ordering?
+        :rtype: bool
+        """
+        row = self._row(id)
+        return row is not None and self._in_ordering(row)
+
+    def disconnected(self, id):
+        """
+        :param id: node id
+        :type id: str
+        :return: Is the node in the yield, but not connected to the root?
+        :rtype: bool
+        """
+        row = self._row(id)
+        return row is not None and row < len(self) and self._column(row, FULL_POSITION) != NONE \
+            and self._column(row, POSITION) == NONE
+
+    def index_node(self, index):
+        """
+        :param index: index in ordering (starting with 1)
+        :type index: int
+        :return: node id at index in ordering
+        :rtype: str
+        """
+        return self.id_yield()[index - 1]
+
+    def node_index(self, id):
+        """
+        :param id: node id
+        :type id: str
+        :return: index of node in ordering
+        :rtype: int
+        """
+        row = self._row(id)
+        if not (row is not None and self._in_ordering(row)):
+            raise ValueError("%s is not in the ordering" % id)
+        return self._column(row, POSITION)
+
+    def node_index_full(self, id):
+        """
+        :param id: node id
+        :type id: str
+        :return: index of node in full_yield
+        :rtype: int
+        """
+        row = self._row(id)
+        if row is None or row == len(self) or self._column(row, FULL_POSITION) == NONE:
+            raise ValueError("%s is not in the yield" % id)
+        return self._column(row, FULL_POSITION)
+
+    def id_yield(self):
+        """
+        :return: list of node ids that are in the ordering and connected to root
+        :rtype: list[str]
+        """
+        return [self._id(row) for row in self._yield[:self._n_ordered]]
+
+    def full_yield(self):
+        """
+        :return: list of node ids that are in the ordering (including disconnected nodes)
+        :rtype: list[str]
+        """
+        return [self._id(row) for row in self._yield[self._n_ordered:]]
+
+    def token_yield(self):
+        """
+        :return: Get yield as list of all labels of nodes, that are in the ordering and connected to the root.
+        :rtype: list[MonadicToken]
+        """
+        return [self.node_token(id) for id in self.id_yield()]
+
+    def full_token_yield(self):
+        """
+        :return: Get yield as list of labels of nodes, that are in the ordering (including disconnected nodes).
+        :rtype: list[MonadicToken]
+        """
+        return [self.node_token(id) for id in self.full_yield()]
+
+    def reorder(self):
+        """
+        Reorder children according to smallest node (w.r.t. ordering) in subtree.
+        """
+        self._span_table = None
+        n = len(self)
+        children = self._children
+        min_indices = [NONE] * (n + 1)
+        for row in reversed(self._preorder(n)):
+            first, last = n + 2 + children[row], n + 2 + children[row + 1]
+            candidates = list(children[first:last])
+            children[first:last] = array('i', sorted(candidates, key=lambda child: min_indices[child]))
+            indices = [min_indices[child] for child in candidates]
+            if self._in_ordering(row):
+                indices.append(self._column(row, POSITION))
+            # same as HybridTree.reorder, which lets a subtree without ordered nodes (-1) take precedence over the
+            # ones before it
+            min_index = NONE
+            for index in indices:
+                if min_index < 0 or index < min_index:
+                    min_index = index
+            min_indices[row] = min_index
+
+    def fringe(self, id):
+        """
+        :param id: node id
+        :type id: str
+        :return: indices (w.r.t. ordering) of all nodes under some node, cf. \\Pi^{-1} in paper
+        :rtype: list[int]
+        List of indices (w.r.t. ordering) obtained by pre-order traversal over the subtree starting at id.
+        """
+        row = self._row(id)
+        if row is None:
+            return []
+        return self._positions(self._preorder(row))
+
+    def _spans(self):
+        """
+        :return: the spans of each row (the virtual root is row n), computed from bit masks in one bottom-up pass and
+            memoized until reorder() is called
+        :rtype: list[list[tuple[int, int]]]
+        """
+        if self._span_table is not None:
+            return self._span_table
+        n = len(self)
+        base = n + 2
+        nodes = self._nodes
+        children = self._children
+        masks = [None] * (n + 1)
+        # nodes that are not connected to the virtual root are visited afterwards
+        for top in [n] + list(range(n)):
+            if masks[top] is not None:
+                continue
+            for row in reversed(self._preorder(top)):
+                position = nodes[row * N_COLUMNS + POSITION] if row < n else NONE
+                mask = 0 if position == NONE else 1 << position
+                for k in range(base + children[row], base + children[row + 1]):
+                    mask |= masks[children[k]]
+                masks[row] = mask
+        self._span_table = [spans_of_mask(mask) for mask in masks]
+        return self._span_table
+
+    def n_spans(self, id):
+        """
+        :param id: node id
+        :type id: str
+        :return: Number of contiguous spans of node.
+        :rtype : int
+        """
+        row = self._row(id)
+        if row is None:
+            return 0
+        return len(self._spans()[row])
+
+    def max_n_spans(self):
+        """
+        :return: Maximum number of spans of any node.
+        :rtype: int
+        """
+        spans = self._spans()
+        if len(self) > 0:
+            return max(len(spans[row]) for row in range(len(self)))
+        else:
+            return 1
+
+    def n_gaps(self):
+        """
+        :return: Total number of gaps in any node.
+        :rtype: int
+        """
+        spans = self._spans()
+        return sum(len(spans[row]) - 1 for row in self._preorder(len(self)))
+
+    def labelled_spans(self):
+        """
+        :return: list of spans (each of which is string plus an even number of (integer) positions)
+        Labelled spans.
+        """
+        spans_of_rows = self._spans()
+        labels = self._labels.labels
+        spans = []
+        for row in range(len(self)):
+            if self._column(row, FULL_POSITION) != NONE:
+                continue
+            span = [labels[self._column(row, LABEL)]]
+            for (low, high) in spans_of_rows[row]:
+                span += [low, high]
+            if len(span) >= 3:
+                spans += [span]
+        return sorted(spans, key=lambda x: [tuple(x[1:]), x[0]])
+
+    def complete(self):
+        """
+        :return: Does yield cover whole string?
+        :rtype: bool
+        """
+        return len(self.fringe(self.virtual_root)) == self._n_ordered
+
+    def n_nodes(self):
+        """
+        :return: Number of nodes in tree that are connected to the root (or the root itself).
+        :rtype: int
+        """
+        return len(self._preorder(len(self))) - 1
+
+    def empty_fringe(self):
+        """
+        :rtype: bool
+        Is there any non-ordered node without children?
+        Includes the case the root has no children.
+        """
+        for row in range(len(self)):
+            if not self._child_rows(row) and self._column(row, FULL_POSITION) == NONE:
+                return True
+        return len(self.fringe(self.virtual_root)) == 0
+
+    def siblings(self, id):
+        """
+        :param id: node id
+        :type id: str
+        :return: list of node ids
+        :rtype: list[str]
+        The siblings of id, i.e. the children of id's parent (including id),
+        ordered from left to right. If id is the root, then [root] is returned
+        """
+        if id in self.root:
+            return self.root
+        else:
+            parent = self.parent(id)
+            if not parent:
+                raise Exception('non-root node has no parent!')
+            return self.children(parent)
+
+    def __str__(self):
+        lines = []
+        for root in self._child_rows(len(self)):
+            stack = [(root, 0)]
+            while stack:
+                row, level = stack.pop()
+                lines.append(level * ' ' + str(self.node_token(self._id(row))) + '\n')
+                stack.extend((child, level + 1) for child in reversed(self._child_rows(row)))
+        return ''.join(lines)
+
+
+def compact_trees(trees, labels=None):
+    """
+    :param trees: trees of a corpus
+    :type trees: Iterable[HybridTree]
+    :param labels: label table to use for all trees
+    :type labels: LabelTable
+    :rtype: list[CompactHybridTree]
+    """
+    labels = LabelTable() if labels is None else labels
+    return [CompactHybridTree(tree, labels) for tree in trees]
+
+
+__all__ = ["CompactHybridTree", "LabelTable", "compact_trees"]
@@ -103,9 +103,10 @@ class ConstituentTree(HybridTree):
         Labelled spans.
         """
         spans = []
-        for id in [n for n in self.nodes() if n not in self.full_yield()]:
+        full_yield = set(self.full_yield())
+        for id in [n for n in self.nodes() if n not in full_yield]:
             span = [self.node_token(id).category()]
-            for (low, high) in join_spans(self.fringe(id)):
+            for (low, high) in self.spans(id):
                 span += [low, high]
             # TODO: this if-clause allows to handle trees, that have nodes with empty fringe
             if len(span) >= 3:
@@ -119,6 +120,7 @@ class ConstituentTree(HybridTree):
         if (len(self.root) == 1) and self.node_token(self.root[0]).type() == "CONSTITUENT-CATEGORY" and self.node_token(self.root[0]).category() == "VROOT":
             old_root = self.root[0]
             new_roots = self.children(old_root)
+            self._invalidate()
             self._id_to_child_ids[self.virtual_root] = new_roots
             for new_root in new_roots:
                 self._parent[new_root] = self.virtual_root
@@ -0,0 +1,319 @@
+"""Persistent offset indices for corpora in export format and sentence files (.sent) that allow random access to
+single sentences by their identifier."""
+from __future__ import print_function, unicode_literals
+
+import hashlib
+import mmap
+import os
+import re
+import struct
+
+INDEX_SUFFIX = '.idx'
+INDEX_MAGIC = b'RCIX'
+INDEX_VERSION = 3
+# magic, version, size and mtime (in ns) of the indexed file, number of entries
+INDEX_HEADER = struct.Struct('<4sIQqI')
+# byte offset, length, number of tokens, hash of token sequence
+INDEX_ENTRY = struct.Struct('<QIIQ')
+
+EXPORT_BOS = re.compile(br'^#BOS\s+([0-9]+)')
+EXPORT_EOS = re.compile(br'^#EOS\s+([0-9]+)')
+SENT_LINE = re.compile(br'^([0-9]+)\s+(.*)$')
+
+
+def token_hash(tokens):
+    """
+    :param tokens: sequence of words
+    :type tokens: Iterable[str|bytes]
+    :return: 64 bit hash of the token sequence that is stable between runs
+    :rtype: int
+    """
+    digest = hashlib.blake2b(digest_size=8)
+    for token in tokens:
+        digest.update(token if isinstance(token, bytes) else token.encode('utf-8'))
+        digest.update(b'\x1f')
+    return int.from_bytes(digest.digest(), 'little')
+
+
+def export_tokens(lines):
+    """
+    :param lines: lines of a sentence in export format (without #BOS and #EOS lines)
+    :type lines: Iterable[str|bytes]
+    :return: the words of the sentence, i.e. the first column of each terminal line
+    :rtype: list
+    """
+    words = []
+    for line in lines:
+        fields = line.split(None, 1)
+        if not fields:
+            continue
+        word = fields[0]
+        # skip comments and lines of inner nodes (#500 …), but not the word '#'
+        if word[:2] in ('%%', b'%%') or (word[:1] in ('#', b'#') and word[1:].isdigit()):
+            continue
+        words.append(word)
+    return words
+
+
+def sent_tokens(words):
+    """
+    :param words: space separated word/pos pairs of a line in a .sent file (without sentence id)
+    :type words: str|bytes
+    :return: the words of the sentence
+    :rtype: list
+    """
+    sep = b'/' if isinstance(words, bytes) else '/'
+    tokens = []
+    for pair in words.split():
+        (word, _, pos) = pair.rpartition(sep)
+        if word and pos:
+            tokens.append(word)
+    return tokens
+
+
+def _scan_export(data):
+    """
+    :type data: mmap.mmap|bytes
+    :return: generator of (name, offset, length, n_tokens, hash) for each #BOS … #EOS block
+    """
+    offset = 0
+    start = None
+    name = None
+    lines = []
+    while offset < len(data):
+        end = data.find(b'\n', offset)
+        end = len(data) if end < 0 else end + 1
+        line = data[offset:end]
+        match_bos = EXPORT_BOS.match(line)
+        if match_bos:
+            start, name, lines = offset, match_bos.group(1), []
+        elif start is not None:
+            match_eos = EXPORT_EOS.match(line)
+            if match_eos:
+                words = export_tokens(lines)
+                yield name.decode('ascii'), start, end - start, len(words), token_hash(words)
+                start = None
+            else:
+                lines.append(line)
+        offset = end
+
+
+def _scan_sent(data):
+    """
+    :type data: mmap.mmap|bytes
+    :return: generator of (name, offset, length, n_tokens, hash) for each line
+    """
+    offset = 0
+    while offset < len(data):
+        end = data.find(b'\n', offset)
+        end = len(data) if end < 0 else end
+        line = data[offset:end].rstrip(b'\r')
+        match = SENT_LINE.match(line)
+        if match:
+            words = sent_tokens(match.group(2))
+            # the entry excludes the line break, also on CRLF files
+            yield match.group(1).decode('ascii'), offset, len(line), len(words), token_hash(words)
+        offset = end + 1
+
+
+def _header_matches(data, stat):
+    """
+    :param data: contents of an index file
+    :type data: bytes
+    :param stat: result of os.stat for the indexed file
+    :return: Was the index built for the file in its current state?
+    :rtype: bool
+    """
+    if len(data) < INDEX_HEADER.size:
+        return False
+    magic, version, size, mtime, _ = INDEX_HEADER.unpack_from(data, 0)
+    return magic == INDEX_MAGIC and version == INDEX_VERSION and size == stat.st_size and mtime == stat.st_mtime_ns
+
+
+def index_is_current(path):
+    """
+    :param path: path to an export file or a .sent file
+    :type path: str
+    :return: Is there an index next to the file that is valid for its current size and modification time?
+    :rtype: bool
+    """
+    path = os.path.expanduser(path)
+    try:
+        stat = os.stat(path)
+        with open(path + INDEX_SUFFIX, 'rb') as sidecar:
+            return _header_matches(sidecar.read(INDEX_HEADER.size), stat)
+    except (IOError, OSError):
+        return False
+
+
+class SentenceIndex:
+    """
+    Maps sentence identifiers of a file in export format or of a .sent file to the position of the sentence in the
+    file. The index is persisted next to the file (with suffix .idx) and rebuilt whenever the size or modification
+    time of the file changes.
+    """
+
+    def __init__(self, path, persist=True):
+        """
+        :param path: path to an export file or a .sent file (decided by suffix)
+        :type path: str
+        :param persist: store the index next to the file if it was (re)built
+        :type persist: bool
+        """
+        self.path = os.path.expanduser(path)
+        self.sidecar = self.path + INDEX_SUFFIX
+        self.__file = open(self.path, 'rb')
+        stat = os.fstat(self.__file.fileno())
+        self.__data = mmap.mmap(self.__file.fileno(), 0, access=mmap.ACCESS_READ) if stat.st_size else b''
+        self.__names = []
+        self.__entries = {}
+        # all (name, entry) pairs in the order of the file, including repeated identifiers
+        self.__records = []
+        self.__repeated = {}
+        self.__by_hash = None
+        if not self.__load(stat):
+            self.__build()
+            if persist:
+                self.__store(stat)
+
+    def __load(self, stat):
+        try:
+            with open(self.sidecar, 'rb') as sidecar:
+                data = sidecar.read()
+        except (IOError, OSError):
+            return False
+        if not _header_matches(data, stat):
+            return False
+        n = INDEX_HEADER.unpack_from(data, 0)[4]
+        entries_start = INDEX_HEADER.size
+        names_start = entries_start + n * INDEX_ENTRY.size
+        names = data[names_start:].decode('ascii').split('\n') if n else []
+        if len(names) != n:
+            return False
+        for i, name in enumerate(names):
+            self.__add(name, INDEX_ENTRY.unpack_from(data, entries_start + i * INDEX_ENTRY.size))
+        return True
+
+    def __build(self):
+        scan = _scan_sent if self.path.endswith('.sent') else _scan_export
+        for name, offset, length, n_tokens, hash_ in scan(self.__data):
+            self.__add(name, (offset, length, n_tokens, hash_))
+
+    def __store(self, stat):
+        tmp = self.sidecar + '.%d.tmp' % os.getpid()
+        try:
+            with open(tmp, 'wb') as sidecar:
+                sidecar.write(INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, stat.st_size, stat.st_mtime_ns,
+                                                len(self.__records)))
+                for _, entry in self.__records:
+                    sidecar.write(INDEX_ENTRY.pack(*entry))
+                sidecar.write('\n'.join(name for name, _ in self.__records).encode('ascii'))
+            os.replace(tmp, self.sidecar)
+        except (IOError, OSError):
+            # e.g. read-only corpus location, the index is still usable in memory
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def __add(self, name, entry):
+        # the first occurrence of an identifier wins, later ones are only listed by entries
+        self.__records.append((name, entry))
+        if name not in self.__entries:
+            self.__names.append(name)
+            self.__entries[name] = entry
+        else:
+            self.__repeated.setdefault(name, []).append(entry)
+
+    def __len__(self):
+        return len(self.__names)
+
+    def __contains__(self, name):
+        return str(name) in self.__entries
+
+    def __iter__(self):
+        return iter(self.__names)
+
+    def names(self):
+        """
+        :return: sentence identifiers in the order of their first occurrence in the file
+        :rtype: list[str]
+        """
+        return self.__names
+
+    def entry(self, name):
+        """
+        :param name: sentence identifier
+        :type name: str
+        :return: byte offset, length in bytes, number of tokens and token hash of the sentence
+        :rtype: tuple[int, int, int, int]
+        """
+        return self.__entries[str(name)]
+
+    def entries(self, name):
+        """
+        :param name: sentence identifier
+        :type name: str
+        :return: the entries (cf. entry) of all sentences with this identifier in the order of the file
+        :rtype: list[tuple[int, int, int, int]]
+        """
+        name = str(name)
+        return [self.__entries[name]] + self.__repeated.get(name, []) if name in self.__entries else []
+
+    def n_tokens(self, name):
+        return self.entry(name)[2]
+
+    def token_hash(self, name):
+        return self.entry(name)[3]
+
+    def raw(self, name):
+        """
+        :param name: sentence identifier
+        :type name: str
+        :return: the bytes of the sentence (the whole #BOS … #EOS block, or the line in a .sent file)
+        :rtype: bytes
+        """
+        offset, length, _, _ = self.entry(name)
+        return self.read(offset, length)
+
+    def read(self, offset, length):
+        """
+        :return: length bytes of the indexed file starting at offset
+        :rtype: bytes
+        """
+        return self.__data[offset:offset + length]
+
+    def sentence(self, name, enc='utf-8'):
+        """
+        :param name: sentence identifier
+        :type name: str
+        :param enc: file encoding
+        :type enc: str
+        :rtype: str
+        """
+        return self.raw(name).decode(enc)
+
+    def names_with_hash(self, hash_):
+        """
+        :param hash_: token hash, cf. token_hash
+        :type hash_: int
+        :return: identifiers of all sentences with this token sequence in the order of the file
+        :rtype: list[str]
+        """
+        if self.__by_hash is None:
+            self.__by_hash = {}
+            for name in self.__names:
+                self.__by_hash.setdefault(self.__entries[name][3], []).append(name)
+        return self.__by_hash.get(hash_, [])
+
+    def close(self):
+        if isinstance(self.__data, mmap.mmap):
+            self.__data.close()
+        self.__file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+
+__all__ = ["SentenceIndex", "index_is_current", "token_hash", "export_tokens", "sent_tokens"]
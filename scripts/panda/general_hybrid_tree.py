@@ -1,7 +1,9 @@
 #-*- coding: utf-8 -*-
 __author__ = 'kilian'
+import hashlib
 from collections import defaultdict
-from .monadic_tokens import MonadicToken
+from .monadic_tokens import MonadicToken, token_changes
+from . import traversal
 
 def join_spans(indices):
     indices = sorted(set(indices))
@@ -23,6 +25,23 @@ def join_spans(indices):
     return spans
 
 
+def spans_of_mask(mask):
+    """
+    :param mask: set of indices as bit mask
+    :type mask: int
+    :return: same as join_spans for the indices in mask
+    :rtype: list[tuple[int, int]]
+    """
+    spans = []
+    while mask:
+        low = (mask & -mask).bit_length() - 1
+        run = mask >> low
+        length = (~run & (run + 1)).bit_length() - 1
+        spans.append((low, low + length - 1))
+        mask ^= ((1 << length) - 1) << low
+    return spans
+
+
 class HybridTree:
     """
     A directed acyclic graph, where a (not necessarily strict) subset of the nodes is linearly ordered.
@@ -57,6 +76,24 @@ class HybridTree:
         # self.__n_ordered_nodes = 0
         # store dependency labels (DEPREL in ConLL)
         # self.__id_to_dep_label = {}
+        # memoized results of __node_indices, __span_table, __digests and the traversal orders, cleared on each change
+        # of the tree
+        self._node_indices = None
+        self._span_table = None
+        self._digests = None
+        self._orders = {}
+
+    def _invalidate(self):
+        """
+        Drop memoized positions and spans, must be called whenever nodes, the ordering or the parent-child relation
+        are changed.
+        """
+        self._node_indices = None
+        self._span_table = None
+        self._digests = None
+        # no new dict while the tree is being built and nothing has been memoized yet
+        if self._orders:
+            self._orders = {}
 
     def sent_label(self):
         """
@@ -95,6 +132,7 @@ class HybridTree:
         Set order = True and connected = False to include some token (e.g. punctuation)
         that appears in the yield but shall be ignored during tree operations.
         """
+        self._invalidate()
         self._id_to_token[id] = token
         if order is True:
             if connected is True:
@@ -112,6 +150,7 @@ class HybridTree:
         :type child: str
         Add a pair of node ids in the tree's parent-child relation.
         """
+        self._invalidate()
         if parent not in self._id_to_child_ids:
             self._id_to_child_ids[parent] = [child]
         else:
@@ -167,12 +206,7 @@ class HybridTree:
         :param id: str
         :return: Get the list of node ids of child nodes, or the empty list.
         """
-        if isinstance(id, list):
-            pass
-        if id in self._id_to_child_ids:
-            return self._id_to_child_ids[id]
-        else:
-            return []
+        return self._id_to_child_ids.get(id, [])
 
     def descendants(self, id):
         """
@@ -181,12 +215,25 @@ class HybridTree:
         :return: the list of node ids of all "transitive" children
         :rtype: list[str]
         """
-        des = []
-        if id in self._id_to_child_ids:
-            for id2 in self._id_to_child_ids[id]:
-                des.append(id2)
-                des += self.descendants(id2)
-        return des
+        return list(traversal.preorder(self.children(id), self.children))
+
+    def preorder(self):
+        """
+        :return: all nodes that are connected to the root in pre-order (memoized, the list must not be modified)
+        :rtype: list[str]
+        """
+        if 'pre' not in self._orders:
+            self._orders['pre'] = list(traversal.preorder(self.root, self.children))
+        return self._orders['pre']
+
+    def postorder(self):
+        """
+        :return: all nodes that are connected to the root in post-order (memoized, the list must not be modified)
+        :rtype: list[str]
+        """
+        if 'post' not in self._orders:
+            self._orders['post'] = list(traversal.postorder(self.root, self.children))
+        return self._orders['post']
 
     def in_ordering(self, id):
         """
@@ -195,7 +242,7 @@ class HybridTree:
         :return: Is the node in the ordering?
         :rtype: bool
         """
-        return id in self.__ordered_ids
+        return id in self.__node_indices()
 
     def disconnected(self, id):
         """
@@ -223,9 +270,23 @@ class HybridTree:
         :return: index of node in ordering
         :rtype: int
         """
-        return self.__ordered_ids.index(id)
+        index = self.__node_indices().get(id)
+        if index is None:
+            raise ValueError("%r is not in list" % (id,))
+        return index
         # return self.__id_to_node_index[id]
 
+    def __node_indices(self):
+        """
+        :return: maps each node in the ordering to its (first) index
+        :rtype: dict
+        """
+        if self._node_indices is None:
+            self._node_indices = {}
+            for index, id in enumerate(self.__ordered_ids):
+                self._node_indices.setdefault(id, index)
+        return self._node_indices
+
     def node_index_full(self, id):
         """
         :param id: node id
@@ -235,46 +296,104 @@ class HybridTree:
         """
         return self.__full_yield.index(id)
 
+    @classmethod
+    def from_nodes(cls, sent_label, tokens, full_yield, id_yield, children, parents):
+        """
+        Builds a tree from all of its nodes and edges at once, e.g. when it is restored from its flat representation
+        (cf. packed_corpus). The given containers are used by the tree and must not be changed afterwards.
+        :param sent_label: name of the sentence
+        :type sent_label: str
+        :param tokens: maps each node id to its token
+        :type tokens: dict
+        :param full_yield: cf. full_yield
+        :type full_yield: list[str]
+        :param id_yield: cf. id_yield, a subsequence of full_yield
+        :type id_yield: list[str]
+        :param children: maps node ids (and the virtual root) to the lists of their children, cf. children
+        :type children: dict
+        :param parents: maps each node that has a parent node to its id (the roots may be omitted, cf. parent)
+        :type parents: dict
+        :rtype: HybridTree
+        """
+        tree = cls(sent_label)
+        tree._id_to_token = tokens
+        tree.__full_yield = full_yield
+        tree.__ordered_ids = id_yield
+        tree._id_to_child_ids = children
+        tree._parent = parents
+        for root in children.setdefault(tree.virtual_root, []):
+            parents.setdefault(root, tree.virtual_root)
+        return tree
+
     def reorder(self):
         """
         Reorder children according to smallest node (w.r.t. ordering) in subtree.
         """
-        self.__reorder(self.virtual_root)
+        self._invalidate()
+        indices = self.__node_indices()
+        # index of the smallest node in the subtree of each node (or -1 if none exists), the nodes are visited
+        # bottom-up
+        min_index_below = {}
+        for id in traversal.postorder([self.virtual_root], self.children):
+            min_indices = {child: min_index_below[child] for child in self.children(id)}
+            if min_indices:
+                self._id_to_child_ids[id] = sorted(self.children(id), key=lambda i: min_indices[i])
+            if id in indices:
+                min_indices[id] = indices[id]
+            min_index = -1
+            for index in min_indices.values():
+                if min_index < 0 or index < min_index:
+                    min_index = index
+            min_index_below[id] = min_index
 
-    def __reorder(self, id):
+    def fringe(self, id):
         """
         :param id: node id
         :type id: str
-        :return: index of smallest node in sub tree (or -1 if none exists)
-        :rtype: int
+        :return: indices (w.r.t. ordering) of all nodes under some node, cf. \Pi^{-1} in paper
+        :rtype: list[int]
+        List of indices (w.r.t. ordering) obtained by pre-order traversal over the subtree starting at id.
         """
-        min_indices = {}
-        if self.children(id).__len__() > 0:
-            for child in self.children(id):
-                min_indices[child] = self.__reorder(child)
-            self._id_to_child_ids[id] = sorted(self.children(id), key=lambda i: min_indices[i])
-        if self.in_ordering(id):
-            min_indices[id] = self.node_index(id)
-        min_index = -1
-        for index in min_indices.values():
-            if min_index < 0 or index < min_index:
-                min_index = index
-        return min_index
+        indices = self.__node_indices()
+        return [indices[node] for node in traversal.preorder([id], self.children) if node in indices]
 
-    def fringe(self, id):
+    def __spans(self):
+        """
+        :return: memoized triple of dicts that map each node (and the virtual root) to the indices of its fringe as bit
+            mask, to its spans (cf. join_spans) and to the total number of gaps in its subtree, respectively
+        :rtype: tuple[dict, dict, dict]
+        The values of all nodes are computed in one bottom-up pass. Nodes that are not connected to the root are
+        visited separately.
+        """
+        if self._span_table is None:
+            indices = self.__node_indices()
+            masks = {}
+            spans = {}
+            gaps = {}
+            for top in [self.virtual_root] + list(self.nodes()):
+                if top in masks:
+                    continue
+                for id in traversal.postorder([top], self.children):
+                    mask = 1 << indices[id] if id in indices else 0
+                    n_gaps = 0
+                    for child in self.children(id):
+                        mask |= masks[child]
+                        n_gaps += gaps[child]
+                    masks[id] = mask
+                    spans[id] = spans_of_mask(mask)
+                    gaps[id] = n_gaps + len(spans[id]) - 1
+            self._span_table = masks, spans, gaps
+        return self._span_table
+
+    def spans(self, id):
         """
         :param id: node id
         :type id: str
-        :return: indices (w.r.t. ordering) of all nodes under some node, cf. \Pi^{-1} in paper
-        :rtype: list[int]
-        List of indices (w.r.t. ordering) obtained by pre-order traversal over the subtree starting at id.
+        :return: contiguous spans of the fringe of node, same as join_spans(self.fringe(id))
+        :rtype: list[tuple[int, int]]
         """
-        y = []
-        if self.in_ordering(id):
-            y = [self.node_index(id)]
-        for child in self.children(id):
-            y += self.fringe(child)
-        return y
+        spans = self.__spans()[1].get(id)
+        return list(spans) if spans is not None else join_spans(self.fringe(id))
 
     def n_spans(self, id):
         """
@@ -283,14 +402,16 @@ class HybridTree:
         :return: Number of contiguous spans of node.
         :rtype : int
         """
-        return len(join_spans(self.fringe(id)))
+        spans = self.__spans()[1].get(id)
+        return len(spans) if spans is not None else len(join_spans(self.fringe(id)))
 
     def max_n_spans(self):
         """
         :return: Maximum number of spans of any node.
         :rtype: int
         """
-        nums = [self.n_spans(id) for id in self.nodes()]
+        spans = self.__spans()[1]
+        nums = [len(spans[id]) for id in self.nodes()]
         if len(nums) > 0:
             return max(nums)
         else:
@@ -301,19 +422,7 @@ class HybridTree:
         :return: Total number of gaps in any node.
         :rtype: int
         """
-        return self.__n_gaps_below(self.virtual_root)
-
-    def __n_gaps_below(self, id):
-        """
-        :param id: node id
-        :type id: str
-        :return: gaps below some node
-        :rtype: int
-        """
-        n_gaps = self.n_spans(id) - 1
-        for child in self.children(id):
-            n_gaps += self.__n_gaps_below(child)
-        return n_gaps
+        return self.__spans()[2][self.virtual_root]
 
     def unlabelled_structure(self):
         """
@@ -417,19 +526,7 @@ class HybridTree:
         :return: Number of nodes in tree that are connected to the root (or the root itself).
         :rtype: int
         """
-        return self.__n_nodes_below(self.virtual_root)
-
-    def __n_nodes_below(self, id):
-        """
-        :param id: node id
-        :type id: str
-        :return: Number of nodes below node.
-        :rtype: int
-        """
-        n = len(self.children(id))
-        for child in self.children(id):
-            n += self.__n_nodes_below(child)
-        return n
+        return len(self.preorder())
 
     def empty_fringe(self):
         """
@@ -470,17 +567,79 @@ class HybridTree:
     def __str__(self):
         return ''.join([self.__hybrid_tree_str(id, 0) for id in self.root])
 
+    def __digests(self):
+        """
+        :return: memoized dict that maps each node below the virtual root (and the virtual root itself) to the digest
+            of its subtree, which is the 64 bit blake2b hash of the type and fields of the token of the node (cf.
+            _token_key), its position in the ordering and the digests of its children (in this order). It is
+            recomputed after any token was changed by its setters (cf. token_changes).
+        :rtype: dict[str, bytes]
+        """
+        changes = token_changes()
+        if self._digests is None or self._digests[0] != changes:
+            indices = self.__node_indices()
+            tokens = self._id_to_token
+            child_ids = self._id_to_child_ids
+            # the key of each token object, e.g. of a shared category, is only computed once
+            keys = {}
+            digests = {}
+            blake2b = hashlib.blake2b
+            for node in traversal.postorder([self.virtual_root], lambda node: child_ids.get(node, ())):
+                token = tokens.get(node)
+                if token is None:
+                    key = b''
+                else:
+                    key = keys.get(id(token))
+                    if key is None:
+                        key = keys[id(token)] = _token_key(token)
+                    key += b'\x1e%d\x1d' % indices.get(node, -1)
+                children = child_ids.get(node)
+                if children:
+                    key += b''.join([digests[child] for child in children])
+                digests[node] = blake2b(key, digest_size=8).digest()
+            self._digests = (changes, digests)
+        return self._digests[1]
+
+    def digest(self, id=None):
+        """
+        Structural digest of a subtree. Equal (sub)trees (cf. __eq__) have the same digest, also in different processes
+        and runs, e.g. for comparing digests that were stored. Changes of the tokens by their setters are reflected,
+        changes of the lists of morphological features in place are not.
+        :param id: node id, or None for the whole tree
+        :type id: str
+        :return: hash of the tokens, positions in the ordering and children of all nodes in the subtree
+        :rtype: int
+        """
+        return int.from_bytes(self.__digests()[self.virtual_root if id is None else id], 'little')
+
     def __eq__(self, other):
+        """
+        Trees are equal if their nodes have tokens of the same type with the same fields (cf. _token_key), the same
+        positions in the ordering and the same children, in the same order. Unlike compare_recursive, this does not
+        use the __eq__ of the tokens, which compares constituent tokens by identity, and compares the positions in
+        the ordering of both trees, so that it agrees with digest() and __hash__.
+        """
         if not isinstance(other, HybridTree):
             return False
-        return all([self.compare_recursive(other, self_node, other_node) for self_node, other_node in
-                    zip(self.root, other.root)])
+        if self.digest() != other.digest():
+            return False
+        (indices, other_indices) = (self.__node_indices(), other._HybridTree__node_indices())
+        stack = [(self.virtual_root, other.virtual_root)]
+        while stack:
+            (node, other_node) = stack.pop()
+            children = self.children(node)
+            other_children = other.children(other_node)
+            if len(children) != len(other_children):
+                return False
+            for (child, other_child) in zip(children, other_children):
+                if indices.get(child) != other_indices.get(other_child) \
+                        or not _same_token(self.node_token(child), other.node_token(other_child)):
+                    return False
+                stack.append((child, other_child))
+        return True
 
     def __hash__(self):
-        return hash((tuple(self.token_yield()), tuple([self.__hash_recursive(id) for id in self.root])))
-
-    def __hash_recursive(self, id):
-        return hash((self.node_token(id), tuple([self.__hash_recursive(child) for child in self.children(id)])))
+        return hash(self.digest())
 
     def compare_recursive(self, other, self_node, other_node):
         """
@@ -525,6 +684,7 @@ class HybridDag(HybridTree):
         self._sec_parents = {}
 
     def add_sec_child(self, parent, child, edge_label):
+        self._invalidate()
         if parent in self._id_to_sec_children:
             self._id_to_sec_children[parent].append(child)
             self._id_to_sec_child_labels[parent].append(edge_label)
@@ -537,6 +697,26 @@ class HybridDag(HybridTree):
         else:
             self._sec_parents[child] = [parent]
 
+    @classmethod
+    def from_nodes(cls, sent_label, tokens, full_yield, id_yield, children, parents, sec_children=None,
+                   sec_child_labels=None, sec_parents=None):
+        """
+        Same as HybridTree.from_nodes, with the secondary edges.
+        :param sec_children: maps node ids to the lists of their secondary children, cf. sec_children
+        :type sec_children: dict
+        :param sec_child_labels: maps node ids to the edge labels of their secondary children, cf.
+            sec_child_edge_labels
+        :type sec_child_labels: dict
+        :param sec_parents: maps node ids to the lists of their secondary parents, cf. sec_parents
+        :type sec_parents: dict
+        :rtype: HybridDag
+        """
+        tree = super(HybridDag, cls).from_nodes(sent_label, tokens, full_yield, id_yield, children, parents)
+        tree._id_to_sec_children = {} if sec_children is None else sec_children
+        tree._id_to_sec_child_labels = {} if sec_child_labels is None else sec_child_labels
+        tree._sec_parents = {} if sec_parents is None else sec_parents
+        return tree
+
     def sec_children(self, node):
         return self._id_to_sec_children.get(node, [])
 
@@ -553,9 +733,10 @@ class HybridDag(HybridTree):
         Labelled spans.
         """
         spans = []
-        for id in [n for n in self.nodes() if n not in self.full_yield()]:
+        full_yield = set(self.full_yield())
+        for id in [n for n in self.nodes() if n not in full_yield]:
             span = [self.node_token(id).category()]
-            for (low, high) in join_spans(self.fringe(id)):
+            for (low, high) in self.spans(id):
                 span += [low, high]
             # TODO: this if-clause allows to handle trees, that have nodes with empty fringe
             if len(span) >= 3:
@@ -569,27 +750,64 @@ class HybridDag(HybridTree):
         """
         :param reverse: reverse list
         :type reverse: bool
-        :return: list of nodes of dag in topological order starting from leaves
+        :return: list of nodes of dag in topological order starting from leaves (w.r.t. primary and secondary edges),
+            or None if there is a cycle
         :rtype: list
         """
-        order = []
-        added = set()
-        changed = True
-        while changed:
-            changed = False
-            for node in self.nodes():
-                if node in added:
-                    continue
-                if all([c in added for c in self.children(node) + self.sec_children(node)]):
-                    added.add(node)
-                    order.append(node)
-                    changed = True
-        if len(added) == len(self.nodes()):
-            if reverse:
-                return reversed(order)
-            return order
-        else:
+        if 'topological' not in self._orders:
+            self._orders['topological'] = traversal.topological_order(
+                self.nodes(), lambda node: self.children(node) + self.sec_children(node))
+        order = self._orders['topological']
+        if order is None:
             return None
+        if reverse:
+            return reversed(order)
+        return list(order)
+
+
+def _token_key(token):
+    """
+    :param token: some token
+    :type token: MonadicToken
+    :return: the type and fields of the token (or its string if it has no fields), such that equal tokens have the
+        same key regardless of their class (e.g. shared categories) and of the process
+    :rtype: bytes
+    """
+    return (token.type() + '\x1f' + repr(_token_fields(token))).encode('utf-8')
+
+
+def _token_fields(token):
+    return token.fields() if hasattr(token, 'fields') else str(token)
+
+
+def _same_token(token, other):
+    """
+    :return: whether both tokens have the same type and fields, cf. _token_key
+    :rtype: bool
+    """
+    return token is other or (token.type() == other.type() and _token_fields(token) == _token_fields(other))
+
+
+def group_identical_trees(trees):
+    """
+    Finds identical trees (cf. HybridTree.__eq__, which ignores the sentence names) by their digests.
+    :param trees: trees of one or more corpora
+    :type trees: list[HybridTree]
+    :return: the indices of the trees in each class of identical trees, in order of their first occurrence
+    :rtype: list[list[int]]
+    """
+    classes = {}
+    groups = []
+    for index, tree in enumerate(trees):
+        candidates = classes.setdefault(tree.digest(), [])
+        for group in candidates:
+            if trees[group[0]] == tree:
+                group.append(index)
+                break
+        else:
+            candidates.append([index])
+            groups.append(candidates[-1])
+    return groups
 
 
-__all__ = ["HybridTree"]
+__all__ = ["HybridTree", "group_identical_trees"]
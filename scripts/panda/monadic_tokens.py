@@ -1,9 +1,23 @@
 #-*- coding: utf-8 -*-
 __author__ = 'kilian'
 from abc import ABCMeta, abstractmethod
+from sys import intern
+
+# number of changes of tokens by their setters so far, trees recompute memoized digests when it has changed
+_changes = [0]
+
+
+def token_changes():
+    """
+    :return: number of changes of tokens by set_edge_label or set_category so far
+    :rtype: int
+    """
+    return _changes[0]
+
 
 class MonadicToken(object):
     __metaclass__ = ABCMeta
+    __slots__ = ()
 
     @abstractmethod
     def __init__(self):
@@ -29,6 +43,8 @@ class MonadicToken(object):
 
 
 class CoNLLToken(MonadicToken):
+    __slots__ = ('__form', '__lemma', '__cpos', '__pos', '__feats', '__deprel')
+
     def __init__(self, form, lemma, cpos, pos, feats, deprel):
         super(CoNLLToken, self).__init__()
         self.__form = form
@@ -61,6 +77,14 @@ class CoNLLToken(MonadicToken):
 
     def set_edge_label(self, deprel):
         self.__deprel = deprel
+        _changes[0] += 1
+
+    def fields(self):
+        """
+        :return: all fields of the token, tokens of the same type are equal iff their fields are equal
+        :rtype: tuple
+        """
+        return self.__form, self.__lemma, self.__cpos, self.__pos, self.__feats, self.__deprel
 
     def __str__(self):
         return self.form() + ' : ' + self.pos() + ' : ' + self.deprel()
@@ -84,6 +108,8 @@ class CoNLLToken(MonadicToken):
 
 
 class ConstituencyToken(MonadicToken):
+    __slots__ = ('_edge',)
+
     def __init__(self):
         super(ConstituencyToken, self).__init__()
         self._edge = None
@@ -101,11 +127,14 @@ class ConstituencyToken(MonadicToken):
 
     def set_edge_label(self, edge):
         self._edge = edge
+        _changes[0] += 1
 
 
 class ConstituentTerminal(ConstituencyToken):
+    __slots__ = ('__form', '__pos', '_morph', '__lemma')
+
     def __init__(self, form, pos, edge='--', morph=None, lemma='--'):
-        super(ConstituentTerminal, self).__init__()
+        # sets all slots itself instead of calling the constructors of the base classes, which only set the edge
         self._edge = edge
         self.__form = form
         self.__pos = pos
@@ -127,6 +156,13 @@ class ConstituentTerminal(ConstituencyToken):
     def morph_feats(self):
         return self._morph
 
+    def fields(self):
+        """
+        :return: all fields of the token (tokens compare by identity, trees compare tokens by their type and fields)
+        :rtype: tuple
+        """
+        return self.__form, self.__pos, self._edge, self.__lemma, self._morph
+
     def __str__(self):
         return self.form() + "[" + self.__lemma + "]" + ' : ' + self.pos() + '\t' + str(self.edge())\
                    + '\t' + str(self._morph)
@@ -144,6 +180,8 @@ class ConstituentTerminal(ConstituencyToken):
 
 
 class ConstituentCategory(ConstituencyToken):
+    __slots__ = ('__category',)
+
     def __init__(self, category, edge='--'):
         super(ConstituentCategory, self).__init__()
         self.__category = category
@@ -155,6 +193,13 @@ class ConstituentCategory(ConstituencyToken):
     def category(self):
         return self.__category
 
+    def fields(self):
+        """
+        :return: all fields of the token (tokens compare by identity, trees compare tokens by their type and fields)
+        :rtype: tuple
+        """
+        return self.__category, self._edge
+
     def __str__(self):
         return str(self.category()) + '\t' + self.edge()
 
@@ -166,6 +211,64 @@ class ConstituentCategory(ConstituencyToken):
 
     def set_category(self, category):
         self.__category = category
+        _changes[0] += 1
+
+
+class _SharedConstituentCategory(ConstituentCategory):
+    """
+    A ConstituentCategory that is shared by all nodes with the same category and edge label, cf.
+    shared_constituent_category. It is only used by read-only trees (CompactHybridTree) and cannot be modified.
+    """
+    __slots__ = ()
+
+    def set_category(self, category):
+        raise TypeError("tokens of read-only trees cannot be modified")
+
+    def set_edge_label(self, edge):
+        raise TypeError("tokens of read-only trees cannot be modified")
+
+    def __reduce__(self):
+        return shared_constituent_category, (self.category(), self.edge())
+
+
+_shared_categories = {}
+
+
+def _intern(string):
+    return intern(string) if type(string) is str else string
+
+
+def shared_constituent_category(category, edge='--'):
+    """
+    :param category: category label
+    :type category: str
+    :param edge: edge label
+    :type edge: str
+    :return: the unique read-only ConstituentCategory with this category and edge label, for trees whose tokens are
+        never changed, e.g. CompactHybridTree (use new_constituent_category for HybridTrees)
+    :rtype: ConstituentCategory
+    """
+    token = _shared_categories.get((category, edge))
+    if token is None:
+        token = _SharedConstituentCategory(_intern(category), _intern(edge))
+        _shared_categories[(token.category(), token.edge())] = token
+    return token
+
+
+def new_constituent_category(category, edge='--'):
+    """
+    :return: a new ConstituentCategory whose category and edge are interned strings
+    :rtype: ConstituentCategory
+    """
+    return ConstituentCategory(_intern(category), _intern(edge))
+
+
+def new_constituent_terminal(form, pos, edge='--', morph=None, lemma='--'):
+    """
+    :return: a new ConstituentTerminal whose form, part-of-speech, edge and lemma are interned strings
+    :rtype: ConstituentTerminal
+    """
+    return ConstituentTerminal(_intern(form), _intern(pos), _intern(edge), morph, _intern(lemma))
 
 
 def construct_conll_token(form, pos, _=True):
@@ -182,4 +285,5 @@ def construct_constituent_token(form, pos, terminal):
 
 
 __all__ = ["ConstituencyToken", "ConstituentTerminal", "ConstituentCategory", "CoNLLToken", "construct_conll_token",
-           "construct_constituent_token"]
+           "construct_constituent_token", "shared_constituent_category", "new_constituent_category",
+           "new_constituent_terminal", "token_changes"]
@@ -3,15 +3,26 @@ DeepSyntaxGraphs."""
 from __future__ import print_function, unicode_literals
 
 import codecs
+import hashlib
+import io
+import itertools
+import json
+import mmap
 import os
 import re
+import struct
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from os.path import expanduser
 from typing import Iterable
 
+from .bihypergraph_file import write_bihypergraphs
 from .constituent_tree import ConstituentTree
+from .corpus_index import SentenceIndex, index_is_current
 from .general_hybrid_tree import HybridDag
-from .monadic_tokens import ConstituentTerminal, ConstituentCategory
+from .monadic_tokens import new_constituent_category, new_constituent_terminal
+from .packed_corpus import FILE_VERSION, PackedCorpus, PackedTrees, pack_trees
+from .traversal import preorder
 
 # Used only by CL experiments
 # Location of Negra corpus.
@@ -20,6 +31,9 @@ NEGRA_DIRECTORY = 'res/negra-corpus/downloadv2'
 NEGRA_NONPROJECTIVE = os.path.join(NEGRA_DIRECTORY, '/negra-corpus.export')
 NEGRA_PROJECTIVE = os.path.join(NEGRA_DIRECTORY, '/negra-corpus.cfg')
 
+# Location of the binary cache of parsed corpora.
+CORPUS_CACHE = os.path.join(os.environ.get('XDG_CACHE_HOME', '~/.cache'), 'rustomata-eval', 'corpora')
+
 
 DISCODOP_HEADER = re.compile(r'^%%\s+word\s+lemma\s+tag\s+morph\s+edge\s+parent\s+secedge$')
 BOS = re.compile(r'^#BOS\s+([0-9]+)')
@@ -51,6 +65,8 @@ def sentence_names_to_hybridtrees(names,
                                   mode="STANDARD",
                                   secedge=False):
     """
+    The names are looked up in a frozen set and the corpus is only parsed until all of them were found, cf.
+    _until_found.
     :param names:  list of sentence identifiers
     :type names: Iterable[str]
     :param path: path to corpus
@@ -67,12 +83,14 @@ def sentence_names_to_hybridtrees(names,
     :type secedge: bool
     :return: list of constituent structures (HybridTrees or HybridDags) from file_name whose names are in names
     """
+    names = frozenset(names)
     negra = codecs.open(expanduser(path), encoding=enc)
+    remaining = set(names)
     trees = []
     tree = None
     name = ''
     n_leaves = 0
-    for line in negra:
+    for line in _until_found(negra, names, remaining):
         match_mode = DISCODOP_HEADER.match(line)
         if match_mode:
             mode = "DISCO-DOP"
@@ -105,33 +123,21 @@ def sentence_names_to_hybridtrees(names,
                 tree.reorder()
                 trees += [tree]
                 tree = None
+                remaining.discard(name)
         elif tree:
             if match_nont:
-                id = match_nont.group(1)
                 if mode == "STANDARD":
                     OFFSET = 0
                 else:
                     OFFSET = 1
+                id = match_nont.group(1)
                 nont = match_nont.group(2 + OFFSET)
                 edge = match_nont.group(4 + OFFSET)
                 parent = match_nont.group(5 + OFFSET)
                 # print(match_nont.groups(), len(match_nont.groups()))
                 secedges = [] if not secedge or match_nont.group(6 + OFFSET) is None else \
                     match_nont.group(6 + OFFSET).split()
-
-                tree.add_node(id, ConstituentCategory(nont), False, True)
-
-                tree.node_token(id).set_edge_label(edge)
-                if parent == '0' and not add_vroot:
-                    tree.add_to_root(id)
-                else:
-                    tree.add_child(parent, id)
-                if secedge and secedges:
-                    # print(secedges)
-                    for sei in range(0, len(secedges) // 2, 2):
-                        sec_label = secedges[sei]
-                        sec_parent = secedges[sei + 1]
-                        tree.add_sec_child(sec_parent, id, sec_label)
+                _add_nonterminal(tree, id, nont, edge, parent, secedges, add_vroot)
             elif match_term:
                 if mode == "STANDARD":
                     OFFSET = 0
@@ -147,38 +153,451 @@ def sentence_names_to_hybridtrees(names,
                     match_term.group(6 + OFFSET).split()
 
                 n_leaves += 1
-                leaf_id = str(100 + n_leaves)
-                if parent == '0' and disconnect_punctuation:
-                    tree.add_punct(leaf_id, pos, word)
-                else:
-                    if parent == '0' and not add_vroot:
-                        tree.add_to_root(leaf_id)
-                    else:
-                        tree.add_child(parent, leaf_id)
-
-                    token = ConstituentTerminal(word, pos, edge, None, '--')
-                    tree.add_node(leaf_id, token, True, True)
-
-                    tree.node_token(leaf_id).set_edge_label(edge)
-                    if secedge and secedges:
-                        # print(secedges)
-                        for sei in range(0, len(secedges) // 2, 2):
-                            sec_label = secedges[sei]
-                            # assert secedges[sei] == edge
-                            sec_parent = secedges[sei + 1]
-                            tree.add_sec_child(sec_parent, leaf_id, sec_label)
+                _add_terminal(tree, str(100 + n_leaves), word, pos, edge, parent, secedges, disconnect_punctuation,
+                              add_vroot)
     negra.close()
     return trees
 
 
+def _until_found(lines, names, remaining):
+    """
+    :param lines: lines of a corpus in export format
+    :type lines: Iterable[str]
+    :param names: requested sentence identifiers
+    :type names: frozenset
+    :param remaining: identifiers that were not found yet, updated by the caller
+    :type remaining: set
+    :return: generator of the lines until all names were found, followed by only the lines of the later sentences
+        whose names are in names (identifiers may occur more than once); the lines of the rest of the corpus are only
+        compared with #BOS and #EOS instead of being parsed, one line at a time
+    """
+    lines = iter(lines)
+    for line in lines:
+        if not remaining and line.startswith('#BOS'):
+            break
+        yield line
+    else:
+        return
+    inside = False
+    for line in itertools.chain([line], lines):
+        if line.startswith('#BOS'):
+            match = BOS.match(line)
+            inside = match is not None and match.group(1) in names
+        if inside:
+            yield line
+            if line.startswith('#EOS'):
+                inside = False
+
+
+def _add_nonterminal(tree, id, nont, edge, parent, secedges, add_vroot):
+    """
+    adds an inner node that was read from a line in export format to the tree
+    """
+    tree.add_node(id, new_constituent_category(nont, edge), False, True)
+    if parent == '0' and not add_vroot:
+        tree.add_to_root(id)
+    else:
+        tree.add_child(parent, id)
+    if secedges:
+        # print(secedges)
+        for sei in range(0, len(secedges) // 2, 2):
+            sec_label = secedges[sei]
+            sec_parent = secedges[sei + 1]
+            tree.add_sec_child(sec_parent, id, sec_label)
+
+
+def _add_terminal(tree, leaf_id, word, pos, edge, parent, secedges, disconnect_punctuation, add_vroot):
+    """
+    adds a leaf that was read from a line in export format to the tree
+    """
+    if parent == '0' and disconnect_punctuation:
+        tree.add_punct(leaf_id, pos, word)
+    else:
+        if parent == '0' and not add_vroot:
+            tree.add_to_root(leaf_id)
+        else:
+            tree.add_child(parent, leaf_id)
+
+        token = new_constituent_terminal(word, pos, edge, None, '--')
+        tree.add_node(leaf_id, token, True, True)
+
+        if secedges:
+            # print(secedges)
+            for sei in range(0, len(secedges) // 2, 2):
+                sec_label = secedges[sei]
+                # assert secedges[sei] == edge
+                sec_parent = secedges[sei + 1]
+                tree.add_sec_child(sec_parent, leaf_id, sec_label)
+
+
+def _is_number(field):
+    return field.isdigit() and field.isascii()
+
+
+def _export_lines_to_hybridtrees(lines, names, disconnect_punctuation, add_vroot, mode, secedge):
+    """
+    Hand-written counterpart of the regular expressions in sentence_names_to_hybridtrees: splits each line into its
+    fields and dispatches on the first character.
+    :type lines: Iterable[str]
+    :param names: sentence identifiers, or None for all sentences
+    :return: generator of constituent structures whose names are in names
+    """
+    tree = None
+    name = ''
+    n_leaves = 0
+    offset = 0 if mode == "STANDARD" else 1
+    for line in lines:
+        first = line[:1]
+        if first == '%' and DISCODOP_HEADER.match(line):
+            mode = "DISCO-DOP"
+            offset = 1
+            continue
+        if first == '#':
+            match_sent_start = BOS.match(line) if line.startswith('#BOS') else None
+            if match_sent_start:
+                this_name = match_sent_start.group(1)
+                if names is None or this_name in names:
+                    name = this_name
+                    tree = HybridDag(name) if secedge else ConstituentTree(name)
+                    n_leaves = 0
+                    if add_vroot:
+                        tree.set_label('0', 'VROOT')
+                        tree.add_to_root('0')
+                continue
+            match_sent_end = EOS.match(line) if line.startswith('#EOS') else None
+            if match_sent_end:
+                if name == match_sent_end.group(1):
+                    tree.reorder()
+                    yield tree
+                    tree = None
+                continue
+        if not tree:
+            continue
+
+        fields = line.split()
+        # fields: word/#id [lemma] pos/category morph edge parent (secedge-label secedge-parent)*
+        n_fields = 5 + offset
+        if len(fields) < n_fields or (len(fields) - n_fields) % 2 or not _is_number(fields[n_fields - 1]):
+            continue
+        if len(fields) > n_fields and not all(_is_number(field) for field in fields[n_fields + 1::2]):
+            continue
+        secedges = fields[n_fields:] if secedge else []
+        if first == '#' and _is_number(fields[0][1:]):
+            _add_nonterminal(tree, fields[0][1:], fields[1 + offset], fields[3 + offset], fields[4 + offset],
+                             secedges, add_vroot)
+        else:
+            n_leaves += 1
+            _add_terminal(tree, str(100 + n_leaves), fields[0], fields[1 + offset], fields[3 + offset],
+                          fields[4 + offset], secedges, disconnect_punctuation, add_vroot)
+
+
+def sentence_names_to_hybridtrees_iter(names,
+                                       path,
+                                       enc="utf-8",
+                                       disconnect_punctuation=True,
+                                       add_vroot=False,
+                                       mode="STANDARD",
+                                       secedge=False,
+                                       use_index=None):
+    """
+    Lazy variant of sentence_names_to_hybridtrees that stops parsing as soon as all names were found (cf. _until_found).
+    If an offset index (cf. corpus_index) is used, only the requested sentences are read from the file, one at a time.
+    :param names:  list of sentence identifiers, or None to load all sentences
+    :type names: Iterable[str]
+    :param path: path to corpus
+    :type path: str
+    :param enc: file encoding
+    :type enc: str
+    :param disconnect_punctuation: disconnect
+    :type disconnect_punctuation: bool
+    :param add_vroot: adds a virtual root node labelled 'VROOT'
+    :type add_vroot: bool
+    :param mode: either 'STANDARD' (no lemma field) or 'DISCO-DOP' (lemma field)
+    :type mode: str
+    :param secedge: add secondary edges
+    :type secedge: bool
+    :param use_index: seek to the sentences using the offset index next to the corpus; None uses the index only if it
+        is up to date, True (re)builds it if necessary
+    :type use_index: bool
+    :return: generator of constituent structures (HybridTrees or HybridDags) from file_name whose names are in names,
+        in the order of the corpus
+    """
+    if names is not None:
+        names = frozenset(names)
+        if not names:
+            return
+    path = expanduser(path)
+    if use_index is None:
+        use_index = names is not None and index_is_current(path)
+
+    if use_index:
+        with SentenceIndex(path) as index:
+            blocks = sorted(entry[:2] for name in (index.names() if names is None else names)
+                            for entry in index.entries(name))
+            if not blocks:
+                return
+            # the lines before the first sentence may switch to DISCO-DOP mode
+            header = index.read(0, index.entry(index.names()[0])[0]).decode(enc)
+            if any(DISCODOP_HEADER.match(line) for line in header.splitlines()):
+                mode = "DISCO-DOP"
+            # each sentence is read and parsed only when the next tree is requested
+            for offset, length in blocks:
+                for tree in _export_lines_to_hybridtrees(index.read(offset, length).decode(enc).splitlines(True),
+                                                         names, disconnect_punctuation, add_vroot, mode, secedge):
+                    yield tree
+        return
+
+    with open(path, encoding=enc) as negra:
+        if names is None:
+            for tree in _export_lines_to_hybridtrees(negra, names, disconnect_punctuation, add_vroot, mode, secedge):
+                yield tree
+            return
+        remaining = set(names)
+        for tree in _export_lines_to_hybridtrees(_until_found(negra, names, remaining), names,
+                                                 disconnect_punctuation, add_vroot, mode, secedge):
+            remaining.discard(tree.sent_label())
+            yield tree
+
+
+def sentence_names_to_hybridtrees_fast(names,
+                                       path,
+                                       enc="utf-8",
+                                       disconnect_punctuation=True,
+                                       add_vroot=False,
+                                       mode="STANDARD",
+                                       secedge=False,
+                                       use_index=None):
+    """
+    Same as sentence_names_to_hybridtrees, but splits the lines into fields instead of matching them against regular
+    expressions (cf. sentence_names_to_hybridtrees_iter).
+    :param names:  list of sentence identifiers, or None to load all sentences
+    :type names: Iterable[str]
+    :param path: path to corpus
+    :type path: str
+    :param enc: file encoding
+    :type enc: str
+    :param disconnect_punctuation: disconnect
+    :type disconnect_punctuation: bool
+    :param add_vroot: adds a virtual root node labelled 'VROOT'
+    :type add_vroot: bool
+    :param mode: either 'STANDARD' (no lemma field) or 'DISCO-DOP' (lemma field)
+    :type mode: str
+    :param secedge: add secondary edges
+    :type secedge: bool
+    :param use_index: cf. sentence_names_to_hybridtrees_iter
+    :type use_index: bool
+    :return: list of constituent structures (HybridTrees or HybridDags) from file_name whose names are in names
+    """
+    return list(sentence_names_to_hybridtrees_iter(names, path, enc, disconnect_punctuation, add_vroot, mode, secedge,
+                                                   use_index))
+
+
+def _export_chunks(path, n_chunks):
+    """
+    :param path: path to corpus
+    :type path: str
+    :param n_chunks: number of chunks to aim for
+    :type n_chunks: int
+    :return: list of byte ranges (start, end) of the corpus that start at some #BOS line and a byte range of the lines
+        before the first sentence
+    :rtype: tuple[list[tuple[int, int]], tuple[int, int]]
+    """
+    with open(path, 'rb') as negra:
+        size = os.fstat(negra.fileno()).st_size
+        if size == 0:
+            return [], (0, 0)
+        with mmap.mmap(negra.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if data[:4] == b'#BOS':
+                first = 0
+            else:
+                first = data.find(b'\n#BOS') + 1
+                if first == 0:
+                    return [], (0, size)
+            starts = [first]
+            for target in range(1, n_chunks):
+                start = data.find(b'\n#BOS', max(starts[-1], first + (size - first) * target // n_chunks)) + 1
+                if start == 0:
+                    break
+                if start > starts[-1]:
+                    starts.append(start)
+    return list(zip(starts, starts[1:] + [size])), (0, first)
+
+
+def _load_chunk(args):
+    """
+    parses the sentences in a byte range of the corpus, is run in worker processes
+    """
+    path, (start, end), (header_start, header_end), names, enc, disconnect_punctuation, add_vroot, mode, secedge = args
+    with open(path, 'rb') as negra:
+        negra.seek(header_start)
+        lines = negra.read(header_end - header_start).decode(enc).splitlines(True)
+        negra.seek(start)
+        lines.extend(negra.read(end - start).decode(enc).splitlines(True))
+    return pack_trees(_export_lines_to_hybridtrees(lines, names, disconnect_punctuation, add_vroot, mode, secedge))
+
+
+def sentence_names_to_hybridtrees_parallel(names,
+                                           path,
+                                           enc="utf-8",
+                                           disconnect_punctuation=True,
+                                           add_vroot=False,
+                                           mode="STANDARD",
+                                           secedge=False,
+                                           workers=None,
+                                           chunks_per_worker=4):
+    """
+    Same as sentence_names_to_hybridtrees_fast, but splits the corpus at #BOS lines into chunks that are parsed in a
+    pool of processes. The parsed chunks are sent back as PackedCorpus, i.e. as a label table and flat arrays.
+    The result is a PackedTrees that rebuilds each tree from these arrays when it is first accessed, so that this
+    process does not rebuild the whole corpus up front. Use its corpus() to get the arrays without any tree objects.
+    It only pays off for large corpora on several cores, because of the cost of starting the processes and
+    transferring the chunks.
+    :param names:  list of sentence identifiers, or None to load all sentences
+    :type names: Iterable[str]
+    :param path: path to corpus
+    :type path: str
+    :param enc: file encoding
+    :type enc: str
+    :param disconnect_punctuation: disconnect
+    :type disconnect_punctuation: bool
+    :param add_vroot: adds a virtual root node labelled 'VROOT'
+    :type add_vroot: bool
+    :param mode: either 'STANDARD' (no lemma field) or 'DISCO-DOP' (lemma field)
+    :type mode: str
+    :param secedge: add secondary edges
+    :type secedge: bool
+    :param workers: number of processes, defaults to the number of cores
+    :type workers: int
+    :param chunks_per_worker: number of chunks per process, more chunks balance the load better
+    :type chunks_per_worker: int
+    :return: constituent structures (HybridTrees or HybridDags) from file_name whose names are in names, in the
+        order of the corpus, as a list if workers is 1 and as PackedTrees otherwise
+    :rtype: list[ConstituentTree|HybridDag]|PackedTrees
+    """
+    path = expanduser(path)
+    names = None if names is None else frozenset(names)
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        return list(sentence_names_to_hybridtrees_iter(names, path, enc, disconnect_punctuation, add_vroot, mode,
+                                                       secedge, use_index=False))
+    chunks, header = _export_chunks(path, workers * chunks_per_worker)
+    tasks = [(path, chunk, header, names, enc, disconnect_punctuation, add_vroot, mode, secedge) for chunk in chunks]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return PackedTrees(pool.map(_load_chunk, tasks))
+
+
+def corpus_cache_key(path,
+                     enc="utf-8",
+                     disconnect_punctuation=True,
+                     add_vroot=False,
+                     mode="STANDARD",
+                     secedge=False):
+    """
+    :return: hash of the corpus file's contents and the loader options
+    :rtype: str
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    with open(expanduser(path), 'rb') as negra:
+        for block in iter(lambda: negra.read(1 << 20), b''):
+            digest.update(block)
+    digest.update(repr((enc, disconnect_punctuation, add_vroot, mode, secedge, FILE_VERSION)).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def cached_packed_corpus(path,
+                         enc="utf-8",
+                         disconnect_punctuation=True,
+                         add_vroot=False,
+                         mode="STANDARD",
+                         secedge=False,
+                         cache_dir=None,
+                         workers=1):
+    """
+    Loads all sentences of a corpus from the binary cache, or parses them and stores them in the cache.
+    :param path: path to corpus
+    :type path: str
+    :param enc: file encoding
+    :type enc: str
+    :param disconnect_punctuation: disconnect
+    :type disconnect_punctuation: bool
+    :param add_vroot: adds a virtual root node labelled 'VROOT'
+    :type add_vroot: bool
+    :param mode: either 'STANDARD' (no lemma field) or 'DISCO-DOP' (lemma field)
+    :type mode: str
+    :param secedge: add secondary edges
+    :type secedge: bool
+    :param cache_dir: folder of the cache, defaults to CORPUS_CACHE
+    :type cache_dir: str
+    :param workers: number of processes to parse the corpus with in case of a cache miss
+    :type workers: int
+    :return: memory mapped arrays of the parsed corpus
+    :rtype: PackedCorpus
+    """
+    cache_dir = expanduser(cache_dir or CORPUS_CACHE)
+    key = corpus_cache_key(path, enc, disconnect_punctuation, add_vroot, mode, secedge)
+    cache_file = os.path.join(cache_dir, key + '.pcorpus')
+    if os.path.exists(cache_file):
+        try:
+            return PackedCorpus.read(cache_file)
+        except (ValueError, struct.error):
+            # a truncated or corrupt entry, e.g. left by an interrupted copy, is rebuilt
+            os.remove(cache_file)
+    trees = sentence_names_to_hybridtrees_parallel(None, path, enc, disconnect_punctuation, add_vroot, mode,
+                                                   secedge, workers)
+    os.makedirs(cache_dir, exist_ok=True)
+    (trees.corpus() if isinstance(trees, PackedTrees) else pack_trees(trees)).write(cache_file)
+    return PackedCorpus.read(cache_file)
+
+
+def sentence_names_to_hybridtrees_cached(names,
+                                         path,
+                                         enc="utf-8",
+                                         disconnect_punctuation=True,
+                                         add_vroot=False,
+                                         mode="STANDARD",
+                                         secedge=False,
+                                         cache_dir=None,
+                                         workers=1):
+    """
+    Same as sentence_names_to_hybridtrees, but the parsed corpus is kept in a binary cache (cf. cached_packed_corpus).
+    :param names:  list of sentence identifiers, or None to load all sentences
+    :type names: Iterable[str]
+    :return: list of constituent structures (HybridTrees or HybridDags) from file_name whose names are in names
+    """
+    packed = cached_packed_corpus(path, enc, disconnect_punctuation, add_vroot, mode, secedge, cache_dir, workers)
+    labels = packed.labels + [None]
+    names = None if names is None else frozenset(names)
+    return [packed.tree(t, labels) for t, name in enumerate(packed.names()) if names is None or name in names]
+
+
 def generate_ids_for_inner_nodes_dag(dag, order, idNum):
     counter = 500
+    full_yield = set(dag.full_yield())
     for node in order:
-        if node not in dag.full_yield():
+        if node not in full_yield:
             idNum[node] = counter
             counter += 1
 
 
+def _assign_ids_in_preorder(tree, roots, count, idNum):
+    """
+    assigns count - 1, count - 2, … to the inner nodes below roots in pre-order
+    :return: the last assigned id (or count if no id was assigned)
+    :rtype: int
+    """
+    id_yield = set(tree.id_yield())
+    for node in preorder(roots, tree.children):
+        if node not in id_yield:
+            count -= 1
+            idNum[node] = count
+    return count
+
+
+def _number_of_inner_nodes(tree):
+    full_yield = set(tree.full_yield())
+    return sum(1 for n in tree.nodes() if n not in full_yield)
+
+
 def generate_ids_for_inner_nodes(tree, node_id, idNum):
     """
     generates a dictionary which assigns each tree id an numeric id as required by export format
@@ -190,81 +609,127 @@ def generate_ids_for_inner_nodes(tree, node_id, idNum):
     :type: dict
     :return: nothing
     """
-    count = 500+len([n for n in tree.nodes() if n not in tree.full_yield()])
-
-    if len(idNum) is not 0:
+    if len(idNum) != 0:
         count = min(idNum.values())
+    else:
+        count = 500 + _number_of_inner_nodes(tree)
+    _assign_ids_in_preorder(tree, [node_id], count, idNum)
 
-    if node_id not in tree.id_yield():
-        idNum[node_id] = count-1
-
-    for child in tree.children(node_id):
-        generate_ids_for_inner_nodes(tree, child, idNum)
 
-    return
+def inner_node_ids(tree):
+    """
+    assigns the numeric ids of all inner nodes in one traversal, the result is the same as of calling
+    generate_ids_for_inner_nodes (or generate_ids_for_inner_nodes_dag) for each root
+    :param tree: parse tree
+    :type: ConstituentTree|HybridDag
+    :return: dictionary mapping node id to a numeric id
+    :rtype: dict
+    """
+    idNum = {}
+    if isinstance(tree, HybridDag):
+        top_order = tree.topological_order()
+        assert top_order is not None
+        generate_ids_for_inner_nodes_dag(tree, top_order, idNum)
+    else:
+        _assign_ids_in_preorder(tree, tree.root, 500 + _number_of_inner_nodes(tree), idNum)
+    return idNum
 
 
-def hybridtree_to_sentence_name(tree, idNum):
+def hybridtree_to_sentence_lines(tree, idNum):
     """
     generates lines for given tree in export format
     :param tree: parse tree
     :type: ConstituentTree
     :param idNum: dictionary mapping node id to a numeric id
     :type: dict
-    :return: list of lines
-    :rtype: list of str
+    :return: generator of lines (without line breaks)
+    :rtype: Iterable[str]
     """
-    lines = []
+    full_yield = tree.full_yield()
+    id_yield = set(tree.id_yield())
+    roots = set(tree.root)
+    is_dag = isinstance(tree, HybridDag)
+    morph = u'--'
 
-    for leaf in tree.full_yield():
+    for leaf in full_yield:
         token = tree.node_token(leaf)
-        morph = u'--'
-        # if not isinstance(token.form(), str):
-        #     print(token.form(), type(token.form()))
-        #     assert isinstance(token.form(), str)
         line = [token.form(), token.pos(), morph, token.edge()]
 
         # special handling of disconnected punctuation
-        if leaf in tree.id_yield() and leaf not in tree.root:
-            if tree.parent(leaf) is None or tree.parent(leaf) not in idNum:
-                print(tree, leaf, tree.full_yield(), list(map(str, tree.full_token_yield())), tree.parent(leaf),
-                      tree.parent(leaf) in idNum)
-                assert False and "Words (i.e. leaves) should not have secondary children!"
-            line.append(str(idNum[tree.parent(leaf)]))
+        if leaf in id_yield and leaf not in roots:
+            parent = tree.parent(leaf)
+            if parent is None or parent not in idNum:
+                raise ValueError("Words (i.e. leaves) should not have secondary children! (leaf %s of sentence %s)"
+                                 % (leaf, tree.sent_label()))
+            line.append(str(idNum[parent]))
         else:
             line.append(u'0')
 
-        if isinstance(tree, HybridDag):
+        if is_dag:
             for p in tree.sec_parents(leaf):
                 line.append(token.edge())
                 line.append(str(idNum[p]))
 
-        lines.append(u'\t'.join(line))
+        yield u'\t'.join(line)
 
+    leaves = set(full_yield)
     category_lines = []
 
-    for node in [n for n in tree.nodes() if n not in tree.full_yield()]:
+    for node in tree.nodes():
+        if node in leaves:
+            continue
         token = tree.node_token(node)
-        morph = u'--'
-
         line = [u'#' + str(idNum[node]), str(token.category()), morph, token.edge()]
 
-        if node in tree.root:
+        if node in roots:
             line.append(u'0')
-        elif node not in tree.root:
+        else:
             line.append(str(idNum[tree.parent(node)]))
 
-        if isinstance(tree, HybridDag):
+        if is_dag:
             for p in tree.sec_parents(node):
                 line.append(token.edge())
                 line.append(str(idNum[p]))
 
         category_lines.append(line)
 
-    for line in sorted(category_lines, key=lambda l: l[0]):
-        lines.append(u'\t'.join(line))
+    category_lines.sort(key=lambda l: l[0])
+    for line in category_lines:
+        yield u'\t'.join(line)
+
+
+def hybridtree_to_sentence_name(tree, idNum):
+    """
+    generates lines for given tree in export format
+    :param tree: parse tree
+    :type: ConstituentTree
+    :param idNum: dictionary mapping node id to a numeric id
+    :type: dict
+    :return: list of lines
+    :rtype: list of str
+    """
+    return list(hybridtree_to_sentence_lines(tree, idNum))
+
 
-    return lines
+def write_hybridtree_to_negra(tree, out, idNum=None):
+    """
+    writes the lines of given tree in export format (without #BOS and #EOS lines), each followed by a line break;
+    an empty tree is written as a single line break, as print('\\n'.join(hybridtree_to_sentence_name(...))) did
+    :param tree: parse tree
+    :type: ConstituentTree|HybridDag
+    :param out: writable text file
+    :param idNum: dictionary mapping node id to a numeric id, computed by inner_node_ids if omitted
+    :type: dict
+    """
+    if idNum is None:
+        idNum = inner_node_ids(tree)
+    empty = True
+    for line in hybridtree_to_sentence_lines(tree, idNum):
+        out.write(line)
+        out.write(u'\n')
+        empty = False
+    if empty:
+        out.write(u'\n')
 
 
 def serialize_hybridtrees_to_negra(trees, counter, length, use_sentence_names=False):
@@ -279,15 +744,7 @@ def serialize_hybridtrees_to_negra(trees, counter, length, use_sentence_names=Fa
 
     for tree in trees:
         if len(tree.full_yield()) <= length:
-            idNum = {}
-            if isinstance(tree, HybridDag):
-                top_order = tree.topological_order()
-                assert top_order is not None
-                generate_ids_for_inner_nodes_dag(tree, top_order, idNum)
-                # print(idNum)
-            else:
-                for root in tree.root:
-                    generate_ids_for_inner_nodes(tree, root, idNum)
+            idNum = inner_node_ids(tree)
             if use_sentence_names:
                 s_name = str(tree.sent_label())
             else:
@@ -300,6 +757,68 @@ def serialize_hybridtrees_to_negra(trees, counter, length, use_sentence_names=Fa
     return sentence_names
 
 
+def _is_binary_sink(out):
+    """
+    :return: Does out expect bytes (e.g. a file opened with mode 'wb' or sys.stdout.buffer)?
+    :rtype: bool
+    """
+    if isinstance(out, io.TextIOBase):
+        return False
+    if isinstance(out, (io.RawIOBase, io.BufferedIOBase)):
+        return True
+    return 'b' in getattr(out, 'mode', '')
+
+
+def write_hybridtrees_to_negra(trees, out, counter=1, length=None, use_sentence_names=False, enc='utf-8',
+                               buffer_size=1 << 16):
+    """
+    writes a sequence of parse trees in negra export format, each #BOS … #EOS block is written as soon as its tree is
+    serialized. Unlike in the output of serialize_hybridtrees_to_negra, each line ends with a line break.
+    :param trees: parse trees, e.g. a generator
+    :type: Iterable[ConstituentTree|HybridDag]
+    :param out: writable text or binary file
+    :param counter: sentence number of the first tree (if sentence names are not used)
+    :type: int
+    :param length: trees with more leaves are skipped (no limit if None)
+    :type: int
+    :param use_sentence_names: use the sentence labels of the trees instead of consecutive numbers
+    :type: bool
+    :param enc: encoding for binary files
+    :type: str
+    :param buffer_size: number of characters that are collected before they are written at once
+    :type: int
+    :return: sentence number after the last written tree
+    :rtype: int
+    """
+    binary = _is_binary_sink(out)
+    buffer = []
+    buffered = 0
+
+    def flush():
+        data = u''.join(buffer)
+        out.write(data.encode(enc) if binary else data)
+        del buffer[:]
+
+    for tree in trees:
+        if length is not None and len(tree.full_yield()) > length:
+            continue
+        s_name = str(tree.sent_label()) if use_sentence_names else str(counter)
+        block = [u'#BOS ' + s_name]
+        block.extend(hybridtree_to_sentence_lines(tree, inner_node_ids(tree)))
+        block.append(u'#EOS ' + s_name + u'\n')
+        block = u'\n'.join(block)
+        buffer.append(block)
+        buffered += len(block)
+        if buffered >= buffer_size:
+            flush()
+            buffered = 0
+        counter += 1
+
+    if buffer:
+        flush()
+    return counter
+
+
 def negra_to_json(dsg, terminal_encoding, terminal_labeling, delimiter=' : '):
     """
     :param dsg:
@@ -309,14 +828,17 @@ def negra_to_json(dsg, terminal_encoding, terminal_labeling, delimiter=' : '):
     """
 
     node_io = {}
+    # number of nodes and edges of G1 so far
+    edge_idx = 0
+    next_node_idx = 0
 
     def dag_to_json():
+        nonlocal edge_idx
+        nonlocal next_node_idx
         data = {"type": "hypergraph"}
         data['nodes'] = []
         data['edges'] = []
 
-        edge_idx = 0
-        next_node_idx = 0
         sec_children = defaultdict(lambda: [])
 
         def dag_to_json_rec(node, node_idx):
@@ -391,11 +913,12 @@ def negra_to_json(dsg, terminal_encoding, terminal_labeling, delimiter=' : '):
 
     data = {"type": "bihypergraph"}
     data["G1"] = dag_to_json()
-    # print(data["G2"])
-    max_node = max(data["G1"]['nodes'])
-    max_edge = max(map(lambda x: x['id'], data["G1"]['edges']))
-    data["G2"] = string_to_graph_json(dsg.token_yield(), start_node=max_node + 1, start_edge=max_edge + 1)
-    max_edge = max(map(lambda x: x['id'], data["G2"]['edges']))
+    # the nodes and edges of G1 are numbered consecutively from 0
+    max_node = next_node_idx - 1
+    max_edge = edge_idx - 1
+    token_yield = dsg.token_yield()
+    data["G2"] = string_to_graph_json(token_yield, start_node=max_node + 1, start_edge=max_edge + 1)
+    max_edge += len(token_yield)
     data["alignment"] = [{'id': j + max_edge + 1,
                           'label': -1,
                            'attachment': [node_io[idx][0], max_node + 1 + j]}
@@ -413,5 +936,47 @@ def export_corpus_to_json(corpus, terminals, terminal_labeling=str, delimiter='
     return data
 
 
-__all__ = ["sentence_names_to_hybridtrees", "serialize_hybridtrees_to_negra", "hybridtree_to_sentence_name",
-           "serialize_acyclic_dogs_to_negra", "serialize_hybrid_dag_to_negra", "negra_to_json", "export_corpus_to_json"]
+def write_corpus_to_json_lines(corpus, terminals, out, terminal_labeling=str, delimiter=' : '):
+    """
+    Streaming form of export_corpus_to_json: the first line holds the alignmentLabel and nonterminalEdgeLabel, each
+    following line the bihypergraph of one sentence. Only one sentence is held in memory at a time.
+    :type corpus: Iterable[HybridDag]
+    :param out: text stream to write to
+    :return: the number of sentences
+    :rtype: int
+    """
+    header = {"alignmentLabel": terminals.object_index(None),
+              "nonterminalEdgeLabel": terminals.object_index(None)}
+    out.write(json.dumps(header) + '\n')
+    count = 0
+    for dsg in corpus:
+        data = negra_to_json(dsg, terminals, terminal_labeling=terminal_labeling, delimiter=delimiter)
+        out.write(json.dumps(data) + '\n')
+        count += 1
+    return count
+
+
+def write_corpus_to_binary(corpus, terminals, path, terminal_labeling=str, delimiter=' : '):
+    """
+    Writes the bihypergraphs of export_corpus_to_json in the binary layout of bihypergraph_file, which can be mapped
+    into memory with BihypergraphCorpus. Only one sentence is held in memory at a time.
+    :type corpus: Iterable[HybridDag]
+    :param path: file to store the corpus in, it is replaced atomically
+    :type path: str
+    :return: the number of sentences
+    :rtype: int
+    """
+    alignment_label = terminals.object_index(None)
+    nonterminal_edge_label = terminals.object_index(None)
+    bihypergraphs = (negra_to_json(dsg, terminals, terminal_labeling=terminal_labeling, delimiter=delimiter)
+                     for dsg in corpus)
+    return write_bihypergraphs(bihypergraphs, path, alignment_label, nonterminal_edge_label)
+
+
+__all__ = ["sentence_names_to_hybridtrees", "sentence_names_to_hybridtrees_fast",
+           "sentence_names_to_hybridtrees_iter", "sentence_names_to_hybridtrees_parallel",
+           "sentence_names_to_hybridtrees_cached", "cached_packed_corpus", "serialize_hybridtrees_to_negra",
+           "write_hybridtrees_to_negra", "hybridtree_to_sentence_name", "hybridtree_to_sentence_lines",
+           "write_hybridtree_to_negra", "inner_node_ids",
+           "serialize_acyclic_dogs_to_negra", "serialize_hybrid_dag_to_negra", "negra_to_json", "export_corpus_to_json",
+           "write_corpus_to_json_lines", "write_corpus_to_binary"]
@@ -0,0 +1,356 @@
+"""Compact representation of a list of ConstituentTrees and HybridDags as an interned label table and flat integer
+arrays. It is used to transfer parsed corpora between processes and to cache them on disk."""
+from __future__ import print_function, unicode_literals
+
+import bisect
+import gc
+import mmap
+import os
+import struct
+from array import array
+from collections.abc import Sequence
+
+from .constituent_tree import ConstituentTree
+from .general_hybrid_tree import HybridDag
+from .monadic_tokens import ConstituentCategory, ConstituentTerminal
+
+TREE_CLASSES = [ConstituentTree, HybridDag]
+NONE = -1
+
+# All arrays are flat. For each tree t, its nodes are the rows node_ptr[t] … node_ptr[t + 1] - 1 of the node_* arrays,
+# and similarly for the other *_ptr arrays. Strings (node ids, sentence names and all token fields) are stored as
+# indices in the label table.
+ARRAYS = [
+    # tree class (index in TREE_CLASSES) and sentence name of each tree
+    'tree_class', 'tree_name',
+    # nodes in the order of HybridTree.nodes(): id, 1 for terminals, category/form, part-of-speech, edge, lemma and the
+    # row of the parent node (NONE for roots and disconnected nodes)
+    'node_ptr', 'node_id', 'node_terminal', 'node_label', 'node_pos', 'node_edge', 'node_lemma', 'node_parent',
+    # rows of the nodes in HybridTree.full_yield() and HybridTree.id_yield()
+    'full_ptr', 'full', 'ordered_ptr', 'ordered',
+    # parent-child relation: ids of the parents (including the virtual root) and their lists of child ids
+    'key_ptr', 'key', 'child_ptr', 'child',
+    # HybridDag only: secondary edges (parent id, child id, edge label) and the secondary parents of each node
+    'sec_ptr', 'sec_parent', 'sec_child', 'sec_label', 'sec_parents_ptr', 'sec_parents_child', 'sec_parents_parent'
+]
+
+# arrays that hold indices in the label table, the remaining arrays hold classes, flags, pointers and rows
+LABEL_ARRAYS = frozenset([
+    'tree_name', 'node_id', 'node_label', 'node_pos', 'node_edge', 'node_lemma', 'key', 'child',
+    'sec_parent', 'sec_child', 'sec_label', 'sec_parents_child', 'sec_parents_parent'
+])
+
+FILE_MAGIC = b'PCRP'
+FILE_VERSION = 1
+# magic, version, number of labels, byte length of the label table
+FILE_HEADER = struct.Struct('<4sIIQ')
+# number of entries of an array
+FILE_ARRAY_HEADER = struct.Struct('<Q')
+
+
+def _padding(length):
+    return b'\0' * (-length % 8)
+
+
+class PackedCorpus:
+    """
+    A list of ConstituentTrees or HybridDags stored in flat integer arrays. Terminal tokens with morphological
+    features are not supported.
+    """
+
+    def __init__(self):
+        self.labels = []
+        self.__label_index = {}
+        for name in ARRAYS:
+            setattr(self, name, array('i', [0]) if name.endswith('_ptr') else array('i'))
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        del state['_PackedCorpus__label_index']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__label_index = None
+
+    def __len__(self):
+        return len(self.tree_class)
+
+    def label(self, string):
+        """
+        :param string: some string or None
+        :type string: str
+        :return: index of the string in the label table, it is added if necessary
+        :rtype: int
+        """
+        if string is None:
+            return NONE
+        if self.__label_index is None:
+            self.__label_index = {label: index for index, label in enumerate(self.labels)}
+        index = self.__label_index.get(string)
+        if index is None:
+            index = len(self.labels)
+            self.labels.append(string)
+            self.__label_index[string] = index
+        return index
+
+    def append(self, tree):
+        """
+        :param tree: adds a tree at the end
+        :type tree: ConstituentTree|HybridDag
+        """
+        label = self.label
+        self.tree_class.append(TREE_CLASSES.index(type(tree)))
+        self.tree_name.append(label(tree.sent_label()))
+
+        rows = {}
+        for node in tree.nodes():
+            rows[node] = len(rows)
+            token = tree.node_token(node)
+            self.node_id.append(label(node))
+            if isinstance(token, ConstituentTerminal):
+                if token.morph_feats():
+                    raise ValueError("terminals with morphological features cannot be packed")
+                self.node_terminal.append(1)
+                self.node_label.append(label(token.form()))
+                self.node_pos.append(label(token.pos()))
+                self.node_lemma.append(label(token.lemma()))
+            else:
+                self.node_terminal.append(0)
+                self.node_label.append(label(token.category()))
+                self.node_pos.append(NONE)
+                self.node_lemma.append(NONE)
+            self.node_edge.append(label(token.edge()))
+        for node in tree.nodes():
+            self.node_parent.append(rows.get(tree.parent(node), NONE))
+        self.node_ptr.append(len(self.node_id))
+
+        self.full.extend(rows[node] for node in tree.full_yield())
+        self.full_ptr.append(len(self.full))
+        self.ordered.extend(rows[node] for node in tree.id_yield())
+        self.ordered_ptr.append(len(self.ordered))
+
+        for key, children in tree._id_to_child_ids.items():
+            self.key.append(label(key))
+            self.child.extend(label(child) for child in children)
+            self.child_ptr.append(len(self.child))
+        self.key_ptr.append(len(self.key))
+
+        if isinstance(tree, HybridDag):
+            for parent, children in tree._id_to_sec_children.items():
+                for child, edge in zip(children, tree.sec_child_edge_labels(parent)):
+                    self.sec_parent.append(label(parent))
+                    self.sec_child.append(label(child))
+                    self.sec_label.append(label(edge))
+            for child, parents in tree._sec_parents.items():
+                for parent in parents:
+                    self.sec_parents_child.append(label(child))
+                    self.sec_parents_parent.append(label(parent))
+        self.sec_ptr.append(len(self.sec_parent))
+        self.sec_parents_ptr.append(len(self.sec_parents_child))
+
+    def write(self, path):
+        """
+        :param path: file to store the corpus in, it is replaced atomically
+        :type path: str
+        """
+        table = '\0'.join(self.labels).encode('utf-8')
+        if len(self.labels) != (table.count(b'\0') + 1 if self.labels else 0):
+            raise ValueError("labels must not contain null characters")
+        tmp = path + '.%d.tmp' % os.getpid()
+        with open(tmp, 'wb') as packed:
+            packed.write(FILE_HEADER.pack(FILE_MAGIC, FILE_VERSION, len(self.labels), len(table)))
+            packed.write(table + _padding(FILE_HEADER.size + len(table)))
+            for name in ARRAYS:
+                data = getattr(self, name)
+                if not isinstance(data, array):
+                    data = array('i', data)
+                packed.write(FILE_ARRAY_HEADER.pack(len(data)))
+                packed.write(data.tobytes() + _padding(len(data) * data.itemsize))
+        os.replace(tmp, path)
+
+    @staticmethod
+    def read(path):
+        """
+        Maps a file that was written by PackedCorpus.write into memory. The arrays of the returned corpus are read-only
+        views into the file, so no trees can be appended. Raises ValueError or struct.error if the file is not a complete
+        packed corpus.
+        :param path: file that contains a packed corpus
+        :type path: str
+        :rtype: PackedCorpus
+        """
+        with open(path, 'rb') as packed:
+            data = mmap.mmap(packed.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, n_labels, table_length = FILE_HEADER.unpack_from(data, 0)
+        if magic != FILE_MAGIC or version != FILE_VERSION:
+            raise ValueError("%s is not a packed corpus of version %d" % (path, FILE_VERSION))
+        corpus = PackedCorpus()
+        offset = FILE_HEADER.size
+        corpus.labels = data[offset:offset + table_length].decode('utf-8').split('\0') if n_labels else []
+        corpus.__label_index = None
+        offset += table_length + len(_padding(offset + table_length))
+        view = memoryview(data)
+        for name in ARRAYS:
+            length, = FILE_ARRAY_HEADER.unpack_from(data, offset)
+            offset += FILE_ARRAY_HEADER.size
+            if offset + 4 * length > len(data):
+                raise ValueError("%s is truncated" % path)
+            setattr(corpus, name, view[offset:offset + 4 * length].cast('i'))
+            offset += 4 * length + len(_padding(4 * length))
+        return corpus
+
+    def names(self):
+        """
+        :return: the sentence name of each tree
+        :rtype: list[str]
+        """
+        labels = self.labels + [None]
+        return [labels[name] for name in self.tree_name]
+
+    def extend(self, trees):
+        for tree in trees:
+            self.append(tree)
+
+    @staticmethod
+    def concatenate(corpora):
+        """
+        Joins packed corpora without rebuilding their trees. The label tables are merged and the label indices and
+        pointers of each corpus are shifted accordingly.
+        :type corpora: Iterable[PackedCorpus]
+        :rtype: PackedCorpus
+        """
+        joined = PackedCorpus()
+        for corpus in corpora:
+            # index NONE (-1) picks the last entry
+            mapping = [joined.label(label) for label in corpus.labels] + [NONE]
+            for name in ARRAYS:
+                target, source = getattr(joined, name), getattr(corpus, name)
+                if name.endswith('_ptr'):
+                    offset = target[-1]
+                    target.extend(offset + pointer for pointer in source[1:])
+                elif name in LABEL_ARRAYS:
+                    target.extend(mapping[label] for label in source)
+                else:
+                    target.extend(source)
+        return joined
+
+    def tree(self, t, labels=None):
+        """
+        :param t: index of the tree
+        :type t: int
+        :param labels: the label table followed by None (for NONE), to avoid copying it for each tree
+        :type labels: list[str]
+        :return: the t-th tree
+        :rtype: ConstituentTree|HybridDag
+        """
+        if labels is None:
+            labels = self.labels + [None]
+
+        tree_class = TREE_CLASSES[self.tree_class[t]]
+        first, last = self.node_ptr[t], self.node_ptr[t + 1]
+        ids = [labels[node] for node in self.node_id[first:last]]
+        tokens = {}
+        for node, terminal, label, pos, edge, lemma in zip(
+                ids, self.node_terminal[first:last], self.node_label[first:last], self.node_pos[first:last],
+                self.node_edge[first:last], self.node_lemma[first:last]):
+            if terminal:
+                tokens[node] = ConstituentTerminal(labels[label], labels[pos], labels[edge], None, labels[lemma])
+            else:
+                tokens[node] = ConstituentCategory(labels[label], labels[edge])
+
+        child_ids = {}
+        child_ptr = self.child_ptr
+        for k in range(self.key_ptr[t], self.key_ptr[t + 1]):
+            child_ids[labels[self.key[k]]] = [labels[child] for child in self.child[child_ptr[k]:child_ptr[k + 1]]]
+        # the parents of the roots (the virtual root) are added by from_nodes
+        parents = {}
+        for node, parent in zip(ids, self.node_parent[first:last]):
+            if parent != NONE:
+                parents[node] = ids[parent]
+
+        # the yields in their stored order, which need not be the order of the nodes
+        arguments = [labels[self.tree_name[t]], tokens,
+                     [ids[row] for row in self.full[self.full_ptr[t]:self.full_ptr[t + 1]]],
+                     [ids[row] for row in self.ordered[self.ordered_ptr[t]:self.ordered_ptr[t + 1]]],
+                     child_ids, parents]
+        if tree_class is HybridDag:
+            sec_children, sec_child_labels, sec_parents = {}, {}, {}
+            for s in range(self.sec_ptr[t], self.sec_ptr[t + 1]):
+                parent = labels[self.sec_parent[s]]
+                sec_children.setdefault(parent, []).append(labels[self.sec_child[s]])
+                sec_child_labels.setdefault(parent, []).append(labels[self.sec_label[s]])
+            for s in range(self.sec_parents_ptr[t], self.sec_parents_ptr[t + 1]):
+                sec_parents.setdefault(labels[self.sec_parents_child[s]], []).append(labels[self.sec_parents_parent[s]])
+            arguments += [sec_children, sec_child_labels, sec_parents]
+        return tree_class.from_nodes(*arguments)
+
+    def trees(self):
+        """
+        :return: all trees in order
+        :rtype: list[ConstituentTree|HybridDag]
+        """
+        labels = self.labels + [None]
+        # the trees only add objects, so the cyclic garbage collector would repeatedly traverse them for nothing
+        enabled = gc.isenabled()
+        gc.disable()
+        try:
+            return [self.tree(t, labels) for t in range(len(self))]
+        finally:
+            if enabled:
+                gc.enable()
+
+
+class PackedTrees(Sequence):
+    """
+    Read-only list of the trees of one or more packed corpora. Each tree is rebuilt from the arrays the first time it
+    is accessed.
+    """
+
+    def __init__(self, corpora):
+        """
+        :type corpora: Iterable[PackedCorpus]
+        """
+        self.corpora = list(corpora)
+        self.__starts = [0]
+        for corpus in self.corpora:
+            self.__starts.append(self.__starts[-1] + len(corpus))
+        self.__labels = [None] * len(self.corpora)
+        self.__trees = [None] * self.__starts[-1]
+
+    def __len__(self):
+        return len(self.__trees)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("tree index out of range")
+        tree = self.__trees[index]
+        if tree is None:
+            c = bisect.bisect_right(self.__starts, index) - 1
+            if self.__labels[c] is None:
+                self.__labels[c] = self.corpora[c].labels + [None]
+            tree = self.__trees[index] = self.corpora[c].tree(index - self.__starts[c], self.__labels[c])
+        return tree
+
+    def corpus(self):
+        """
+        :return: all trees in one packed corpus
+        :rtype: PackedCorpus
+        """
+        return self.corpora[0] if len(self.corpora) == 1 else PackedCorpus.concatenate(self.corpora)
+
+
+def pack_trees(trees):
+    """
+    :type trees: Iterable[ConstituentTree|HybridDag]
+    :rtype: PackedCorpus
+    """
+    packed = PackedCorpus()
+    packed.extend(trees)
+    return packed
+
+
+__all__ = ["PackedCorpus", "PackedTrees", "pack_trees"]
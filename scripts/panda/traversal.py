@@ -0,0 +1,88 @@
+"""Iterative traversals of trees and DAGs whose nodes are given by a function that returns the list of children (or
+dependencies) of a node. None of them uses recursion, so they work for arbitrarily deep structures."""
+from __future__ import print_function, unicode_literals
+
+from collections import defaultdict
+
+
+def preorder(roots, children):
+    """
+    :param roots: nodes to start with
+    :type roots: list
+    :param children: returns the list of children of a node
+    :type children: function
+    :return: the roots and all nodes below them in pre-order, children from left to right; like the recursive
+        traversal, a node is visited once for each path to it
+    :rtype: Iterable
+    """
+    stack = list(reversed(roots))
+    while stack:
+        node = stack.pop()
+        yield node
+        stack.extend(reversed(children(node)))
+
+
+def postorder(roots, children):
+    """
+    :param roots: nodes to start with
+    :type roots: list
+    :param children: returns the list of children of a node
+    :type children: function
+    :return: the roots and all nodes below them in post-order, children from left to right; like the recursive
+        traversal, a node is visited once for each path to it
+    :rtype: Iterable
+    """
+    # the reverse of the pre-order that visits the children from right to left
+    order = []
+    stack = list(roots)
+    while stack:
+        node = stack.pop()
+        order.append(node)
+        stack.extend(children(node))
+    return reversed(order)
+
+
+def topological_order(nodes, dependencies):
+    """
+    Kahn's algorithm. The order is the same as the one obtained by scanning the nodes repeatedly in the given order
+    and appending each node whose dependencies were all appended before, until nothing changes. Each node gets the
+    number of the scan it is appended in, which is computed when its last dependency is removed, and the nodes are
+    sorted by this number and their position in nodes.
+    :param nodes: all nodes
+    :type nodes: Iterable
+    :param dependencies: returns the list of nodes that must precede a node
+    :type dependencies: function
+    :return: all nodes, each after its dependencies, or None if there is a cycle or a dependency on a node that is
+        not in nodes
+    :rtype: list
+    """
+    nodes = list(nodes)
+    position = {node: index for index, node in enumerate(nodes)}
+    # number of dependencies of each node that are not in the order yet, and the nodes that depend on each node (by
+    # position); a dependency that is not in nodes is never removed
+    missing = []
+    dependents = {}
+    for index, node in enumerate(nodes):
+        requirements = dependencies(node)
+        missing.append(len(requirements))
+        for requirement in requirements:
+            dependents.setdefault(position.get(requirement), []).append(index)
+
+    scan = [0] * len(nodes)
+    ready = [index for index, count in enumerate(missing) if count == 0]
+    for index in ready:
+        for dependent in dependents.get(index, ()):
+            # a dependency at a later position is only appended in the scan after its own
+            number = scan[index] + (index > dependent)
+            if number > scan[dependent]:
+                scan[dependent] = number
+            missing[dependent] -= 1
+            if missing[dependent] == 0:
+                ready.append(dependent)
+
+    if len(ready) != len(nodes):
+        return None
+    ready.sort(key=lambda index: (scan[index], index))
+    return [nodes[index] for index in ready]
+
+__all__ = ["preorder", "postorder", "topological_order"]
@@ -1,60 +1,87 @@
 # Parses the output of GF and prints the parse trees in bracket format
 # to stdout and the parse time to stderr.
 
-from sys import stderr
+from sys import stderr, stdout
 import re
-from panda.general_hybrid_tree import HybridTree
-from panda.monadic_tokens import construct_constituent_token
-from panda.negra_parse import hybridtree_to_sentence_name, generate_ids_for_inner_nodes
-
-def remove_dummy_pos(tree):
-    ntree = HybridTree()
-    pos_idxs = dict()
-    for idx in tree.full_yield():
-        token = tree.node_token(idx)
-        ptoken = tree.node_token(tree.parent(idx))
-        pos_idxs[tree.parent(idx)] = idx
-        ntoken = construct_constituent_token(token.form(), ptoken.category(), True)
-        ntree.add_node(idx, ntoken, True)
-    for idx in tree.nodes():
-        if idx in pos_idxs:
-            ntree.add_child(tree.parent(idx), pos_idxs[idx])
-            if idx in tree.root:
-                ntree.add_to_root(pos_idxs[idx])
-        elif idx in tree.full_yield():
-            continue
-        else:
-            ntree.add_node(idx, tree.node_token(idx), False)
-            ntree.add_child(tree.parent(idx), idx)
-            if idx in tree.root:
-                ntree.add_to_root(idx)
-    return ntree
-
-def gfdot_to_negra(s_):
-    tree = HybridTree()
-    i = 0
+
+# declaration of a node and edge between two nodes in GF's dot output; the
+# ids of terminal nodes start at 100000
+node_pattern = re.compile(r'(n\d+)\[label="([^\s]+)"\]')
+edge_pattern = re.compile(r'^(n\d+) -- (n\d+) \[style = "(?:dashed|solid)"\]$')
+first_terminal = 100000
+
+def gfdot_to_export_lines(s_):
+    # converts a parse tree in GF's dot format to the lines of a sentence in
+    # export format (without #BOS and #EOS); the dummy part-of-speech node
+    # above each terminal is collapsed into the terminal, which is attached
+    # to the parent of the part-of-speech node
+    labels = {}
+    terminals = []
+    inner = []
+    roots = []
+    parent = {}
     for line in s_:
-        match = re.search(r'(n\d+)\[label="([^\s]+)"\]', line)
+        match = node_pattern.search(line)
         if match:
             (node_id, label) = match.group(1, 2)
-            order = int(node_id[1:]) >= 100000
-            if order:
-                tree.add_node(node_id, construct_constituent_token(form=label, pos='_', terminal=True), True)
-                i += 1
+            if int(node_id[1:]) >= first_terminal:
+                terminals.append(node_id)
             else:
-                tree.add_node(node_id, construct_constituent_token(form=label, pos='_', terminal=False), False)
+                inner.append(node_id)
+            labels[node_id] = label
             if label == 'VROOT1':
-                tree.add_to_root(node_id)
+                roots.append(node_id)
             continue
-        match = re.search(r'^(n\d+) -- (n\d+) \[style = "(?:dashed|solid)"\]$', line)
+        match = edge_pattern.match(line)
         if match:
-            (parent, child) = match.group(1, 2)
-            tree.add_child(parent, child)
-    tree = remove_dummy_pos(tree)
-    idNum = {}
-    for root in tree.root:
-        generate_ids_for_inner_nodes(tree, root, idNum)
-    return '\n'.join(hybridtree_to_sentence_name(tree, idNum))
+            (parent_id, child_id) = match.group(1, 2)
+            parent[child_id] = parent_id
+
+    # the terminal that replaces each part-of-speech node
+    collapsed = {}
+    for terminal in terminals:
+        collapsed[parent[terminal]] = terminal
+    children = {}
+    for node in inner:
+        children.setdefault(parent.get(node), []).append(collapsed.get(node, node))
+    roots = [collapsed.get(node, node) for node in roots]
+    categories = [node for node in inner if node not in collapsed]
+
+    root_set = set(roots)
+    terminal_set = set(terminals)
+    # numeric ids in pre-order, counting down from 499 + number of inner nodes
+    ids = {}
+    count = 500 + len(categories)
+    stack = list(reversed(roots))
+    while stack:
+        node = stack.pop()
+        if node not in terminal_set:
+            count -= 1
+            ids[node] = count
+        stack.extend(reversed(children.get(node, [])))
+
+    for terminal in terminals:
+        pos = parent[terminal]
+        head = '0' if terminal in root_set else str(ids[parent.get(pos)])
+        yield "%s\t%s\t--\t--\t%s" % (labels[terminal], labels[pos], head)
+    lines = []
+    for node in categories:
+        head = '0' if node in root_set else str(ids[parent.get(node)])
+        lines.append("#%d\t%s\t--\t--\t%s" % (ids[node], labels[node], head))
+    # sorted as strings, like the lines of panda's export writer
+    lines.sort()
+    for line in lines:
+        yield line
+
+def gfdot_to_negra(s_, out):
+    empty = True
+    for line in gfdot_to_export_lines(s_):
+        out.write(line)
+        out.write("\n")
+        empty = False
+    # a tree without nodes is an empty line, like the former print of the joined lines
+    if empty:
+        out.write("\n")
 
 def eprint(*args, **kwargs):
     print(*args, file=stderr, **kwargs)
@@ -72,45 +99,59 @@ def gf_escape(s):
             .replace("\"", "DQ") \
             .replace("'", "SQ")
 
-def print_noparse(wplist, id):
-    print("#BOS {}".format(id))
+def print_noparse(wplist, id, out=stdout):
+    print("#BOS {}".format(id), file=out)
     for (word, pos) in wplist:
-        print("%s\t%s\t--\t--\t500" %(word, pos))
-    print("#500\tNOPARSE\t--\t--\t0")
-    print("#EOS {}".format(id))
+        print("%s\t%s\t--\t--\t500" %(word, pos), file=out)
+    print("#500\tNOPARSE\t--\t--\t0", file=out)
+    print("#EOS {}".format(id), file=out)
 
-if __name__ == "__main__":
-    import re
-    from sys import stdin, argv
-
-    assert len(argv) == 2, "use %s <sentence file>" %argv[0]
+sentence = re.compile(r"""^(\d+)\s+(.*)$""")
+word_pos = re.compile(r"""([^\s]+)/([^\s/]+)""")
 
-    time = re.compile(r"""^(\d+ ms)ec$""")
-    tree = re.compile(r"""^graph \{""")
-    sentence = re.compile(r"""^(\d+)\s+(.*)$""") 
-    word_pos = re.compile(r"""([^\s]+)/([^\s/]+)""")
+def read_sentences(path):
+    # returns the ids of the sentences in a sentence file and their words and
+    # part-of-speech tags, escaped like gf's input
     sentences = []
     ids = []
-    with open(argv[1]) as sentence_file:
+    with open(path) as sentence_file:
         for line in sentence_file:
             if line.strip():
                 id, words = sentence.match(line).group(1, 2)
                 sentences.append([(gf_escape(pos), gf_escape(word)) for (pos, word) in  word_pos.findall(words)])
                 ids.append(id)
+    return (ids, sentences)
+
+def write_parse(graph, time, wplist, id, out=stdout, err=stderr):
+    # writes the parse tree of a sentence given by the lines of gf's dot
+    # format (or a noparse if graph is None) in export format to out, and its
+    # length, parse time and success to err
+    if graph is None:
+        print_noparse(wplist, id, out)
+    else:
+        print("#BOS {}".format(id), file=out)
+        gfdot_to_negra(graph, out)
+        print("#EOS {}".format(id), file=out)
+    print("%d\t%s\t%d" %(len(wplist), time, 0 if graph is None else 1), file=err)
+
+if __name__ == "__main__":
+    from sys import stdin, argv
+
+    assert len(argv) == 2, "use %s <sentence file>" %argv[0]
+
+    time = re.compile(r"""^(\d+ ms)ec$""")
+    tree = re.compile(r"""^graph \{""")
+    (ids, sentences) = read_sentences(argv[1])
 
-    last_passed = False
+    graph = None
     index = 0
     for line in stdin:
         if not line.strip(): continue
         timem = time.match(line)
         treem = tree.match(line)
         if timem:
-            if not last_passed: print_noparse(sentences[index], ids[index])
-            eprint( "%d\t%s\t%d" %(len(sentences[index]), timem.group(1), 1 if last_passed else 0) )
+            write_parse(graph, timem.group(1), sentences[index], ids[index])
             index += 1
-            last_passed = False
+            graph = None
         elif treem:
-            print("#BOS {}".format(ids[index]))
-            print(gfdot_to_negra(line.split("%;;%")))
-            print("#EOS {}".format(ids[index]))
-            last_passed = True
\ No newline at end of file
+            graph = line.split("%;;%")
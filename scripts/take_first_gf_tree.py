@@ -1,8 +1,10 @@
 # reads dot format from stdin and prints the first graph definition as
 # a single line
 #
-# we use this to take the first parse tree given by grammatical framework
-# which prints an endless stream of trees in dot format
+# this was used to take the first parse tree given by grammatical framework
+# which prints an endless stream of trees in dot format; gf_parse.py now
+# does this in its own process, the script is kept for the gf-parse
+# benchmark
 
 if __name__ == "__main__":
     from sys import stdin
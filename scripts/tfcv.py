@@ -4,7 +4,18 @@
 # but the trees in the corresponding test file and files with the ending ".sent"
 # that only contain the word - POS pairs.
 
+import locale
+import os
 import re
+import tempfile
+
+id_pattern = re.compile(r"^#BOS (\d+)")
+token_pattern = re.compile(r"^(#|[^#][^\s]*)\s", flags = re.MULTILINE)
+bos_pattern = re.compile(r"^(#BOS \d+)(\s+%%.*)?$")
+snd_col_pattern = re.compile(r"^([^\s]+\s+)[^\s]+\s+(.*)$")
+eos_pattern = re.compile(r"^#EOS\s\d+")
+word_pos_pattern_v3 = re.compile(r"^(#|[^#][^\s]*)\s+([^#\s]+)", re.MULTILINE)
+word_pos_pattern_v4 = re.compile(r"^(#|[^#][^\s]*)\s+[^\s]+\s+([^#\s]+)", re.MULTILINE)
 
 def ten_folds(indices):
     # iterator over inclusive ranges of indices
@@ -20,17 +31,15 @@ def ten_folds(indices):
 
 def tokens(treestr):
     # yields tokens in a tree
-    reg = re.compile("^(#|[^#][^\s]*)\s", flags = re.MULTILINE)
-    for match in reg.finditer(treestr):
+    for match in token_pattern.finditer(treestr):
         yield match.group(1)
 
 
 def fix_bos(tree):
-    reg = re.compile("^(#BOS \d+)(\s+%%.*)?$")
     treelines = tree.splitlines()
 
     try:
-        (fst, snd) = reg.search(treelines[0]).groups()
+        (fst, snd) = bos_pattern.search(treelines[0]).groups()
         treelines[0] = "{} 0 0 0{}".format(fst, snd if snd else "")
     except:
         pass
@@ -39,18 +48,135 @@ def fix_bos(tree):
 
 
 def remove_snd_col(tree):
-    reg = re.compile("^#BOS \d+$")
     treelines = tree.splitlines()
 
-    reg = re.compile("^([^\s]+\s+)[^\s]+\s+(.*)$")
     for i in range(1, len(treelines) - 1):
-        prefix = reg.match(treelines[i])
+        prefix = snd_col_pattern.match(treelines[i])
         if not prefix is None:
             treelines[i] = prefix.group(1) + prefix.group(2)
     
     return "\n".join(treelines)
 
 
+def export_blocks(lines):
+    # yields the #BOS ... #EOS blocks in an iterable of lines, such that only
+    # a single tree is held in memory at once
+    block = None
+    for line in lines:
+        if "#BOS" in line:
+            block = [line[line.index("#BOS"):].rstrip("\n")]
+        elif block is None:
+            continue
+        elif not line.strip("\n"):
+            block = None
+        elif line.startswith("#EOS"):
+            match = eos_pattern.match(line)
+            if match:
+                block.append(match.group(0))
+                yield "\n".join(block)
+            block = None
+        else:
+            block.append(line.rstrip("\n"))
+
+
+def count_trees(lines):
+    return sum(1 for _ in export_blocks(lines))
+
+
+def sentence(tree, export_format):
+    return id_pattern.search(tree).group(1) + "\t" + " ".join(["/".join(wp) for wp in word_pos(tree, export_format)])
+
+
+def copy_file_range(src, dst, offset, count):
+    return os.copy_file_range(src, dst, count, offset)
+
+def sendfile(src, dst, offset, count):
+    return os.sendfile(dst, src, offset, count)
+
+def read_write(src, dst, offset, count):
+    return os.write(dst, os.pread(src, min(count, 1 << 24), offset))
+
+# copy strategies that are tried in this order, a strategy is dropped as soon
+# as the kernel refuses it
+copy_strategies = [copy_file_range, sendfile, read_write]
+
+def copy_range(src, dst, offset, count):
+    # appends count bytes from file descriptor src starting at offset to file
+    # descriptor dst, without passing them through python if possible
+    while count > 0:
+        try:
+            copied = copy_strategies[0](src, dst, offset, count)
+        except (AttributeError, OSError):
+            if len(copy_strategies) == 1: raise
+            copy_strategies.pop(0)
+            continue
+        if copied == 0:
+            raise IOError("unexpected end of file while copying")
+        offset += copied
+        count -= copied
+
+
+def split_corpus(trees, indices, export_format, prefix, max_length, post_proc):
+    # writes all ten train and test splits (export and sent files) while
+    # reading the trees only once
+    # Each tree is post-processed exactly once. The test splits are written
+    # directly, all trees are written to a scratch file together with the
+    # byte ranges of each fold. The train splits are assembled afterwards by
+    # copying these ranges.
+    encoding = locale.getpreferredencoding(False)
+    header = "#FORMAT {}\n".format(export_format).encode(encoding)
+    tests = {}
+    empty = set()
+    for fold in range(10):
+        tests[("export", fold)] = open("%stest-%d.export" %(prefix, fold), "w")
+        tests[("export", fold)].write("#FORMAT {}\n".format(export_format))
+        tests[("sent", fold)] = open("%stest-%d.sent" %(prefix, fold), "w")
+        empty.update([("export", fold), ("sent", fold)])
+
+    def append(key, s):
+        if key in empty: empty.remove(key)
+        else: tests[key].write("\n")
+        tests[key].write(s)
+
+    folds = list(ten_folds(indices))
+    tfold = 0
+    scratch = { "export": tempfile.TemporaryFile(dir=prefix or None), "sent": tempfile.TemporaryFile(dir=prefix or None) }
+    # fold i occupies the bytes in [offsets[i], offsets[i+1]) of the scratch files
+    offsets = { ext: [0] * 11 for ext in scratch }
+    try:
+        for (index, tree) in enumerate(trees):
+            while index > folds[tfold][1]:
+                tfold += 1
+                for ext in scratch: offsets[ext][tfold] = scratch[ext].tell()
+            tree = post_proc(tree)
+            sent = sentence(tree, export_format)
+            if len(list(tokens(tree))) <= max_length:
+                append(("export", tfold), tree)
+                append(("sent", tfold), sent)
+            scratch["export"].write((tree + "\n").encode(encoding))
+            scratch["sent"].write((sent + "\n").encode(encoding))
+
+        for ext in scratch:
+            scratch[ext].flush()
+            total = scratch[ext].tell()
+            offsets[ext][tfold + 1:] = [total] * (10 - tfold)
+            for fold in range(10):
+                (start, end) = offsets[ext][fold:fold + 2]
+                trainfile = os.open("%strain-%d.%s" %(prefix, fold, ext), os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666)
+                try:
+                    if ext == "export": os.write(trainfile, header)
+                    copy_range(scratch[ext].fileno(), trainfile, 0, start)
+                    copy_range(scratch[ext].fileno(), trainfile, end, total - end)
+                    # the trees are separated, not terminated, by line breaks
+                    if start > 0 or end < total:
+                        os.ftruncate(trainfile, os.lseek(trainfile, 0, os.SEEK_CUR) - 1)
+                finally:
+                    os.close(trainfile)
+    finally:
+        for f in list(tests.values()) + list(scratch.values()):
+            f.close()
+
+
 def get_optional_arguments(dic):
     for key in dic:
         for arg in argv:
@@ -61,9 +187,6 @@ def get_optional_arguments(dic):
     return dic
 
 def word_pos(tree, export_format):
-    word_pos_pattern_v3 = re.compile(r"^(#|[^#][^\s]*)\s+([^#\s]+)", re.MULTILINE)
-    word_pos_pattern_v4 = re.compile(r"^(#|[^#][^\s]*)\s+[^\s]+\s+([^#\s]+)", re.MULTILINE)
-
     if export_format == "3":
         return word_pos_pattern_v3.findall(tree)
     elif export_format == "4":
@@ -104,35 +227,21 @@ if __name__ == "__main__":
             tree = remove_snd_col(tree)
         return tree
     
-    corpus_sep_pattern = re.compile(r"#BOS(?:(?!#EOS).+\n)+\#EOS\s\d+")
-    id_pattern = re.compile(r"^#BOS (\d+)")
     format_pattern = re.compile(r"#FORMAT (\d)")
-    
+
     with open(argv[1]) as corpus_file:
-        file_contents = corpus_file.read()
-        try:
-            form = format_pattern.search(file_contents).group(1)
-        except:
+        form = None
+        for line in corpus_file:
+            if line.startswith("#BOS"): break
+            match = format_pattern.search(line)
+            if match:
+                form = match.group(1)
+                break
+        if form is None:
             print("could not find format specification, using v4", file=stderr)
             form = "4"
-        trees = corpus_sep_pattern.findall(file_contents)
-
-        sub_corpora = [[trees[index] for index in range(first, last +1)] for (first, last) in ten_folds(len(trees))]
-
-        for (fold, test) in enumerate(sub_corpora):
-            train = [post_proc(tree) for (tfold, sub_corpus) in enumerate(sub_corpora) if tfold != fold for tree in sub_corpus]
-            test = [post_proc(tree) for tree in test]
-
-            with open("%strain-%d.export" %(prefix, fold), "w") as trainfile:
-                trainfile.write("#FORMAT {}\n".format(form) + "\n".join([tree for tree in train]))
-            with open("%stest-%d.export" %(prefix, fold), "w") as testfile:
-                testfile.write("#FORMAT {}\n".format(form) + "\n".join([testtree for testtree in test if len(list(tokens(testtree))) <= max_length]))
-            
-            with open("%strain-%d.sent" %(prefix, fold), "w") as trainsents:
-                trainsents.write(
-                    "\n".join([id_pattern.search(tree).group(1) + "\t" + " ".join(["/".join(wp) for wp in word_pos(tree, form)]) for tree in train])
-                )
-            with open("%stest-%d.sent" %(prefix, fold), "w") as testsents:
-                testsents.write(
-                    "\n".join([id_pattern.search(tree).group(1)+ "\t" + " ".join(["/".join(wp) for wp in word_pos(tree, form)]) for tree in test if len(list(tokens(tree))) <= max_length])
-                )
\ No newline at end of file
+
+        corpus_file.seek(0)
+        n_trees = count_trees(corpus_file)
+        corpus_file.seek(0)
+        split_corpus(export_blocks(corpus_file), n_trees, form, prefix, max_length, post_proc)
@@ -0,0 +1,114 @@
+# Fixtures of the tests: small corpora in export format that cover
+# discontinuous constituents, secondary edges, punctuation attached to the
+# virtual root and repeated sentence ids. The scripts are imported like they
+# import each other, i.e. with the scripts folder on the path.
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts"))
+
+# word, pos, morph, edge, parent and secondary edges (label, parent) of each line
+SENTENCES = [
+    # a discontinuous VP with punctuation inside and at the end
+    """Das	ART	--	NK	500
+Haus	NN	--	NK	500
+hat	VAFIN	--	HD	502
+er	PPER	--	SB	502
+gekauft	VVPP	--	HD	501
+,	$,	--	--	0
+sagt	VVFIN	--	HD	503
+sie	PPER	--	SB	503
+.	$.	--	--	0
+#500	NP	--	OA	501
+#501	VP	--	OC	502
+#502	S	--	OC	503
+#503	S	--	--	0""",
+    # a coordination with a shared subject as secondary edge
+    """Er	PPER	--	SB	502	SB	503
+kam	VVFIN	--	HD	502
+und	KON	--	CD	504
+sah	VVFIN	--	HD	503
+.	$.	--	--	0
+#502	S	--	CJ	504
+#503	S	--	CJ	504
+#504	CS	--	--	0""",
+    # words attached to the virtual root only, with brackets
+    """(	$(	--	--	0
+Ja	ITJ	--	--	0
+)	$(	--	--	0""",
+    # an inner node with a secondary edge
+    """Sie	PPER	--	SB	502
+will	VMFIN	--	HD	502
+es	PPER	--	OA	500
+heute	ADV	--	MO	501
+tun	VVINF	--	HD	500
+#500	VP	--	OC	502	OC	501
+#501	VP	--	OC	502
+#502	S	--	--	0""",
+]
+
+
+def export_corpus(sentences, names=None, lemma=False):
+    # the sentences as a corpus in export format 3, or 4 with a lemma column
+    # (the lowercased word, or -- for inner nodes)
+    lines = ["#FORMAT %d" %(4 if lemma else 3)]
+    if lemma:
+        lines.append("%% word\tlemma\ttag\tmorph\tedge\tparent\tsecedge")
+    for (name, sentence) in zip(names or range(1, len(sentences) + 1), sentences):
+        lines.append("#BOS %s" %name)
+        for line in sentence.splitlines():
+            fields = line.split("\t")
+            if lemma:
+                fields.insert(1, "--" if fields[0].startswith("#") else fields[0].lower())
+            lines.append("\t".join(fields))
+        lines.append("#EOS %s" %name)
+    return "\n".join(lines) + "\n"
+
+
+def tree_signature(tree):
+    # a comparable representation of the nodes, tokens and edges in a tree
+    def token(node):
+        t = tree.node_token(node)
+        if t.type() == "CONSTITUENT-TERMINAL":
+            return (t.form(), t.pos(), t.edge(), t.lemma())
+        return (t.category(), t.edge())
+    nodes = sorted(tree.nodes())
+    signature = (tree.sent_label(), list(tree.root), list(tree.id_yield()), list(tree.full_yield()),
+                 [(node, token(node), list(tree.children(node))) for node in nodes])
+    if hasattr(tree, "sec_children"):
+        signature += ([(node, tree.sec_children(node), tree.sec_child_edge_labels(node), tree.sec_parents(node))
+                       for node in nodes],)
+    return signature
+
+
+@pytest.fixture
+def signature():
+    return tree_signature
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    # the sentences in export format 3
+    path = tmp_path / "corpus.export"
+    path.write_text(export_corpus(SENTENCES), encoding="utf-8")
+    return str(path)
+
+
+@pytest.fixture
+def lemma_corpus(tmp_path):
+    # the sentences in export format 4
+    path = tmp_path / "lemma.export"
+    path.write_text(export_corpus(SENTENCES, lemma=True), encoding="utf-8")
+    return str(path)
+
+
+@pytest.fixture
+def large_corpus(tmp_path):
+    # 25 sentences, enough for ten folds of different sizes
+    path = tmp_path / "large.export"
+    sentences = [SENTENCES[n % len(SENTENCES)] for n in range(25)]
+    path.write_text(export_corpus(sentences, names=range(1, 26), lemma=True), encoding="utf-8")
+    return str(path)
@@ -0,0 +1,74 @@
+# CompactHybridTree, the memoized spans of HybridTree and the statistics of
+# corpus_stats.py must agree with the dict-based trees and the former span
+# computation.
+
+import pytest
+
+from benchmarks import reference_spans
+from corpus_stats import statistics
+from panda.compact_tree import LabelTable, compact_trees
+from panda.monadic_tokens import new_constituent_terminal
+from panda.negra_parse import cached_packed_corpus, sentence_names_to_hybridtrees_fast
+
+
+@pytest.fixture(params=[True, False], ids=["disconnected", "connected"])
+def trees(request, large_corpus):
+    return sentence_names_to_hybridtrees_fast(None, large_corpus, disconnect_punctuation=request.param)
+
+
+def test_compact_tree(trees, signature):
+    labels = LabelTable()
+    compact = compact_trees(trees, labels)
+    assert labels.index("NP") < len(labels) and labels.labels.count("NP") == 1
+    for (tree, compact_tree) in zip(trees, compact):
+        assert signature(compact_tree) == signature(tree)
+        assert compact_tree.labelled_spans() == tree.labelled_spans()
+        assert (compact_tree.max_n_spans(), compact_tree.n_gaps()) == (tree.max_n_spans(), tree.n_gaps())
+        assert compact_tree.fringe(compact_tree.virtual_root) == tree.fringe(tree.virtual_root)
+        for node in tree.nodes():
+            assert compact_tree.parent(node) == tree.parent(node)
+            assert compact_tree.n_spans(node) == tree.n_spans(node)
+            assert compact_tree.in_ordering(node) == tree.in_ordering(node)
+
+
+def test_read_only_tokens(trees):
+    tree = compact_trees(trees[:1])[0]
+    token = tree.node_token(tree.root[0])
+    assert token is tree.node_token(tree.root[0])
+    with pytest.raises(TypeError):
+        token.set_category("NP")
+    with pytest.raises(TypeError):
+        token.set_edge_label("SB")
+    # the tokens of the dict-based tree are not shared
+    token = trees[0].node_token(trees[0].root[0])
+    token.set_edge_label("SB")
+    assert token.edge() == "SB" and trees[4].node_token(trees[4].root[0]).edge() == "--"
+
+
+def test_spans(trees):
+    for tree in trees:
+        assert (tree.labelled_spans(), tree.max_n_spans(), tree.n_gaps()) == reference_spans(tree)
+
+
+def test_spans_after_change(large_corpus):
+    # the memoized spans follow changes of the tree
+    [tree] = sentence_names_to_hybridtrees_fast(["1"], large_corpus)
+    assert tree.max_n_spans() == 2
+    tree.node_token("500").set_category("PP")
+    assert ["PP"] in [span[:1] for span in tree.labelled_spans()]
+    tree.add_node("110", new_constituent_terminal("heute", "ADV", "MO"), True, True)
+    tree.add_child("503", "110")
+    tree.reorder()
+    assert len(tree.fringe("503")) == 8 and tree.fringe("110") == [tree.node_index("110")]
+
+
+def test_statistics(large_corpus, tmp_path):
+    columns = statistics(cached_packed_corpus(large_corpus, cache_dir=str(tmp_path)))
+    trees = sentence_names_to_hybridtrees_fast(None, large_corpus)
+    assert list(columns["len"]) == [len(tree.full_yield()) for tree in trees]
+    assert list(columns["nodes"]) == [len(tree.nodes()) for tree in trees]
+    assert list(columns["fanout"]) == [reference_spans(tree)[1] for tree in trees]
+    assert list(columns["gaps"]) == [reference_spans(tree)[2] for tree in trees]
+    assert list(columns["nonprojective"]) == [sum(1 for node in tree.nodes() if tree.n_spans(node) > 1)
+                                              for tree in trees]
+    assert list(columns["fanout"])[:4] == [2, 1, 0, 2]
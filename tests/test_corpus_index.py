@@ -0,0 +1,77 @@
+# The offset index of export and .sent files and the scripts that look up
+# sentences by it.
+
+import os
+import subprocess
+import sys
+
+from conftest import SENTENCES, export_corpus
+from panda.corpus_index import INDEX_SUFFIX, SentenceIndex, export_tokens, index_is_current, sent_tokens, token_hash
+
+SCRIPTS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts")
+
+
+def test_export_index(corpus):
+    assert not index_is_current(corpus)
+    with SentenceIndex(corpus) as index:
+        assert index.names() == ["1", "2", "3", "4"]
+        sentence = index.sentence("2")
+        assert sentence.startswith("#BOS 2\n") and sentence.rstrip("\n").endswith("#EOS 2")
+        assert index.n_tokens("1") == 9
+        assert index.token_hash("3") == token_hash(["(", "Ja", ")"])
+        assert index.names_with_hash(token_hash(export_tokens(sentence.splitlines()[1:-1]))) == ["2"]
+    assert index_is_current(corpus)
+    # the sidecar is read instead of scanning the file again
+    with SentenceIndex(corpus) as index:
+        assert index.entry("4")[2] == 5
+
+
+def test_stale_index(corpus):
+    with SentenceIndex(corpus) as index:
+        assert "5" not in index
+    with open(corpus, "a", encoding="utf-8") as corpus_file:
+        corpus_file.write(export_corpus(SENTENCES[:1], names=["5"]).split("\n", 1)[1])
+    assert not index_is_current(corpus)
+    with SentenceIndex(corpus) as index:
+        assert index.names() == ["1", "2", "3", "4", "5"]
+        assert index.sentence("5").startswith("#BOS 5\n")
+
+
+def test_repeated_ids(tmp_path):
+    path = tmp_path / "repeated.export"
+    path.write_text(export_corpus(SENTENCES[:2] + SENTENCES[:1], names=["1", "2", "1"]), encoding="utf-8")
+    with SentenceIndex(str(path), persist=False) as index:
+        assert index.names() == ["1", "2"]
+        assert len(index.entries("1")) == 2 and index.entries("3") == []
+    assert not os.path.exists(str(path) + INDEX_SUFFIX)
+
+
+def test_sent_index(tmp_path):
+    path = tmp_path / "test.sent"
+    path.write_bytes(b"7\tJa/ITJ !/$.\r\n8\tEr/PPER kam/VVFIN\n")
+    with SentenceIndex(str(path)) as index:
+        assert index.names() == ["7", "8"]
+        assert index.sentence("7") == "7\tJa/ITJ !/$."
+        assert index.token_hash("8") == token_hash(sent_tokens("Er/PPER kam/VVFIN"))
+
+
+def run(script, argument, stdin):
+    return subprocess.run([sys.executable, os.path.join(SCRIPTS, script), argument], input=stdin,
+                          stdout=subprocess.PIPE, check=True, universal_newlines=True).stdout
+
+
+def test_fill_sentence_id(tmp_path):
+    path = tmp_path / "test.sent"
+    path.write_text("11\tJa/ITJ\n12\tEr/PPER kam/VVFIN\n13\tJa/ITJ\n")
+    trees = "#BOS 0\nJa\tITJ\t--\t--\t0\n#EOS 0\n" * 2 + "#BOS 0\nEr\tPPER\t--\t--\t0\nkam\tVVFIN\t--\t--\t0\n#EOS 0\n"
+    assert [line for line in run("fill_sentence_id.py", str(path), trees).splitlines() if line.startswith("#BOS")] \
+        == ["#BOS 11", "#BOS 13", "#BOS 12"]
+
+
+def test_fill_noparses(tmp_path):
+    path = tmp_path / "test.sent"
+    path.write_text("1\tJa/ITJ\n2\tEr/PPER kam/VVFIN\n3\tJa/ITJ\n")
+    # the sentences before a predicted tree are filled with NOPARSE trees
+    output = run("fill_noparses.py", str(path), "#BOS 3\nJa\tITJ\t--\t--\t0\n#EOS 3\n")
+    assert [line for line in output.splitlines() if line.startswith("#BOS")] == ["#BOS 1", "#BOS 2", "#BOS 3"]
+    assert output.count("NOPARSE") == 2 and "Er\tPPER\t--\t--\t500" in output
@@ -0,0 +1,118 @@
+# The counts and scores of evaluate.py: the evaluation parameters, the merged
+# counts of folds and the cache of counts. The comparison with `discodop eval`
+# itself is done by eval_parity.py, which needs disco-dop.
+
+import os
+import shutil
+
+import pytest
+
+from conftest import SENTENCES, export_corpus
+from evaluate import COUNTS, EvalCounts, cached_score_file, read_parameters, score_file, score_folds, scores, \
+    summary
+
+PARAMETERS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "templates",
+                          "discodop-eval.prm")
+
+
+@pytest.fixture
+def predictions(tmp_path):
+    # the sentences with a wrong label of the (continuous) NP of the first one
+    path = tmp_path / "predictions.export"
+    sentences = [SENTENCES[0].replace("#500\tNP", "#500\tPP")] + SENTENCES[1:]
+    path.write_text(export_corpus(sentences), encoding="utf-8")
+    return str(path)
+
+
+def parameters(tmp_path, *lines):
+    # the default parameters followed by some lines
+    path = tmp_path / "parameters.prm"
+    shutil.copy(PARAMETERS, str(path))
+    with open(path, "a", encoding="utf-8") as parameter_file:
+        parameter_file.write("\n" + "\n".join(lines) + "\n")
+    return str(path)
+
+
+def test_counts(corpus, predictions):
+    counts = score_file(corpus, predictions, read_parameters(PARAMETERS))
+    # punctuation and the brackets of words without inner nodes are deleted
+    assert sorted(counts.rows) == [3, 5, 9]
+    total = counts.totals()
+    assert (total["sentences"], total["gold"], total["cand"], total["matched"], total["exact"]) == (4, 10, 10, 9, 3)
+    # the deleted comma is a gap of the top S, like in disco-dop, whose positions are not renumbered either
+    assert (total["gold_disc"], total["cand_disc"]) == (3, 3)
+    assert (total["tags"], total["correct_tags"]) == (17, 17)
+    assert scores(total)["recall"] == "90.00" and scores(total)["exact"] == "75.00"
+    assert scores(score_file(corpus, corpus, read_parameters(PARAMETERS)).totals())["f-measure"] == "100.00"
+
+
+@pytest.mark.parametrize("lines, recall", [(["EQ_LABEL NP PP"], "100.00"),
+                                           (["LABELED 0"], "100.00"),
+                                           (["DISC_ONLY 1"], "100.00"),
+                                           (["DELETE_LABEL NP"], "100.00"),
+                                           (["DELETE_LABEL VP"], "85.71")])
+def test_parameters(corpus, predictions, tmp_path, lines, recall):
+    counts = score_file(corpus, predictions, read_parameters(parameters(tmp_path, *lines)))
+    assert scores(counts.totals())["recall"] == recall
+    if lines == ["DISC_ONLY 1"]:
+        assert counts.totals()["gold"] == 3
+
+
+def test_cutoff(corpus, predictions, tmp_path):
+    parameter_file = parameters(tmp_path, "CUTOFF_LEN 5")
+    counts = score_file(corpus, predictions, read_parameters(parameter_file))
+    lines = summary(counts, read_parameters(parameter_file)["CUTOFF_LEN"]).splitlines()
+    assert "Summary (<= 5)" in lines[0] and "Summary (ALL)" in lines[0]
+    [recall] = [line for line in lines if line.startswith("labeled recall")]
+    assert recall.split()[2:] == ["100.00", "labeled", "recall:", "90.00"]
+    assert "Summary (<= 5)" not in summary(counts, 9)
+
+
+def test_malformed_parameters(tmp_path):
+    with pytest.raises(ValueError, match="malformed line"):
+        read_parameters(parameters(tmp_path, "CUTOFF_LEN"))
+
+
+def test_folds(large_corpus, tmp_path):
+    # the merged counts of the folds are the counts of the whole corpus
+    text = open(large_corpus, encoding="utf-8").read()
+    (header, sentences) = (text[:text.index("#BOS")], ["#BOS" + block for block in text.split("#BOS")[1:]])
+    folds = []
+    for fold in range(3):
+        path = str(tmp_path / ("fold-%d.export" %fold))
+        with open(path, "w", encoding="utf-8") as fold_file:
+            fold_file.write(header + "".join(sentences[fold::3]))
+        folds.append((path, path))
+    parameters = read_parameters(PARAMETERS)
+    counts = score_folds(folds, parameters, workers=2)
+    assert counts.rows == score_file(large_corpus, large_corpus, parameters).rows
+    # stored and merged again
+    for (fold, (gold, predictions)) in enumerate(folds):
+        score_file(gold, predictions, parameters).write(str(tmp_path / ("counts-%d.tsv" %fold)))
+    merged = EvalCounts()
+    for fold in range(3):
+        merged.merge(EvalCounts.read(str(tmp_path / ("counts-%d.tsv" %fold))))
+    assert merged.rows == counts.rows
+
+
+def test_incomplete_counts(tmp_path):
+    path = tmp_path / "counts.tsv"
+    path.write_text("\t".join(["len"] + COUNTS) + "\n5\t1\t2\n")
+    with pytest.raises(ValueError):
+        EvalCounts.read(str(path))
+
+
+def test_cache(corpus, predictions, tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    counts = score_file(corpus, predictions, read_parameters(PARAMETERS))
+    assert cached_score_file(corpus, predictions, PARAMETERS, cache_dir).rows == counts.rows
+    [entry] = [os.path.join(cache_dir, name) for name in os.listdir(cache_dir)]
+    assert EvalCounts.read(entry).rows == counts.rows
+    # a corrupt entry is scored again
+    with open(entry, "w") as cache_file:
+        cache_file.write("len\tsentences\n5\n")
+    assert cached_score_file(corpus, predictions, PARAMETERS, cache_dir).rows == counts.rows
+    # other parameters are another entry, the least recently used one is removed from a full cache
+    cached_score_file(corpus, predictions, parameters(tmp_path, "DISC_ONLY 1"), cache_dir,
+                      max_size=os.path.getsize(entry))
+    assert len(os.listdir(cache_dir)) == 1 and not os.path.exists(entry)
@@ -0,0 +1,56 @@
+# Serialization of trees in export format must yield the same lines as the
+# former writer with quadratic id assignment.
+
+import io
+
+import pytest
+
+from benchmarks import reference_export
+from panda.general_hybrid_tree import HybridDag
+from panda.monadic_tokens import new_constituent_category, new_constituent_terminal
+from panda.negra_parse import serialize_hybridtrees_to_negra, sentence_names_to_hybridtrees_fast, \
+    sentence_names_to_hybridtrees_iter, write_hybridtree_to_negra, write_hybridtrees_to_negra
+
+
+def export(trees):
+    out = io.StringIO()
+    for tree in trees:
+        write_hybridtree_to_negra(tree, out)
+    return out.getvalue()
+
+
+@pytest.mark.parametrize("options", [{ "disconnect_punctuation": True },
+                                     { "disconnect_punctuation": False },
+                                     { "disconnect_punctuation": False, "secedge": True }])
+def test_export(lemma_corpus, options):
+    trees = sentence_names_to_hybridtrees_fast(None, lemma_corpus, **options)
+    assert export(trees) == reference_export(trees)
+
+
+def test_secondary_edges(corpus):
+    [tree] = sentence_names_to_hybridtrees_fast(["2"], corpus, secedge=True, disconnect_punctuation=False)
+    assert export([tree]).splitlines()[0] == "Er\tPPER\t--\tSB\t500\tSB\t501"
+
+
+def test_leaf_with_secondary_parent_only():
+    dag = HybridDag("7")
+    dag.add_node("500", new_constituent_category("S"), False, True)
+    dag.add_to_root("500")
+    dag.add_node("101", new_constituent_terminal("Ja", "ITJ"), True, True)
+    dag.add_sec_child("500", "101", "SB")
+    dag.reorder()
+    with pytest.raises(ValueError, match="leaf 101 of sentence 7"):
+        export([dag])
+
+
+@pytest.mark.parametrize("mode", ["w", "wb"])
+def test_stream(large_corpus, tmp_path, mode):
+    trees = sentence_names_to_hybridtrees_fast(None, large_corpus)
+    lines = serialize_hybridtrees_to_negra(trees, 1, 8)
+    expected = "".join(line if line.endswith("\n") else line + "\n" for line in lines)
+    path = tmp_path / "stream.export"
+    with open(path, mode) as out:
+        counter = write_hybridtrees_to_negra(sentence_names_to_hybridtrees_iter(None, large_corpus), out, length=8,
+                                             buffer_size=100)
+    assert path.read_text(encoding="utf-8") == expected
+    assert counter == 1 + sum(1 for line in lines if line.startswith("#BOS"))
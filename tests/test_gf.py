@@ -0,0 +1,91 @@
+# The conversion of GF's dot output to export lines must yield the same lines
+# as the former converter that built and rebuilt a HybridTree.
+
+import io
+
+import pytest
+
+from benchmarks import reference_gfdot_to_negra
+from gf_parse import gf_output
+from parse_gf_output import gfdot_to_export_lines, gfdot_to_negra, write_parse
+
+# "Haus hat gekauft ." with a discontinuous VP and punctuation below the root,
+# in the layout of GF's vp command (gf_parse.py strips the lines)
+GRAPH = [line.strip() for line in """graph {
+  node[shape=plaintext]
+
+  subgraph {rank=same;
+    n0[label="VROOT1"]
+  }
+  subgraph {rank=same;
+    n1[label="S"]
+    n7[label="PUNCT"]
+  }
+  n0 -- n1 [style = "solid"]
+  n0 -- n7 [style = "solid"]
+  subgraph {rank=same;
+    n2[label="VP"]
+    n3[label="VAFIN"]
+  }
+  n1 -- n2 [style = "solid"]
+  n1 -- n3 [style = "solid"]
+  subgraph {rank=same;
+    n4[label="NN"]
+    n5[label="VVPP"]
+  }
+  n2 -- n4 [style = "solid"]
+  n2 -- n5 [style = "solid"]
+  subgraph {rank=same;
+    edge[style=invis]
+    n100000[label="Haus"]
+    n100001[label="hat"]
+    n100002[label="gekauft"]
+    n100003[label="PUNCT"]
+  }
+  n4 -- n100000 [style = "dashed"]
+  n3 -- n100001 [style = "dashed"]
+  n5 -- n100002 [style = "dashed"]
+  n7 -- n100003 [style = "dashed"]
+}""".splitlines()]
+
+
+def convert(f, graph):
+    out = io.StringIO()
+    f(graph, out)
+    return out.getvalue()
+
+
+@pytest.mark.parametrize("graph", [GRAPH,
+                                   # a single word below the root
+                                   ['n0[label="VROOT1"]', 'n1[label="ITJ"]', 'n0 -- n1 [style = "solid"]',
+                                    'n100000[label="Ja"]', 'n1 -- n100000 [style = "dashed"]'],
+                                   []])
+def test_gfdot_to_negra(graph):
+    assert convert(gfdot_to_negra, graph) == convert(reference_gfdot_to_negra, graph)
+
+
+def test_export_lines():
+    # the ids of the inner nodes count down in pre-order
+    assert list(gfdot_to_export_lines(GRAPH)) == ["Haus\tNN\t--\t--\t500",
+                                                  "hat\tVAFIN\t--\t--\t501",
+                                                  "gekauft\tVVPP\t--\t--\t500",
+                                                  "PUNCT\tPUNCT\t--\t--\t502",
+                                                  "#500\tVP\t--\t--\t501",
+                                                  "#501\tS\t--\t--\t502",
+                                                  "#502\tVROOT1\t--\t--\t0"]
+
+
+def test_write_parse():
+    (out, err) = (io.StringIO(), io.StringIO())
+    write_parse(GRAPH, "12", [("Haus", "NN")] * 4, "7", out, err)
+    write_parse(None, "30000", [("Ja", "ITJ")], "8", out, err)
+    assert out.getvalue().startswith("#BOS 7\nHaus\tNN\t--\t--\t500\n")
+    assert out.getvalue().endswith("#BOS 8\nJa\tITJ\t--\t--\t500\n#500\tNOPARSE\t--\t--\t0\n#EOS 8\n")
+    assert err.getvalue() == "4\t12\t1\n1\t30000\t0\n"
+
+
+def test_gf_output():
+    # the lines that parse_gf_output.py reads for a parse tree, a failure and a timeout
+    assert gf_output((["graph {", "}"], None, 12), "30") == ["graph {%;;%}", "12 msec"]
+    assert gf_output((None, "The parser failed at token 2", 3), "30") == ["The parser failed at token 2", "3 msec"]
+    assert gf_output(None, "30") == ["TIMEOUT>", "30000 msec"]
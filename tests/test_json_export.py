@@ -0,0 +1,67 @@
+# The streamed JSON lines and the binary layout of bihypergraph_file must hold
+# the same bihypergraphs as export_corpus_to_json.
+
+import json
+
+import pytest
+
+from panda.bihypergraph_file import BihypergraphCorpus
+from panda.negra_parse import export_corpus_to_json, sentence_names_to_hybridtrees_fast, write_corpus_to_binary, \
+    write_corpus_to_json_lines
+
+
+class Labels:
+    def __init__(self):
+        self.index = {}
+
+    def object_index(self, label):
+        return self.index.setdefault(label, len(self.index))
+
+
+class Labeling:
+    def token_tree_label(self, token):
+        return token.pos() if token.type() == "CONSTITUENT-TERMINAL" else token.category()
+
+    def token_label(self, token):
+        return token.form()
+
+
+@pytest.fixture
+def dags(corpus):
+    return sentence_names_to_hybridtrees_fast(None, corpus, secedge=True, disconnect_punctuation=False)
+
+
+@pytest.fixture
+def expected(dags):
+    labels = Labels()
+    # a round trip through JSON, like the file of the former exporter
+    return (json.loads(json.dumps(export_corpus_to_json(dags, labels, Labeling()))), labels.index)
+
+
+def test_json_lines(dags, expected, tmp_path):
+    labels = Labels()
+    with open(tmp_path / "corpus.jsonl", "w") as out:
+        write_corpus_to_json_lines(dags, labels, out, Labeling())
+    with open(tmp_path / "corpus.jsonl") as lines:
+        header = json.loads(next(lines))
+        streamed = [json.loads(line) for line in lines]
+    assert labels.index == expected[1]
+    assert header == { key: expected[0][key] for key in header } and "corpus" not in header
+    assert streamed == expected[0]["corpus"] and len(streamed) == 4
+
+
+def test_binary(dags, expected, tmp_path):
+    labels = Labels()
+    write_corpus_to_binary(dags, labels, str(tmp_path / "corpus.bin"), Labeling())
+    assert labels.index == expected[1]
+    packed = BihypergraphCorpus(str(tmp_path / "corpus.bin"))
+    assert list(packed.bihypergraphs()) == expected[0]["corpus"]
+    assert (packed.alignment_label, packed.nonterminal_edge_label) \
+        == (expected[0]["alignmentLabel"], expected[0]["nonterminalEdgeLabel"])
+
+
+def test_secondary_edges(dags, expected):
+    # one hyperedge for each node, the nodes with a secondary parent have a second one
+    assert [len(graph["G1"]["edges"]) for graph in expected[0]["corpus"]] \
+        == [len(dag.nodes()) + sum(1 for node in dag.nodes() if dag.sec_parents(node)) for dag in dags] \
+        == [13, 9, 3, 9]
@@ -0,0 +1,122 @@
+# The hand-written parser of export files, its lazy, indexed, parallel and
+# cached variants must yield the same trees as the regular expression based
+# parser sentence_names_to_hybridtrees.
+
+import os
+
+import pytest
+
+from conftest import SENTENCES, export_corpus
+from panda.negra_parse import cached_packed_corpus, corpus_cache_key, sentence_names_to_hybridtrees, \
+    sentence_names_to_hybridtrees_cached, sentence_names_to_hybridtrees_fast, sentence_names_to_hybridtrees_iter, \
+    sentence_names_to_hybridtrees_parallel
+
+NAMES = ["1", "2", "3", "4"]
+OPTIONS = [{ "disconnect_punctuation": True },
+           { "disconnect_punctuation": False },
+           { "disconnect_punctuation": False, "add_vroot": True },
+           { "disconnect_punctuation": False, "secedge": True }]
+
+
+@pytest.mark.parametrize("options", OPTIONS)
+@pytest.mark.parametrize("fixture, mode", [("corpus", "STANDARD"), ("lemma_corpus", "DISCO-DOP")])
+def test_fast_parser(request, signature, fixture, mode, options):
+    path = request.getfixturevalue(fixture)
+    reference = sentence_names_to_hybridtrees(NAMES, path, mode=mode, **options)
+    trees = sentence_names_to_hybridtrees_fast(NAMES, path, mode=mode, **options)
+    assert len(reference) == len(trees) == 4
+    assert [signature(tree) for tree in reference] == [signature(tree) for tree in trees]
+
+
+def test_discodop_header(lemma_corpus, signature):
+    # the %% line switches to DISCO-DOP mode regardless of the mode argument
+    trees = sentence_names_to_hybridtrees_fast(None, lemma_corpus, mode="STANDARD")
+    assert trees[0].node_token(trees[0].id_yield()[0]).pos() == "ART"
+    assert [signature(tree) for tree in trees] \
+        == [signature(tree) for tree in sentence_names_to_hybridtrees(NAMES, lemma_corpus, mode="STANDARD")]
+
+
+def test_secondary_edges(corpus):
+    [coordination, vp] = sentence_names_to_hybridtrees_fast(["2", "4"], corpus, secedge=True,
+                                                            disconnect_punctuation=False)
+    subject = coordination.id_yield()[0]
+    assert coordination.sec_parents(subject) == ["503"]
+    assert coordination.sec_children("503") == [subject]
+    assert coordination.sec_child_edge_labels("503") == ["SB"]
+    assert vp.sec_parents("500") == ["501"]
+    # without secedge, the secondary edges are ignored
+    [tree] = sentence_names_to_hybridtrees_fast(["2"], corpus)
+    assert not hasattr(tree, "sec_children")
+    assert tree.parent(tree.id_yield()[0]) == "502"
+
+
+def test_disconnected_punctuation(corpus):
+    [tree] = sentence_names_to_hybridtrees_fast(["1"], corpus)
+    words = [tree.node_token(node).form() for node in tree.full_yield()]
+    assert words == ["Das", "Haus", "hat", "er", "gekauft", ",", "sagt", "sie", "."]
+    assert [tree.node_token(node).form() for node in tree.id_yield()] == \
+        ["Das", "Haus", "hat", "er", "gekauft", "sagt", "sie"]
+    assert tree.root == ["503"]
+    [tree] = sentence_names_to_hybridtrees_fast(["3"], corpus)
+    assert list(tree.id_yield()) == [] and len(tree.full_yield()) == 3
+    [tree] = sentence_names_to_hybridtrees_fast(["3"], corpus, disconnect_punctuation=False)
+    assert len(tree.root) == 3 and len(tree.id_yield()) == 3
+
+
+@pytest.mark.parametrize("line", ["Haus\tNN\t--\tNK",                  # too few fields
+                                  "Haus\tNN\t--\tNK\tfive",            # parent is not a number
+                                  "Haus\tNN\t--\tNK\t500\tSB",         # incomplete secondary edge
+                                  "Haus\tNN\t--\tNK\t500\tSB\tx",      # secondary parent is not a number
+                                  "#5x\tNP\t--\tOA\t501"])              # inner node id is not a number
+def test_malformed_fields(tmp_path, signature, line):
+    # malformed lines are skipped or read as words in the same way by both parsers
+    sentence = SENTENCES[0].replace("Haus\tNN\t--\tNK\t500", line)
+    path = tmp_path / "malformed.export"
+    path.write_text(export_corpus([sentence, SENTENCES[1]]), encoding="utf-8")
+    for options in OPTIONS:
+        reference = sentence_names_to_hybridtrees(["1", "2"], str(path), **options)
+        trees = sentence_names_to_hybridtrees_fast(["1", "2"], str(path), **options)
+        assert [signature(tree) for tree in reference] == [signature(tree) for tree in trees]
+
+
+def test_names(tmp_path, signature):
+    # only the requested sentences in the order of the corpus, including repeated ids, with and without index
+    path = tmp_path / "repeated.export"
+    path.write_text(export_corpus(SENTENCES + SENTENCES[:1], names=["1", "2", "3", "4", "2"]), encoding="utf-8")
+    reference = [signature(tree) for tree in sentence_names_to_hybridtrees(["4", "2"], str(path))]
+    assert [label for (label, *_) in reference] == ["2", "4", "2"]
+    for use_index in [False, True]:
+        trees = sentence_names_to_hybridtrees_fast(["4", "2"], str(path), use_index=use_index)
+        assert [signature(tree) for tree in trees] == reference
+    assert list(sentence_names_to_hybridtrees_iter([], str(path))) == []
+
+
+def test_parallel(large_corpus, signature):
+    reference = [signature(tree) for tree in sentence_names_to_hybridtrees_fast(None, large_corpus)]
+    for workers in [1, 3]:
+        trees = sentence_names_to_hybridtrees_parallel(None, large_corpus, workers=workers)
+        assert len(trees) == 25
+        assert [signature(tree) for tree in trees] == reference
+        assert signature(trees[-1]) == reference[-1]
+
+
+def test_cache(large_corpus, tmp_path, signature):
+    cache_dir = str(tmp_path / "cache")
+    reference = [signature(tree) for tree in sentence_names_to_hybridtrees_fast(None, large_corpus)]
+    for _ in range(2):
+        trees = sentence_names_to_hybridtrees_cached(None, large_corpus, cache_dir=cache_dir)
+        assert [signature(tree) for tree in trees] == reference
+    [cache_file] = os.listdir(cache_dir)
+    assert corpus_cache_key(large_corpus) in cache_file
+
+
+def test_truncated_cache(large_corpus, tmp_path, signature):
+    # a truncated cache file is rebuilt
+    cache_dir = str(tmp_path / "cache")
+    cached_packed_corpus(large_corpus, cache_dir=cache_dir)
+    [cache_file] = [os.path.join(cache_dir, name) for name in os.listdir(cache_dir)]
+    with open(cache_file, "r+b") as cache:
+        cache.truncate(os.path.getsize(cache_file) // 2)
+    trees = sentence_names_to_hybridtrees_cached(None, large_corpus, cache_dir=cache_dir)
+    assert [signature(tree) for tree in trees] \
+        == [signature(tree) for tree in sentence_names_to_hybridtrees_fast(None, large_corpus)]
@@ -0,0 +1,42 @@
+# The ten-fold split of tfcv.py must write the same files as the former
+# implementation that post-processed each tree once per fold.
+
+import os
+
+import pytest
+
+from benchmarks import reference_tfcv
+from tfcv import count_trees, export_blocks, fix_bos, remove_snd_col, split_corpus
+
+
+def split(path, prefix, max_length, post_proc):
+    with open(path) as corpus_file:
+        n_trees = count_trees(corpus_file)
+        corpus_file.seek(0)
+        split_corpus(export_blocks(corpus_file), n_trees, "4", prefix, max_length, post_proc)
+
+
+@pytest.mark.parametrize("max_length", [1000, 5])
+@pytest.mark.parametrize("post_proc", [fix_bos, lambda tree: remove_snd_col(fix_bos(tree))])
+def test_split_corpus(large_corpus, tmp_path, max_length, post_proc):
+    (reference_dir, new_dir) = (tmp_path / "reference", tmp_path / "new")
+    reference_dir.mkdir()
+    new_dir.mkdir()
+    reference_tfcv(large_corpus, str(reference_dir) + "/", max_length, post_proc)
+    split(large_corpus, str(new_dir) + "/", max_length, post_proc)
+    names = sorted(os.listdir(reference_dir))
+    assert len(names) == 40 and names == sorted(os.listdir(new_dir))
+    for name in names:
+        assert (reference_dir / name).read_bytes() == (new_dir / name).read_bytes(), name
+
+
+def test_folds(large_corpus, tmp_path):
+    split(large_corpus, str(tmp_path) + "/", 1000, fix_bos)
+    test_ids = []
+    for fold in range(10):
+        with open(tmp_path / ("test-%d.sent" %fold)) as test, open(tmp_path / ("train-%d.sent" %fold)) as train:
+            ids = [line.split("\t")[0] for line in test]
+            assert not set(ids) & set(line.split("\t")[0] for line in train)
+            test_ids += ids
+    assert test_ids == [str(n) for n in range(1, 26)]
+    assert (tmp_path / "test-0.sent").read_text().startswith("1\tDas/ART Haus/NN hat/VAFIN")
@@ -0,0 +1,49 @@
+# Slot-based tokens with interned strings, memoized digests of trees and the
+# topological order of DAGs.
+
+import pytest
+
+from panda.general_hybrid_tree import group_identical_trees
+from panda.monadic_tokens import ConstituentCategory, new_constituent_category, new_constituent_terminal
+from panda.negra_parse import sentence_names_to_hybridtrees_fast
+
+
+def test_interned_strings():
+    (a, b) = (new_constituent_terminal("".join(["Ha", "us"]), "NN"), new_constituent_terminal("Haus", "NN"))
+    assert a is not b and a.form() is b.form() and a.pos() is b.pos()
+    (a, b) = (new_constituent_category("".join(["N", "P"]), "OA"), new_constituent_category("NP", "OA"))
+    assert a is not b and a.category() is b.category() and a.edge() is b.edge()
+    with pytest.raises(AttributeError):
+        a.attribute = 1
+
+
+def test_identity_equality():
+    # tokens compare by identity, so nodes with equal tokens are still told apart
+    a = ConstituentCategory("NP")
+    assert a == a and a != ConstituentCategory("NP") and a.fields() == ConstituentCategory("NP").fields()
+
+
+def test_digests(large_corpus):
+    trees = sentence_names_to_hybridtrees_fast(None, large_corpus)
+    groups = sorted(group_identical_trees(trees + sentence_names_to_hybridtrees_fast(None, large_corpus)))
+    # the four sentences are repeated with other ids in both copies of the corpus
+    assert len(groups) == 4 and sorted(len(group) for group in groups) == [12, 12, 12, 14]
+    assert trees[0] == trees[4] and trees[0] != trees[1]
+    # a changed token changes the digest
+    trees[4].node_token("500").set_category("PP")
+    assert trees[0] != trees[4]
+    assert len(group_identical_trees(trees)) == 5
+
+
+def test_topological_order(corpus):
+    dags = sentence_names_to_hybridtrees_fast(None, corpus, secedge=True, disconnect_punctuation=False)
+    for dag in dags:
+        order = dag.topological_order()
+        assert sorted(order) == sorted(dag.nodes())
+        position = { node: index for (index, node) in enumerate(order) }
+        for node in dag.nodes():
+            assert all(position[child] < position[node] for child in dag.children(node) + dag.sec_children(node))
+    # a cycle of secondary edges has no topological order
+    dag = dags[3]
+    dag.add_sec_child("500", "502", "OC")
+    assert dag.topological_order() is None